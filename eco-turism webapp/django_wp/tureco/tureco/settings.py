@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from logging.handlers import RotatingFileHandler
 import os
+import sys
 import logging
 from dotenv import load_dotenv
 
@@ -93,9 +94,12 @@ DATABASES = {
         'HOST': os.getenv('DATABASE_HOST', ''),
         'PORT': os.getenv('DATABASE_PORT', ''),
         'CONN_MAX_AGE': 600 if DATABASE_ENGINE != 'django.db.backends.sqlite3' else 0,
-        'OPTIONS': {} if DATABASE_ENGINE == 'django.db.backends.sqlite3' else {
+        # SQLite: bookings start their transactions with the write lock and wait for it
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20} if DATABASE_ENGINE == 'django.db.backends.sqlite3' else {
             'connect_timeout': 10,
         },
+        # A file, as threads of the booking concurrency tests cannot share an in-memory SQLite database
+        'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')} if DATABASE_ENGINE == 'django.db.backends.sqlite3' else {},
     }
 }
 
@@ -234,11 +238,13 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@tureco.com')
 SERVER_EMAIL = os.getenv('SERVER_EMAIL', 'server@tureco.com')
 
-# Cache Configuration (for production with Redis)
-if not DEBUG:
+# Cache Configuration (for production with Redis, tests keep a local cache)
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
+if not DEBUG and not TESTING:
     CACHES = {
         'default': {
-            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'BACKEND': 'django_redis.cache.RedisCache',
             'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
             'OPTIONS': {
                 'CLIENT_CLASS': 'django_redis.client.DefaultClient',
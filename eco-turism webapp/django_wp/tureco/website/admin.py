@@ -3,7 +3,7 @@ from .models import (
     User as CustomerUser,
     Account, Address,
     Hotel, Room, TransportationTrip, 
-    RoomBooking, TripBooking, Review
+    RoomBooking, TripBooking, Review, RoomInventory
 )
 
 class AddressInline(admin.TabularInline):
@@ -86,6 +86,20 @@ class TripBookingAdmin(admin.ModelAdmin):
     autocomplete_fields = ("user", "trip")
     readonly_fields = ("created_at",)
 
+@admin.register(RoomInventory)
+class RoomInventoryAdmin(admin.ModelAdmin):
+    # Maintained from bookings, so read-only here
+    list_display = ("room", "night", "booked")
+    list_filter = ("night", "room__hotel")
+    search_fields = ("room__name", "room__hotel__name")
+    date_hierarchy = "night"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # -------- Optional: Admin branding --------
 admin.site.site_header = "Booking Admin"
 admin.site.site_title = "Booking Admin"
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WebsiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'website'
+
+    def ready(self):
+        # Keeps the room inventory in step with bookings
+        from . import signals
@@ -0,0 +1,109 @@
+"""
+Booking engine.
+
+Rooms and seats are reserved in the same transaction as the booking row, so
+parallel requests can neither oversell a room type or trip nor leave a
+reservation without its booking. Booking numbers come from a shared
+sequence instead of being drawn at random.
+"""
+import logging
+import threading
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import inventory
+from .models import BookingSequence, Room, RoomBooking, TransportationTrip, TripBooking
+
+logger = logging.getLogger(__name__)
+
+# Booking numbers each process takes from the sequence at a time
+NUMBER_BLOCK_SIZE = 20
+
+
+class SoldOut(Exception):
+    """Fewer rooms or seats are left than were asked for"""
+
+    def __init__(self, available: int):
+        super().__init__(f"only {available} left")
+        self.available = available
+
+
+class BookingNumbers:
+    """
+    Hands out unique booking numbers from blocks reserved in BookingSequence.
+    A block is claimed with one UPDATE in its own transaction, so processes
+    never share numbers; numbers of a block a process does not use up are
+    skipped.
+    """
+
+    def __init__(self, block_size: int = NUMBER_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def next(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._claim_block()
+            number = self._next
+            self._next += 1
+            return number
+
+    def _claim_block(self):
+        BookingSequence.objects.get_or_create(pk=1)
+        with transaction.atomic():
+            # The row stays locked until commit, the read sees our own update
+            BookingSequence.objects.filter(pk=1).update(last=F('last') + self.block_size)
+            last = BookingSequence.objects.values_list('last', flat=True).get(pk=1)
+        return last - self.block_size + 1, last + 1
+
+
+booking_numbers = BookingNumbers()
+
+
+def book_room(room_type: Room, check_in: date, check_out: date, rooms: int, **details) -> RoomBooking:
+    """
+    Book `rooms` of a room type for a stay, or raise SoldOut.
+    `details` are the remaining RoomBooking fields (user, guest contact).
+    """
+    # An empty or reversed stay has no nights to reserve, nothing is free for it
+    if check_out <= check_in:
+        raise SoldOut(0)
+    # Claimed before the booking transaction, a rollback must not hand it out twice
+    booking_nr = booking_numbers.next()
+    with transaction.atomic():
+        reserved = inventory.reserve(room_type, check_in, check_out, rooms)
+        if reserved:
+            booking = RoomBooking(
+                room_type=room_type, check_in=check_in, check_out=check_out,
+                room_booked=rooms, booking_nr=booking_nr, **details
+            )
+            # Tells the inventory signal the nights are already taken
+            booking._nights_reserved = True
+            booking.save()
+        else:
+            # Undo the nights that did have room
+            transaction.set_rollback(True)
+    if not reserved:
+        raise SoldOut(inventory.rooms_available(room_type, check_in, check_out))
+    logger.info(f"Room booking {booking_nr}: {rooms} x {room_type.pk} from {check_in} to {check_out}")
+    return booking
+
+
+def book_trip(trip: TransportationTrip, seats: int, **details) -> TripBooking:
+    """
+    Book `seats` on a trip, or raise SoldOut.
+    Bookings of the same trip queue on a lock of its row while seats are counted.
+    """
+    booking_nr = booking_numbers.next()
+    with transaction.atomic():
+        trip = TransportationTrip.objects.select_for_update().get(pk=trip.pk)
+        booked = TripBooking.objects.filter(trip=trip).aggregate(total=Sum('seats_booked'))['total'] or 0
+        available = max(trip.total_seats - booked, 0)
+        if seats > available:
+            raise SoldOut(available)
+        booking = TripBooking.objects.create(trip=trip, seats_booked=seats, booking_nr=booking_nr, **details)
+    logger.info(f"Trip booking {booking_nr}: {seats} seat(s) on trip {trip.pk}")
+    return booking
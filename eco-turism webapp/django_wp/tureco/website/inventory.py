@@ -0,0 +1,81 @@
+"""
+Per-night room inventory.
+
+Every RoomBooking adds its room count to one RoomInventory row per night of
+the stay, so availability for a date range is read from at most one row per
+night instead of summing all overlapping bookings.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Room, RoomInventory
+
+
+def nights(check_in: date, check_out: date) -> list:
+    """The nights of a stay, check-out day excluded"""
+    return [check_in + timedelta(days=i) for i in range((check_out - check_in).days)]
+
+def add_booking(room_id: int, check_in: date, check_out: date, rooms: int) -> None:
+    """Count `rooms` as booked on every night from check_in to check_out"""
+    with transaction.atomic():
+        RoomInventory.objects.bulk_create(
+            [RoomInventory(room_id=room_id, night=night) for night in nights(check_in, check_out)],
+            ignore_conflicts=True,
+        )
+        RoomInventory.objects.filter(
+            room_id=room_id, night__gte=check_in, night__lt=check_out
+        ).update(booked=F('booked') + rooms)
+
+def reserve(room_type: Room, check_in: date, check_out: date, rooms: int) -> bool:
+    """
+    Take `rooms` on every night of the stay if all of them have that many free.
+    The check and the update are one conditional UPDATE per call, so concurrent
+    reservations can never oversell a night. Must run inside a transaction,
+    which is rolled back by the caller when this returns False.
+    """
+    stay = nights(check_in, check_out)
+    if not stay:
+        return False
+    RoomInventory.objects.bulk_create(
+        [RoomInventory(room_id=room_type.pk, night=night) for night in stay],
+        ignore_conflicts=True,
+    )
+    updated = RoomInventory.objects.filter(
+        room_id=room_type.pk, night__gte=check_in, night__lt=check_out,
+        booked__lte=room_type.total_rooms - rooms,
+    ).update(booked=F('booked') + rooms)
+    return updated == len(stay)
+
+def remove_booking(room_id: int, check_in: date, check_out: date, rooms: int) -> None:
+    """Give back `rooms` on every night from check_in to check_out"""
+    RoomInventory.objects.filter(
+        room_id=room_id, night__gte=check_in, night__lt=check_out
+    ).update(booked=Greatest(F('booked') - rooms, 0))
+
+def booked_rooms(start: date, end: date):
+    """
+    Subquery: most rooms of the outer room type booked on a single night from start to end.
+    """
+    return Subquery(
+        RoomInventory.objects.filter(room=OuterRef('pk'), night__gte=start, night__lt=end)
+            .values('room')
+            .annotate(most=Max('booked'))
+            .values('most')
+    )
+
+def with_rooms_available(rooms, start: date, end: date):
+    """Annotate room types with `available`, the rooms free on every night of the stay"""
+    return rooms.annotate(
+        available=Greatest(F('total_rooms') - Coalesce(booked_rooms(start, end), 0), 0)
+    )
+
+def rooms_available(room_type: Room, start: date, end: date) -> int:
+    if end <= start:
+        return 0
+    booked = RoomInventory.objects.filter(
+        room=room_type, night__gte=start, night__lt=end
+    ).aggregate(most=Max('booked'))['most'] or 0
+    return max(room_type.total_rooms - booked, 0)
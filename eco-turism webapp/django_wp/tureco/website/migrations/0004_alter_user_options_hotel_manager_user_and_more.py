@@ -0,0 +1,93 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0003_review_parent_review_staff_user'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='user',
+            options={'verbose_name': 'User', 'verbose_name_plural': 'Users'},
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='manager_user',
+            field=models.ForeignKey(blank=True, limit_choices_to={'user_role': 'hotel_manager'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='managed_hotels', to='website.user'),
+        ),
+        migrations.AddField(
+            model_name='roombooking',
+            name='booking_nr',
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='roombooking',
+            name='guest_email',
+            field=models.EmailField(blank=True, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='roombooking',
+            name='guest_name',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='roombooking',
+            name='guest_phone',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='roombooking',
+            name='is_guest',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='transportationtrip',
+            name='manager_user',
+            field=models.ForeignKey(blank=True, limit_choices_to={'user_role': 'transport_manager'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='managed_trips', to='website.user'),
+        ),
+        migrations.AddField(
+            model_name='tripbooking',
+            name='booking_nr',
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='tripbooking',
+            name='guest_email',
+            field=models.EmailField(blank=True, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='tripbooking',
+            name='guest_name',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='tripbooking',
+            name='guest_phone',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='tripbooking',
+            name='is_guest',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='user_role',
+            field=models.CharField(choices=[('customer', 'Customer'), ('hotel_manager', 'Hotel Manager'), ('transport_manager', 'Transport Manager')], default='customer', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='roombooking',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='website.user'),
+        ),
+        migrations.AlterField(
+            model_name='tripbooking',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='website.user'),
+        ),
+    ]
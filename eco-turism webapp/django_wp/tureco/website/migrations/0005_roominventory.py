@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0004_alter_user_options_hotel_manager_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory', to='website.room')),
+            ],
+            options={
+                'verbose_name_plural': 'Room inventory',
+                'constraints': [models.UniqueConstraint(fields=('room', 'night'), name='unique_room_night')],
+            },
+        ),
+    ]
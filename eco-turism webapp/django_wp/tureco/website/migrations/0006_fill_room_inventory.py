@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:14
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import migrations
+
+
+def fill_inventory(apps, schema_editor):
+    RoomBooking = apps.get_model('website', 'RoomBooking')
+    RoomInventory = apps.get_model('website', 'RoomInventory')
+
+    booked = Counter()
+    for room_id, check_in, check_out, rooms in RoomBooking.objects.values_list(
+        'room_type_id', 'check_in', 'check_out', 'room_booked'
+    ).iterator():
+        for i in range((check_out - check_in).days):
+            booked[room_id, check_in + timedelta(days=i)] += rooms
+
+    RoomInventory.objects.bulk_create(
+        (RoomInventory(room_id=room_id, night=night, booked=count) for (room_id, night), count in booked.items()),
+        batch_size=1000,
+    )
+
+
+def clear_inventory(apps, schema_editor):
+    apps.get_model('website', 'RoomInventory').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0005_roominventory'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_inventory, clear_inventory),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0006_fill_room_inventory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last', models.PositiveBigIntegerField(default=99999)),
+            ],
+        ),
+    ]
@@ -92,6 +92,21 @@ class Room(models.Model):
     def __str__(self):
         return f"{self.name} @ {self.hotel.name}"
 
+class RoomInventory(models.Model):
+    """Rooms of a type booked on one night, kept in step with RoomBooking"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='inventory')
+    night = models.DateField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Room inventory"
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'night'], name='unique_room_night'),
+        ]
+
+    def __str__(self):
+        return f"{self.room.name} on {self.night}: {self.booked} booked"
+
 class Review(models.Model):
     account_id = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True, blank=True)
     comment = models.TextField(max_length=1000, blank=True, null=True)
@@ -153,3 +168,8 @@ class TripBooking(models.Model):
         if self.is_guest:
             return f"Guest Trip Booking #{self.id} by {self.guest_name or 'Guest'}"
         return f"Trip Booking #{self.id} by {self.user.email if self.user else 'Unknown'}"
+
+class BookingSequence(models.Model):
+    """Last booking number handed out, shared by room and trip bookings"""
+    # Numbers up to 99999 were drawn at random before the sequence existed
+    last = models.PositiveBigIntegerField(default=99999)
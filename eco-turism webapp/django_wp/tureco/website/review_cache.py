@@ -0,0 +1,58 @@
+"""
+Cached review parts of the hotel detail page.
+
+The rating summary and the rendered review list of a hotel are kept in the
+default cache until a review of that hotel is added, edited, replied to or
+deleted. The review list is cached as seen by visitors; moderators get it
+rendered live with their edit, delete and reply forms.
+"""
+from django.core.cache import cache
+from django.db.models import Avg, Prefetch
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Hotel, Review
+
+# Upper bound for entries whose invalidation was missed (e.g. admin edits)
+CACHE_TIMEOUT = 60 * 60
+
+
+def _ratings_key(hotel_id: int) -> str:
+    return f"hotel:{hotel_id}:ratings"
+
+def _reviews_key(hotel_id: int) -> str:
+    return f"hotel:{hotel_id}:reviews"
+
+def top_level_reviews(hotel: Hotel):
+    """Reviews of a hotel with their replies, in three queries whatever their number"""
+    return hotel.reviews.filter(parent__isnull=True).select_related(
+        "account_id", "staff_user"
+    ).prefetch_related(
+        Prefetch("replies", queryset=Review.objects.select_related("account_id", "staff_user"))
+    )
+
+def rating_summary(hotel: Hotel) -> dict:
+    """`avg_rating` and `eco_avg_rating` of the hotel's reviews, rounded to one decimal"""
+    summary = cache.get(_ratings_key(hotel.pk))
+    if summary is None:
+        averages = hotel.reviews.filter(parent__isnull=True).aggregate(
+            avg_rating=Avg("rating"), eco_avg_rating=Avg("eco_rating")
+        )
+        summary = {name: round(value or 0, 1) for name, value in averages.items()}
+        cache.set(_ratings_key(hotel.pk), summary, CACHE_TIMEOUT)
+    return summary
+
+def reviews_html(hotel: Hotel) -> str:
+    """The review list of the hotel as shown to visitors"""
+    html = cache.get(_reviews_key(hotel.pk))
+    if html is None:
+        html = render_to_string("booking/_reviews.html", {
+            "reviews": top_level_reviews(hotel),
+            "can_moderate": False,
+        })
+        cache.set(_reviews_key(hotel.pk), html, CACHE_TIMEOUT)
+    return mark_safe(html)
+
+def invalidate(hotel_id: int) -> None:
+    """Drop the cached review parts of a hotel after one of its reviews changed"""
+    cache.delete_many([_ratings_key(hotel_id), _reviews_key(hotel_id)])
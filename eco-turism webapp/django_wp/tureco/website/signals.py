@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import inventory
+from .models import RoomBooking
+
+
+@receiver(pre_save, sender=RoomBooking)
+def remember_booked_nights(sender, instance, raw=False, **kwargs):
+    """Keep the stay a booking had before an edit, so the edit can be moved in the inventory"""
+    instance._booked_stay = None
+    if instance.pk and not raw:
+        instance._booked_stay = RoomBooking.objects.filter(pk=instance.pk).values_list(
+            'room_type_id', 'check_in', 'check_out', 'room_booked'
+        ).first()
+
+@receiver(post_save, sender=RoomBooking)
+def book_nights(sender, instance, raw=False, **kwargs):
+    if raw or getattr(instance, '_nights_reserved', False):
+        return
+    previous = getattr(instance, '_booked_stay', None)
+    with transaction.atomic():
+        if previous:
+            inventory.remove_booking(*previous)
+        inventory.add_booking(instance.room_type_id, instance.check_in, instance.check_out, instance.room_booked)
+
+@receiver(post_delete, sender=RoomBooking)
+def release_nights(sender, instance, **kwargs):
+    inventory.remove_booking(instance.room_type_id, instance.check_in, instance.check_out, instance.room_booked)
@@ -3,11 +3,23 @@ Automated Test Suite for Role-Based Manager System
 Run with: python manage.py test website.tests
 """
 
-from django.test import TestCase, Client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.db.models import Sum
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
-from .models import User, Hotel, Room, TransportationTrip, RoomBooking, TripBooking
+from . import booking as booking_engine
+from .booking import SoldOut
+from .inventory import rooms_available
+from .models import User, Hotel, Room, TransportationTrip, RoomBooking, TripBooking, Review, RoomInventory, Account
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 
 class UserRegistrationTests(TestCase):
@@ -610,5 +622,310 @@ class ModelTests(TestCase):
         self.assertFalse(Room.objects.filter(id=room_id).exists())
 
 
+class HotelSearchTests(TestCase):
+    """Test hotel search availability, sorting and paging"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.check_in = datetime.now().date() + timedelta(days=10)
+        self.check_out = self.check_in + timedelta(days=3)
+        
+        self.green = Hotel.objects.create(name='Green Lodge', city='Brasov', address='Address 1')
+        self.green_single = Room.objects.create(
+            hotel=self.green, name='Single', max_persons=1, price_per_night=40.00, total_rooms=1
+        )
+        self.green_double = Room.objects.create(
+            hotel=self.green, name='Double', max_persons=2, price_per_night=80.00, total_rooms=1
+        )
+        self.green_suite = Room.objects.create(
+            hotel=self.green, name='Suite', max_persons=4, price_per_night=150.00, total_rooms=2
+        )
+        
+        self.river = Hotel.objects.create(name='River Inn', city='Brasov', address='Address 2')
+        Room.objects.create(hotel=self.river, name='Double', max_persons=2, price_per_night=60.00, total_rooms=1)
+        
+        Review.objects.create(hotel_id=self.green, rating=5, eco_rating=5, comment='Great')
+        Review.objects.create(hotel_id=self.green, rating=4, eco_rating=3, comment='Good')
+        Review.objects.create(hotel_id=self.river, rating=3, eco_rating=3, comment='Fine')
+    
+    def search(self, **params):
+        query = {'search_type': 'hotel', 'city_to': 'Brasov', 'persons': 2}
+        query.update(params)
+        return self.client.get(reverse('website:results'), query)
+    
+    def test_cheapest_suitable_room_and_rating(self):
+        """TC7.1: Hotels show their cheapest room for the party and average rating"""
+        response = self.search(sort_by='price_low')
+        
+        hotels = list(response.context['hotels'])
+        self.assertEqual([h.name for h in hotels], ['River Inn', 'Green Lodge'])
+        self.assertEqual((hotels[1].cheapest_room_name, hotels[1].price), ('Double', Decimal('80.00')))
+        self.assertEqual(hotels[1].avg_rating, 4.5)
+    
+    def test_booked_out_rooms_are_skipped(self):
+        """TC7.2: Fully booked rooms are ignored for the requested stay"""
+        RoomBooking.objects.create(
+            room_type=self.green_double, check_in=self.check_in, check_out=self.check_out, room_booked=1
+        )
+        RoomBooking.objects.create(
+            room_type=Room.objects.get(hotel=self.river), check_in=self.check_in + timedelta(days=1),
+            check_out=self.check_out + timedelta(days=1), room_booked=1
+        )
+        
+        response = self.search(check_in=self.check_in, check_out=self.check_out)
+        
+        hotels = list(response.context['hotels'])
+        self.assertEqual([h.name for h in hotels], ['Green Lodge'])
+        self.assertEqual((hotels[0].cheapest_room_name, hotels[0].price), ('Suite', Decimal('150.00')))
+    
+    def test_sorting_and_paging_run_in_the_database(self):
+        """TC7.3: One page of a large catalog is fetched with a constant number of queries"""
+        for i in range(30):
+            hotel = Hotel.objects.create(name=f'Hotel {i:02d}', city='Brasov', address='Address')
+            Room.objects.create(hotel=hotel, name='Double', max_persons=2, price_per_night=100 + i, total_rooms=1)
+        
+        with self.assertNumQueries(2):
+            response = self.search(sort_by='price_high', page=2)
+        
+        page = response.context['page_obj']
+        self.assertEqual(page.paginator.count, 32)
+        self.assertEqual(page[0].name, 'Hotel 17')
+        
+        response = self.search(sort_by='rating')
+        self.assertEqual([h.name for h in response.context['hotels']][:2], ['Green Lodge', 'River Inn'])
+
+
+class TripSearchTests(TestCase):
+    """Test remaining seats in transportation search"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.departure = datetime.now() + timedelta(days=7)
+        self.trips = [
+            TransportationTrip.objects.create(
+                transport_type='bus', operator_name='Route Express', origin_city='Sibiu',
+                destination_city='Brasov', departure=self.departure + timedelta(hours=i),
+                arrival=self.departure + timedelta(hours=i + 3), car_reg=f'SB-{i:03d}',
+                total_seats=10, price_per_seat=20 + i
+            )
+            for i in range(40)
+        ]
+        for trip in self.trips[:20]:
+            TripBooking.objects.create(trip=trip, seats_booked=4)
+            TripBooking.objects.create(trip=trip, seats_booked=3)
+        TripBooking.objects.create(trip=self.trips[0], seats_booked=2)
+    
+    def test_seats_are_counted_in_one_query(self):
+        """TC9.1: Remaining seats of every departure come from one query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('website:results'), {
+                'search_type': 'transport', 'city_from': 'Sibiu', 'city_to': 'Brasov', 'persons': 2,
+                'sort_by': 'price_high',
+            })
+        
+        trips = response.context['trips']
+        self.assertEqual(len(trips), 39)
+        self.assertEqual(trips[0], self.trips[-1])
+        self.assertEqual(trips[-1].available_seats, 3)
+        self.assertNotIn(self.trips[0], trips)
+    
+    def test_detail_shows_remaining_seats(self):
+        """TC9.2: Trip detail and booking pages show the remaining seats"""
+        response = self.client.get(reverse('website:transportation_detail', args=[self.trips[0].id]))
+        self.assertEqual(response.context['available'], 1)
+        
+        response = self.client.get(reverse('website:book_trip', args=[self.trips[1].id]))
+        self.assertEqual(response.context['available'], 3)
+
+
+class RoomInventoryTests(TestCase):
+    """Test the per-night room inventory kept from bookings"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.hotel = Hotel.objects.create(name='Forest Cabins', city='Sinaia', address='Address')
+        self.cabin = Room.objects.create(
+            hotel=self.hotel, name='Cabin', max_persons=2, price_per_night=90.00, total_rooms=3
+        )
+        self.loft = Room.objects.create(
+            hotel=self.hotel, name='Loft', max_persons=4, price_per_night=140.00, total_rooms=1
+        )
+        self.start = datetime.now().date() + timedelta(days=20)
+    
+    def day(self, n):
+        return self.start + timedelta(days=n)
+    
+    def test_bookings_fill_and_free_nights(self):
+        """TC10.1: Bookings, edits and cancellations update the inventory"""
+        first = RoomBooking.objects.create(room_type=self.cabin, check_in=self.day(0), check_out=self.day(3), room_booked=2)
+        RoomBooking.objects.create(room_type=self.cabin, check_in=self.day(2), check_out=self.day(4), room_booked=1)
+        
+        booked = dict(RoomInventory.objects.filter(room=self.cabin).values_list('night', 'booked'))
+        self.assertEqual(booked, {self.day(0): 2, self.day(1): 2, self.day(2): 3, self.day(3): 1})
+        self.assertEqual(rooms_available(self.cabin, self.day(0), self.day(2)), 1)
+        self.assertEqual(rooms_available(self.cabin, self.day(1), self.day(4)), 0)
+        self.assertEqual(rooms_available(self.cabin, self.day(4), self.day(6)), 3)
+        
+        first.check_in, first.check_out = self.day(5), self.day(6)
+        first.save()
+        self.assertEqual(rooms_available(self.cabin, self.day(0), self.day(4)), 2)
+        self.assertEqual(rooms_available(self.cabin, self.day(5), self.day(6)), 1)
+        
+        first.delete()
+        self.assertEqual(rooms_available(self.cabin, self.day(0), self.day(7)), 2)
+    
+    def test_hotel_detail_counts_capacity_in_one_query(self):
+        """TC10.2: Hotel detail shows the free rooms of every room type"""
+        RoomBooking.objects.create(room_type=self.cabin, check_in=self.day(0), check_out=self.day(2), room_booked=1)
+        RoomBooking.objects.create(room_type=self.loft, check_in=self.day(1), check_out=self.day(2), room_booked=1)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('website:hotel_detail', args=[self.hotel.id]), {
+                'check_in': self.day(0).isoformat(), 'check_out': self.day(3).isoformat()
+            })
+        
+        available = {info['room'].name: info['available'] for info in response.context['rooms_info']}
+        self.assertEqual(available, {'Cabin': 2, 'Loft': 0})
+        self.assertEqual(sum('website_roominventory' in q['sql'] for q in queries.captured_queries), 1)
+
+
+class BookingEngineTests(TransactionTestCase):
+    """Test that parallel bookings never oversell"""
+    
+    def setUp(self):
+        hotel = Hotel.objects.create(name='Busy Hotel', city='Constanta', address='Address')
+        self.room = Room.objects.create(hotel=hotel, name='Sea View', max_persons=2, price_per_night=120.00, total_rooms=5)
+        departure = datetime.now() + timedelta(days=3)
+        self.trip = TransportationTrip.objects.create(
+            transport_type='train', operator_name='Coast Rail', origin_city='Bucharest', destination_city='Constanta',
+            departure=departure, arrival=departure + timedelta(hours=3), car_reg='CT-001',
+            total_seats=6, price_per_seat=30.00
+        )
+        self.check_in = datetime.now().date() + timedelta(days=30)
+        self.check_out = self.check_in + timedelta(days=2)
+    
+    def run_parallel(self, book, attempts=20):
+        """Fire `attempts` bookings at once, return how many went through"""
+        start = threading.Barrier(attempts)
+        
+        def attempt(_):
+            try:
+                start.wait()
+                book()
+                return True
+            except SoldOut:
+                return False
+            finally:
+                connection.close()
+        
+        with ThreadPoolExecutor(max_workers=attempts) as pool:
+            return sum(pool.map(attempt, range(attempts)))
+    
+    def test_parallel_room_bookings(self):
+        """TC11.1: Simultaneous bookings of one room type stop at its capacity"""
+        booked = self.run_parallel(lambda: booking_engine.book_room(
+            self.room, self.check_in, self.check_out, 1, guest_name='Guest', is_guest=True
+        ))
+        
+        self.assertEqual(booked, 5)
+        self.assertEqual(RoomBooking.objects.filter(room_type=self.room).count(), 5)
+        self.assertEqual(set(RoomInventory.objects.filter(room=self.room).values_list('booked', flat=True)), {5})
+        numbers = list(RoomBooking.objects.values_list('booking_nr', flat=True))
+        self.assertEqual(len(set(numbers)), 5)
+        self.assertTrue(all(n > 99999 for n in numbers))
+    
+    def test_parallel_trip_bookings(self):
+        """TC11.2: Simultaneous seat bookings stop at the trip's seats"""
+        booked = self.run_parallel(lambda: booking_engine.book_trip(self.trip, 2, guest_name='Guest', is_guest=True))
+        
+        self.assertEqual(booked, 3)
+        self.assertEqual(TripBooking.objects.filter(trip=self.trip).aggregate(total=Sum('seats_booked'))['total'], 6)
+    
+    def test_sold_out_reports_what_is_left(self):
+        """TC11.3: A booking that does not fit changes nothing"""
+        booking_engine.book_room(self.room, self.check_in, self.check_in + timedelta(days=1), 4)
+        
+        with self.assertRaises(SoldOut) as raised:
+            booking_engine.book_room(self.room, self.check_in, self.check_out, 2)
+        
+        self.assertEqual(raised.exception.available, 1)
+        self.assertEqual(list(RoomInventory.objects.filter(room=self.room).values_list('booked', flat=True)), [4])
+    
+    def test_empty_or_reversed_stay_is_refused(self):
+        """TC11.4: A stay without nights books nothing"""
+        for check_out in (self.check_in, self.check_in - timedelta(days=2)):
+            with self.assertRaises(SoldOut) as raised:
+                booking_engine.book_room(self.room, self.check_in, check_out, 3)
+            self.assertEqual(raised.exception.available, 0)
+        
+        self.assertFalse(RoomBooking.objects.filter(room_type=self.room).exists())
+        self.assertFalse(RoomInventory.objects.filter(room=self.room).exists())
+
+
+class ReviewCacheTests(TestCase):
+    """Test the cached review parts of the hotel detail page"""
+    
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.hotel = Hotel.objects.create(name='Lake House', city='Bran', address='Address')
+        self.review = Review.objects.create(hotel_id=self.hotel, rating=4, eco_rating=2, comment='Quiet place')
+        self.complaint = Review.objects.create(hotel_id=self.hotel, rating=2, eco_rating=5, comment='Cold rooms')
+        self.url = reverse('website:hotel_detail', args=[self.hotel.id])
+        self.staff = get_user_model().objects.create_user('moderator', password='testpass123', is_staff=True)
+    
+    def review_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, sum('website_review' in q['sql'] for q in queries.captured_queries)
+    
+    def test_repeat_views_are_served_from_cache(self):
+        """TC12.1: Ratings are averaged in one query and reused with the review list"""
+        response, queries = self.review_queries()
+        self.assertEqual((response.context['avg_rating'], response.context['eco_avg_rating']), (3.0, 3.5))
+        self.assertEqual(queries, 3)  # averages, reviews, replies
+        
+        response, queries = self.review_queries()
+        self.assertEqual(queries, 0)
+        self.assertContains(response, 'Cold rooms')
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+    
+    def test_new_review_invalidates_cache(self):
+        """TC12.2: A posted review shows up at once"""
+        self.client.get(self.url)
+        customer = User.objects.create(email='guest@test.com', password=make_password('testpass123'))
+        Account.objects.create(fname='Ana', lname='Pop', phone='0700000000', dateofbirth='1990-01-01', user_id=customer)
+        session = self.client.session
+        session['customer_id'] = customer.id
+        session.save()
+        
+        self.client.post(reverse('website:add_review', args=[self.hotel.id]), {
+            'comment': 'Lovely lake', 'rate': 5, 'eco_rate': 5
+        })
+        
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['avg_rating'], 3.7)
+        self.assertContains(response, 'Lovely lake')
+    
+    def test_moderation_invalidates_cache(self):
+        """TC12.3: Replies, edits and deletions by staff reach the cached page"""
+        self.client.get(self.url)
+        self.client.force_login(self.staff)
+        
+        response = self.client.get(self.url)
+        self.assertContains(response, reverse('website:reply_to_review', args=[self.review.id]))
+        
+        self.client.post(reverse('website:reply_to_review', args=[self.review.id]), {'comment': 'Thank you'})
+        self.client.post(reverse('website:edit_review', args=[self.review.id]), {'comment': 'Very quiet place'})
+        self.client.post(reverse('website:delete_review', args=[self.complaint.id]), {})
+        self.client.logout()
+        
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Thank you')
+        self.assertContains(response, 'Very quiet place')
+        self.assertNotContains(response, 'Cold rooms')
+        self.assertEqual((response.context['avg_rating'], response.context['eco_avg_rating']), (4.0, 2.0))
+
+
 # Run all tests with:
 # python manage.py test website.tests
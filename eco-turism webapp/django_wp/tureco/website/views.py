@@ -1,5 +1,4 @@
 from datetime import date
-import random
 import logging
 from functools import wraps
 from django.utils.dateparse import parse_date
@@ -9,7 +8,9 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.forms import AuthenticationForm
-from django.db.models import Q, Sum
+from django.core.paginator import Paginator
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest, Round
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.db import models
@@ -19,6 +20,10 @@ from .forms import (
     EmailLoginForm, CustomerSignupForm,
     HotelReviewForm, AddHotelForm, AddRoomForm, AddTransportationForm
 )
+from . import booking as booking_engine
+from . import review_cache
+from .booking import SoldOut
+from .inventory import with_rooms_available
 from .models import (
     Hotel, Room, 
     RoomBooking, TransportationTrip, 
@@ -28,6 +33,22 @@ from .models import (
 
 logger = logging.getLogger(__name__)
 
+HOTELS_PER_PAGE = 12
+
+# Hotel search orderings, ties broken by name so pages stay stable
+HOTEL_ORDERINGS = {
+    'name': ('name', 'pk'),
+    'price_low': ('price', 'name', 'pk'),
+    'price_high': ('-price', 'name', 'pk'),
+    'rating': ('-avg_rating', 'name', 'pk'),
+}
+
+TRIP_ORDERINGS = {
+    'time': ('departure', 'pk'),
+    'price_low': ('price_per_seat', 'departure', 'pk'),
+    'price_high': ('-price_per_seat', 'departure', 'pk'),
+}
+
 
 def customer_login_required(view_func):
     """
@@ -286,49 +307,12 @@ def results_view(request):
         check_in = form.cleaned_data.get('check_in')
         check_out = form.cleaned_data.get('check_out')
         
-        # Base hotel query with prefetch for efficiency
-        hotels = Hotel.objects.filter(city__icontains=city).prefetch_related('rooms', 'reviews')
-        
-        # Filter hotels that have rooms available for the person count
-        hotel_results = []
-        for h in hotels:
-            suitable_rooms = [r for r in h.rooms.all() if r.max_persons >= persons]
-            if not suitable_rooms:
-                continue
-            
-            # Find cheapest suitable room
-            cheapest_room = min(suitable_rooms, key=lambda x: x.price_per_night)
-            
-            # Check availability if dates provided
-            available = True
-            if check_in and check_out and check_in < check_out:
-                available_count = _rooms_available(cheapest_room, check_in, check_out)
-                available = available_count > 0
-            
-            if available or not (check_in and check_out):
-                # Calculate average rating
-                avg_rating = h.reviews.filter(parent__isnull=True).aggregate(
-                    avg=models.Avg('rating')
-                )['avg'] or 0
-                
-                hotel_results.append({
-                    'obj': h,
-                    'cheapest_room': cheapest_room,
-                    'price': float(cheapest_room.price_per_night),
-                    'avg_rating': round(avg_rating, 1)
-                })
-        
-        # Sort results
-        if sort_by == 'price_low':
-            hotel_results.sort(key=lambda x: x['price'])
-        elif sort_by == 'price_high':
-            hotel_results.sort(key=lambda x: x['price'], reverse=True)
-        elif sort_by == 'rating':
-            hotel_results.sort(key=lambda x: x['avg_rating'], reverse=True)
-        else:  # name
-            hotel_results.sort(key=lambda x: x['obj'].name)
+        # Filtering, availability, ratings, sorting and paging all run in the database
+        hotels = _search_hotels(city, persons, check_in, check_out, sort_by)
+        page = Paginator(hotels, HOTELS_PER_PAGE).get_page(request.GET.get('page'))
         
-        context['hotels'] = hotel_results
+        context['hotels'] = page
+        context['page_obj'] = page
         context['check_in'] = check_in
         context['check_out'] = check_out
         context['persons'] = persons
@@ -338,56 +322,54 @@ def results_view(request):
         city_to = form.cleaned_data.get('city_to') or ''
         departure = form.cleaned_data.get('departure')
         
-        # Base transportation query
-        trips = TransportationTrip.objects.filter(
+        # Base transportation query, remaining seats are counted for all trips at once
+        trips = _with_seats_available(TransportationTrip.objects.filter(
             origin_city__icontains=city_from,
             destination_city__icontains=city_to,
-        )
+        ))
         
         if departure:
             trips = trips.filter(departure__date=departure.date())
         
-        # Filter trips with available seats and add booking count
-        trip_results = []
-        for trip in trips:
-            booked_seats = TripBooking.objects.filter(trip=trip).aggregate(
-                total=Sum('seats_booked')
-            )['total'] or 0
-            available_seats = trip.total_seats - booked_seats
-            
-            if available_seats >= persons:
-                trip_results.append({
-                    'obj': trip,
-                    'available_seats': available_seats,
-                    'price': float(trip.price_per_seat)
-                })
-        
-        # Sort trips
-        if sort_by == 'price_low':
-            trip_results.sort(key=lambda x: x['price'])
-        elif sort_by == 'price_high':
-            trip_results.sort(key=lambda x: x['price'], reverse=True)
-        elif sort_by == 'time':
-            trip_results.sort(key=lambda x: x['obj'].departure)
-        else:
-            trip_results.sort(key=lambda x: x['obj'].departure)
+        trips = trips.filter(available_seats__gte=persons).order_by(
+            *TRIP_ORDERINGS.get(sort_by, TRIP_ORDERINGS['time'])
+        )
         
-        context['trips'] = trip_results
+        context['trips'] = list(trips)
         context['departure'] = departure
     
     context['sort_by'] = sort_by
     context['search_type'] = search_type
     return render(request, 'booking/results.html', context)
 
-def _rooms_available(room_type: Room, start: date, end: date) -> int:
-    if end <= start:
-        return 0
-    overlapping = RoomBooking.objects.filter(
-        room_type=room_type,
-        check_in__lt=end,
-        check_out__gt=start,
-    ).aggregate(total=Sum('room_booked'))['total'] or 0
-    return max(room_type.total_rooms - overlapping, 0)
+def _search_hotels(city: str, persons: int, check_in: date = None, check_out: date = None, sort_by: str = 'name'):
+    """
+    Hotels in a city that have a room for `persons`, as a single query.
+    Every hotel is annotated with its cheapest suitable room (free for the
+    whole stay when dates are given), that room's price and the average
+    rating of its top-level reviews. Hotels without such a room are left out.
+    """
+    rooms = Room.objects.filter(hotel=OuterRef('pk'), max_persons__gte=persons)
+    if check_in and check_out and check_in < check_out:
+        rooms = with_rooms_available(rooms, check_in, check_out).filter(available__gt=0)
+    rooms = rooms.order_by('price_per_night', 'pk')
+
+    ratings = (
+        Review.objects.filter(hotel_id=OuterRef('pk'), parent__isnull=True)
+            .values('hotel_id')
+            .annotate(avg=models.Avg('rating'))
+            .values('avg')
+    )
+    return (
+        Hotel.objects.filter(city__icontains=city)
+            .annotate(
+                price=Subquery(rooms.values('price_per_night')[:1]),
+                cheapest_room_name=Subquery(rooms.values('name')[:1]),
+                avg_rating=Round(Coalesce(Subquery(ratings), 0.0, output_field=models.FloatField()), 1),
+            )
+            .filter(price__isnull=False)
+            .order_by(*HOTEL_ORDERINGS.get(sort_by, HOTEL_ORDERINGS['name']))
+    )
 
 def hotel_detail(request, pk: int):
     logged_in = False
@@ -410,58 +392,30 @@ def hotel_detail(request, pk: int):
     # --- build rooms_info only when dates are present ---
     rooms_info = []
     if check_in and check_out:
-        for r in hotel.rooms.all():
-            # If you already have a helper, call it here:
-            # available = _rooms_available(r, check_in, check_out)
-            # Otherwise, a simple overlap check (adjust model/field names if needed):
-            booked_overlap = RoomBooking.objects.filter(
-                room_type=r,
-                check_in__lt=check_out,
-                check_out__gt=check_in,
-            ).exists()
-            available = 0 if booked_overlap else 1  # replace with your capacity logic
-            rooms_info.append({"room": r, "available": available})
+        # Free rooms of every room type for the whole stay, in one query
+        for r in with_rooms_available(hotel.rooms.all(), check_in, check_out):
+            rooms_info.append({"room": r, "available": r.available})
     else:
         rooms_info = None  # triggers "Select dates" UI
 
-    avg_rating = (
-        hotel.reviews.filter(parent__isnull=True)
-            .aggregate(avg_rating=models.Avg("rating"))  # <- explicit alias
-            .get("avg_rating")                  # <- safe read
-    ) or 0
-    eco_avg_rating = (
-        hotel.reviews.filter(parent__isnull=True)
-            .aggregate(eco_avg_rating=models.Avg("eco_rating"))  # <- explicit alias
-            .get("eco_avg_rating")
-    ) or 0
-    # your existing reviews logic here...
-    reviews = hotel.reviews.filter(parent__isnull=True).select_related("account_id", "staff_user")
-    
+    context = {
+        "hotel": hotel,
+        **review_cache.rating_summary(hotel),
+        "rooms_info": rooms_info,
+        "check_in": check_in,
+        "check_out": check_out,
+        "q_check_in": q_check_in,   # keep originals for form fields
+        "q_check_out": q_check_out,
+    }
     if logged_in:
-        context = {
-            "hotel": hotel,
-            "reviews": reviews,
-            "eco_avg_rating": round(eco_avg_rating, 1),
-            "avg_rating": round(avg_rating, 1),
-            "rooms_info": rooms_info,
-            "check_in": check_in,
-            "check_out": check_out,
-            "q_check_in": q_check_in,   # keep originals for form fields
-            "q_check_out": q_check_out,
-            "user": user,
-        }
+        context["user"] = user
+
+    # Visitors share one cached review list, moderators need their own forms
+    if request.user.is_authenticated and (request.user.is_staff or request.user.is_superuser):
+        context["reviews"] = review_cache.top_level_reviews(hotel)
+        context["can_moderate"] = True
     else:
-        context = {
-            "hotel": hotel,
-            "reviews": reviews,
-            "eco_avg_rating": round(eco_avg_rating, 1),
-            "avg_rating": round(avg_rating, 1),
-            "rooms_info": rooms_info,
-            "check_in": check_in,
-            "check_out": check_out,
-            "q_check_in": q_check_in,   # keep originals for form fields
-            "q_check_out": q_check_out,
-        }
+        context["reviews_html"] = review_cache.reviews_html(hotel)
     return render(request, "booking/hotel_detail.html", context)
 
 @login_required
@@ -484,6 +438,7 @@ def reply_to_review(request, review_id):
             eco_rating=review.eco_rating,  # inherit rating or set to 0 if you prefer
             comment=text,
         )
+        review_cache.invalidate(hotel.id)
         messages.success(request, "Reply posted.")
         return redirect("website:hotel_detail", pk=hotel.id)
 
@@ -530,6 +485,7 @@ def add_review(request, hotel_id):
             eco_rating=eco_rate or 0,
             comment=comment,
         )
+        review_cache.invalidate(hotel.id)
 
         messages.success(request, "Your review has been posted successfully!")
         return redirect("website:hotel_detail", pk=hotel.id)
@@ -554,6 +510,7 @@ def edit_review(request, review_id: int):
 
     review.comment = new_comment
     review.save(update_fields=["comment"])
+    review_cache.invalidate(hotel.id)
     messages.success(request, "Comment updated successfully.")
     return redirect("website:hotel_detail", pk=hotel.id)
 
@@ -567,17 +524,27 @@ def delete_review(request, review_id: int):
         return redirect("website:hotel_detail", pk=hotel.id)
 
     review.delete()
+    review_cache.invalidate(hotel.id)
     messages.success(request, "Comment deleted.")
     return redirect("website:hotel_detail", pk=hotel.id)
 
-def _seats_available(trip: TransportationTrip) -> int:
-    booked = TripBooking.objects.filter(trip=trip).aggregate(total=Sum('seats_booked'))['total'] or 0
-    return max(trip.total_seats - booked, 0)
+def _with_seats_available(trips):
+    """
+    Annotate trips with `available_seats`, from one grouped subquery over their bookings.
+    """
+    booked = (
+        TripBooking.objects.filter(trip=OuterRef('pk'))
+            .values('trip')
+            .annotate(total=Sum('seats_booked'))
+            .values('total')
+    )
+    return trips.annotate(
+        available_seats=Greatest(F('total_seats') - Coalesce(Subquery(booked), 0), 0)
+    )
 
 def transportation_detail(request, pk: int):
-    trip = get_object_or_404(TransportationTrip, pk=pk)
-    available = _seats_available(trip)
-    return render(request, 'booking/transportation_detail.html', {'trip': trip, 'available': available})
+    trip = get_object_or_404(_with_seats_available(TransportationTrip.objects.all()), pk=pk)
+    return render(request, 'booking/transportation_detail.html', {'trip': trip, 'available': trip.available_seats})
 
 def book_room(request, room_type_id: int):
     room_type = get_object_or_404(Room, pk=room_type_id)
@@ -596,7 +563,6 @@ def book_room(request, room_type_id: int):
     if request.method == 'POST':
         form = RoomBookingForm(request.POST)
         if form.is_valid():
-            booking_number = random.randint(10000, 99999)
             check_in = form.cleaned_data['check_in']
             check_out = form.cleaned_data['check_out']
             rooms_booked = form.cleaned_data['room_booked']
@@ -616,25 +582,21 @@ def book_room(request, room_type_id: int):
                     'is_logged_in': is_logged_in
                 })
             
-            available = _rooms_available(room_type, check_in, check_out)
-            if rooms_booked > available:
-                messages.error(request, f'Only {available} room(s) available for that range')
-            else:
-                RoomBooking.objects.create(
+            # Rooms are reserved and the booking saved in one transaction
+            try:
+                booking = booking_engine.book_room(
+                    room_type, check_in, check_out, rooms_booked,
                     user=customer if is_logged_in else None,
-                    room_type=room_type,
-                    check_in=check_in,
-                    check_out=check_out,
-                    room_booked=rooms_booked,
-                    booking_nr=booking_number,
                     is_guest=is_guest_booking,
                     guest_name=guest_name if is_guest_booking else None,
                     guest_email=guest_email if is_guest_booking else None,
                     guest_phone=guest_phone if is_guest_booking else None
                 )
-                
+            except SoldOut as e:
+                messages.error(request, f'Only {e.available} room(s) available for that range')
+            else:
                 if is_guest_booking:
-                    messages.success(request, f'Room booked successfully! Booking number: {booking_number}. A confirmation has been sent to {guest_email}.')
+                    messages.success(request, f'Room booked successfully! Booking number: {booking.booking_nr}. A confirmation has been sent to {guest_email}.')
                 else:
                     messages.success(request, 'Room booked successfully!')
                 
@@ -652,7 +614,7 @@ def book_room(request, room_type_id: int):
     })
 
 def book_trip(request, trip_id: int):
-    trip = get_object_or_404(TransportationTrip, pk=trip_id)
+    trip = get_object_or_404(_with_seats_available(TransportationTrip.objects.all()), pk=trip_id)
     
     # Check if user is logged in
     is_logged_in = "customer_id" in request.session
@@ -665,11 +627,10 @@ def book_trip(request, trip_id: int):
             request.session.flush()
             is_logged_in = False
     
-    available = _seats_available(trip)
+    available = trip.available_seats
     
     if request.method == "POST":
         form = TripBookingForm(request.POST)
-        booking_number = random.randint(10000, 99999)
         if form.is_valid():
             seats = form.cleaned_data['seats_booked']
             
@@ -689,22 +650,22 @@ def book_trip(request, trip_id: int):
                     'is_logged_in': is_logged_in
                 })
             
-            if seats > available:
-                messages.error(request, f'Only {available} seat(s) available.')
-            else:
-                TripBooking.objects.create(
+            # Seats are counted again under a lock of the trip
+            try:
+                booking = booking_engine.book_trip(
+                    trip, seats,
                     user=customer if is_logged_in else None,
-                    trip=trip,
-                    seats_booked=seats,
-                    booking_nr=booking_number,
                     is_guest=is_guest_booking,
                     guest_name=guest_name if is_guest_booking else None,
                     guest_email=guest_email if is_guest_booking else None,
                     guest_phone=guest_phone if is_guest_booking else None
                 )
-                
+            except SoldOut as e:
+                available = e.available
+                messages.error(request, f'Only {available} seat(s) available.')
+            else:
                 if is_guest_booking:
-                    messages.success(request, f'Seat(s) booked successfully! Booking number: {booking_number}. A confirmation has been sent to {guest_email}.')
+                    messages.success(request, f'Seat(s) booked successfully! Booking number: {booking.booking_nr}. A confirmation has been sent to {guest_email}.')
                 else:
                     messages.success(request, 'Seat(s) booked successfully!')
                 
@@ -0,0 +1,518 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.StringWriter;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.lang.reflect.Modifier;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashMap;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Map;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Warm JVM used by the classroom execution pool.
+ *
+ * The worker reads one JSON job per line on stdin. While the job runs it
+ * writes one JSON line per output chunk on stdout, followed by a final line
+ * with the exit status, the same protocol as python_worker.py. Every job is
+ * compiled with the in-process compiler and loaded in a fresh class loader,
+ * so submissions never share static state and JVM startup is only paid once
+ * per worker. When threads of a program outlive its run the worker asks the
+ * pool to replace it; System.exit ends the worker, which the pool reports as
+ * the program's exit status.
+ *
+ * Started with the single-file source launcher, this file must not depend
+ * on anything outside the JDK.
+ */
+public class JavaWorker {
+
+    static final PrintStream PROTOCOL = new PrintStream(new FileOutputStream(FileDescriptor.out), true, StandardCharsets.UTF_8);
+    static final int COMPILE_CACHE_SIZE = 32;
+
+    // Compiled classes of recent submissions, by source, class name and flags
+    static final Map<String, Map<String, byte[]>> compiled = new LinkedHashMap<String, Map<String, byte[]>>(16, 0.75f, true) {
+        @Override
+        protected boolean removeEldestEntry(Map.Entry<String, Map<String, byte[]>> eldest) {
+            return size() > COMPILE_CACHE_SIZE;
+        }
+    };
+
+    static final JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+
+    public static void main(String[] args) throws Exception {
+        BufferedReader jobs = new BufferedReader(new InputStreamReader(new FileInputStream(FileDescriptor.in), StandardCharsets.UTF_8));
+        // Programs must never read the job pipe, each job gets its own input
+        System.setIn(new ByteArrayInputStream(new byte[0]));
+        Runtime.getRuntime().addShutdownHook(new Thread(() -> {
+            System.out.flush();
+            System.err.flush();
+        }));
+        if (compiler == null) {
+            System.exit(70);
+        }
+        // Load and JIT the compiler before the first job arrives
+        compile("Warmup", "public class Warmup { public static void main(String[] args) {} }", List.of(), new StringWriter());
+
+        String line;
+        while ((line = jobs.readLine()) != null) {
+            if (line.isBlank()) {
+                continue;
+            }
+            Map<String, Object> job = Json.parseObject(line);
+            boolean restart = runJob(job);
+            if (restart) {
+                // Threads of the program are still running, the pool starts a fresh worker
+                PROTOCOL.flush();
+                Runtime.getRuntime().halt(0);
+            }
+        }
+    }
+
+    static void emit(String json) {
+        synchronized (PROTOCOL) {
+            PROTOCOL.print(json + "\n");
+            PROTOCOL.flush();
+        }
+    }
+
+    /** Runs one job, returns whether the worker has to be replaced afterwards */
+    static boolean runJob(Map<String, Object> job) throws Exception {
+        String code = (String) job.getOrDefault("code", "");
+        String stdin = (String) job.getOrDefault("stdin", "");
+        String className = (String) job.getOrDefault("class_name", "Main");
+        double timeout = ((Number) job.getOrDefault("timeout", 10)).doubleValue();
+        long maxOutput = ((Number) job.getOrDefault("max_output", 256 * 1024)).longValue();
+        List<String> flags = new ArrayList<>();
+        for (Object flag : (List<?>) job.getOrDefault("flags", new ArrayList<>())) {
+            flags.add((String) flag);
+        }
+
+        String key = className + "\u0000" + flags + "\u0000" + code;
+        Map<String, byte[]> classes = compiled.get(key);
+        Double compileTime = null;
+        if (classes == null) {
+            long started = System.nanoTime();
+            StringWriter errors = new StringWriter();
+            classes = compile(className, code, flags, errors);
+            compileTime = (System.nanoTime() - started) / 1e9;
+            if (classes == null) {
+                emit("{\"done\": true, \"compile_error\": " + Json.quote(errors.toString()) + ", \"compile_time\": " + compileTime + "}");
+                return false;
+            }
+            compiled.put(key, classes);
+        }
+
+        Run run = new Run(maxOutput);
+        PrintStream out = new PrintStream(new JobOutput(run, "stdout"), true, StandardCharsets.UTF_8);
+        PrintStream err = new PrintStream(new JobOutput(run, "stderr"), true, StandardCharsets.UTF_8);
+        System.setOut(out);
+        System.setErr(err);
+        System.setIn(new ByteArrayInputStream(stdin.getBytes(StandardCharsets.UTF_8)));
+
+        ThreadGroup group = new ThreadGroup("program") {
+            @Override
+            public void uncaughtException(Thread thread, Throwable error) {
+                if (error instanceof OutputLimitError) {
+                    return;
+                }
+                System.err.print("Exception in thread \"" + thread.getName() + "\" ");
+                error.printStackTrace();
+            }
+        };
+        ClassLoader loader = new MemoryClassLoader(classes);
+        Map<String, byte[]> programClasses = classes;
+        Thread main = new Thread(group, () -> runMain(loader, className, programClasses, run), "main");
+        main.setContextClassLoader(loader);
+        main.start();
+
+        long deadline = System.nanoTime() + (long) (timeout * 1e9);
+        boolean timedOut = false;
+        while (!run.truncated) {
+            Thread alive = firstLiveThread(group);
+            if (alive == null) {
+                break;
+            }
+            long remaining = deadline - System.nanoTime();
+            if (remaining <= 0) {
+                timedOut = true;
+                break;
+            }
+            alive.join(Math.max(1, Math.min(remaining / 1_000_000, 20)));
+        }
+        out.flush();
+        err.flush();
+
+        boolean restart = firstLiveThread(group) != null;
+        StringBuilder done = new StringBuilder("{\"done\": true");
+        done.append(", \"returncode\": ").append(run.returncode);
+        done.append(", \"timed_out\": ").append(timedOut);
+        done.append(", \"truncated\": ").append(run.truncated);
+        done.append(", \"restart\": ").append(restart);
+        if (compileTime != null) {
+            done.append(", \"compile_time\": ").append(compileTime);
+        }
+        emit(done.append("}").toString());
+        return restart;
+    }
+
+    static void runMain(ClassLoader loader, String className, Map<String, byte[]> classes, Run run) {
+        Method method;
+        try {
+            method = loader.loadClass(className).getMethod("main", String[].class);
+            if (!Modifier.isStatic(method.getModifiers())) {
+                throw new NoSuchMethodException();
+            }
+        } catch (ClassNotFoundException | NoSuchMethodException e) {
+            System.err.println("Error: Main method not found in class " + className + ", please define the main method as:");
+            System.err.println("   public static void main(String[] args)");
+            run.returncode = 1;
+            return;
+        }
+
+        try {
+            method.invoke(null, (Object) new String[0]);
+        } catch (InvocationTargetException e) {
+            Throwable error = e.getCause();
+            if (error instanceof OutputLimitError) {
+                return;
+            }
+            hideWorkerFrames(error, classes);
+            System.err.print("Exception in thread \"main\" ");
+            error.printStackTrace();
+            run.returncode = 1;
+        } catch (IllegalAccessException e) {
+            System.err.println("Error: Main method of class " + className + " is not public");
+            run.returncode = 1;
+        }
+    }
+
+    /** Cut the reflection and worker frames below the program's main method */
+    static void hideWorkerFrames(Throwable error, Map<String, byte[]> classes) {
+        StackTraceElement[] frames = error.getStackTrace();
+        int end = frames.length;
+        while (end > 0 && !classes.containsKey(frames[end - 1].getClassName())) {
+            end--;
+        }
+        if (end > 0) {
+            error.setStackTrace(Arrays.copyOf(frames, end));
+        }
+    }
+
+    static Thread firstLiveThread(ThreadGroup group) {
+        Thread[] threads = new Thread[group.activeCount() + 8];
+        int count = group.enumerate(threads, true);
+        for (int i = 0; i < count; i++) {
+            if (threads[i].isAlive() && !threads[i].isDaemon()) {
+                return threads[i];
+            }
+        }
+        return null;
+    }
+
+    static Map<String, byte[]> compile(String className, String code, List<String> flags, StringWriter errors) {
+        JavaFileObject source = new SimpleJavaFileObject(URI.create("string:///" + className + ".java"), JavaFileObject.Kind.SOURCE) {
+            @Override
+            public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+                return code;
+            }
+
+            @Override
+            public String getName() {
+                return className + ".java";
+            }
+
+            @Override
+            public String toString() {
+                return getName();
+            }
+        };
+
+        StandardJavaFileManager standard = compiler.getStandardFileManager(null, null, StandardCharsets.UTF_8);
+        MemoryFileManager files = new MemoryFileManager(standard);
+        boolean ok = compiler.getTask(errors, files, null, flags, null, List.of(source)).call();
+        if (!ok) {
+            return null;
+        }
+        Map<String, byte[]> classes = new HashMap<>();
+        for (Map.Entry<String, ByteArrayOutputStream> entry : files.outputs.entrySet()) {
+            classes.put(entry.getKey(), entry.getValue().toByteArray());
+        }
+        return classes;
+    }
+
+    /** State of the running program shared by its output streams */
+    static class Run {
+        final long maxOutput;
+        long size = 0;
+        volatile boolean truncated = false;
+        volatile int returncode = 0;
+
+        Run(long maxOutput) {
+            this.maxOutput = maxOutput;
+        }
+    }
+
+    /** Thrown into the program once it has written too much output */
+    static class OutputLimitError extends Error {
+        OutputLimitError() {
+            super("Output limit exceeded");
+        }
+    }
+
+    /** Forwards program output as protocol messages, keeping UTF-8 sequences whole */
+    static class JobOutput extends OutputStream {
+        final Run run;
+        final String stream;
+        final ByteArrayOutputStream pending = new ByteArrayOutputStream();
+
+        JobOutput(Run run, String stream) {
+            this.run = run;
+            this.stream = stream;
+        }
+
+        @Override
+        public void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public void write(byte[] b, int off, int len) {
+            synchronized (run) {
+                if (run.truncated) {
+                    throw new OutputLimitError();
+                }
+                if (run.size + len > run.maxOutput) {
+                    len = (int) (run.maxOutput - run.size);
+                    run.truncated = true;
+                }
+                run.size += len;
+                pending.write(b, off, len);
+                if (run.truncated) {
+                    send(pending.size());
+                    throw new OutputLimitError();
+                }
+            }
+        }
+
+        @Override
+        public void flush() {
+            synchronized (run) {
+                send(completeLength(pending.toByteArray()));
+            }
+        }
+
+        void send(int length) {
+            if (length == 0) {
+                return;
+            }
+            byte[] bytes = pending.toByteArray();
+            String text = new String(bytes, 0, length, StandardCharsets.UTF_8);
+            pending.reset();
+            pending.write(bytes, length, bytes.length - length);
+            emit("{\"stream\": \"" + stream + "\", \"data\": " + Json.quote(text) + "}");
+        }
+
+        /** Length of the prefix that does not end inside a UTF-8 sequence */
+        static int completeLength(byte[] bytes) {
+            int length = bytes.length;
+            for (int i = length - 1; i >= 0 && i >= length - 4; i--) {
+                int b = bytes[i] & 0xFF;
+                if ((b & 0xC0) == 0x80) {
+                    continue;
+                }
+                int needed = b >= 0xF0 ? 4 : b >= 0xE0 ? 3 : b >= 0xC0 ? 2 : 1;
+                return length - i >= needed ? length : i;
+            }
+            return length;
+        }
+    }
+
+    /** Defines the classes of one submission, only the JDK is visible to them */
+    static class MemoryClassLoader extends ClassLoader {
+        final Map<String, byte[]> classes;
+
+        MemoryClassLoader(Map<String, byte[]> classes) {
+            super(ClassLoader.getPlatformClassLoader());
+            this.classes = classes;
+        }
+
+        @Override
+        protected Class<?> findClass(String name) throws ClassNotFoundException {
+            byte[] bytes = classes.get(name);
+            if (bytes == null) {
+                throw new ClassNotFoundException(name);
+            }
+            return defineClass(name, bytes, 0, bytes.length);
+        }
+    }
+
+    /** Keeps the compiler's class files in memory */
+    static class MemoryFileManager extends ForwardingJavaFileManager<StandardJavaFileManager> {
+        final Map<String, ByteArrayOutputStream> outputs = new HashMap<>();
+
+        MemoryFileManager(StandardJavaFileManager standard) {
+            super(standard);
+        }
+
+        @Override
+        public JavaFileObject getJavaFileForOutput(Location location, String className, JavaFileObject.Kind kind, FileObject sibling) {
+            return new SimpleJavaFileObject(URI.create("memory:///" + className.replace('.', '/') + kind.extension), kind) {
+                @Override
+                public OutputStream openOutputStream() {
+                    ByteArrayOutputStream output = new ByteArrayOutputStream();
+                    outputs.put(className, output);
+                    return output;
+                }
+            };
+        }
+    }
+
+    /** The subset of JSON the job protocol needs */
+    static class Json {
+        final String text;
+        int pos = 0;
+
+        Json(String text) {
+            this.text = text;
+        }
+
+        @SuppressWarnings("unchecked")
+        static Map<String, Object> parseObject(String text) {
+            return (Map<String, Object>) new Json(text).value();
+        }
+
+        static String quote(String value) {
+            StringBuilder quoted = new StringBuilder("\"");
+            for (int i = 0; i < value.length(); i++) {
+                char c = value.charAt(i);
+                switch (c) {
+                    case '"': quoted.append("\\\""); break;
+                    case '\\': quoted.append("\\\\"); break;
+                    case '\n': quoted.append("\\n"); break;
+                    case '\r': quoted.append("\\r"); break;
+                    case '\t': quoted.append("\\t"); break;
+                    default:
+                        if (c < 0x20) {
+                            quoted.append(String.format("\\u%04x", (int) c));
+                        } else {
+                            quoted.append(c);
+                        }
+                }
+            }
+            return quoted.append('"').toString();
+        }
+
+        void skipWhitespace() {
+            while (pos < text.length() && Character.isWhitespace(text.charAt(pos))) {
+                pos++;
+            }
+        }
+
+        Object value() {
+            skipWhitespace();
+            char c = text.charAt(pos);
+            if (c == '{') {
+                Map<String, Object> object = new HashMap<>();
+                pos++;
+                skipWhitespace();
+                if (text.charAt(pos) == '}') {
+                    pos++;
+                    return object;
+                }
+                while (true) {
+                    skipWhitespace();
+                    String name = string();
+                    skipWhitespace();
+                    pos++;  // ':'
+                    object.put(name, value());
+                    skipWhitespace();
+                    if (text.charAt(pos++) == '}') {
+                        return object;
+                    }
+                }
+            }
+            if (c == '[') {
+                List<Object> array = new ArrayList<>();
+                pos++;
+                skipWhitespace();
+                if (text.charAt(pos) == ']') {
+                    pos++;
+                    return array;
+                }
+                while (true) {
+                    array.add(value());
+                    skipWhitespace();
+                    if (text.charAt(pos++) == ']') {
+                        return array;
+                    }
+                }
+            }
+            if (c == '"') {
+                return string();
+            }
+            if (text.startsWith("true", pos)) {
+                pos += 4;
+                return Boolean.TRUE;
+            }
+            if (text.startsWith("false", pos)) {
+                pos += 5;
+                return Boolean.FALSE;
+            }
+            if (text.startsWith("null", pos)) {
+                pos += 4;
+                return null;
+            }
+            int start = pos;
+            while (pos < text.length() && "+-0123456789.eE".indexOf(text.charAt(pos)) >= 0) {
+                pos++;
+            }
+            return Double.parseDouble(text.substring(start, pos));
+        }
+
+        String string() {
+            StringBuilder value = new StringBuilder();
+            pos++;  // opening quote
+            while (true) {
+                char c = text.charAt(pos++);
+                if (c == '"') {
+                    return value.toString();
+                }
+                if (c != '\\') {
+                    value.append(c);
+                    continue;
+                }
+                char escaped = text.charAt(pos++);
+                switch (escaped) {
+                    case 'n': value.append('\n'); break;
+                    case 'r': value.append('\r'); break;
+                    case 't': value.append('\t'); break;
+                    case 'b': value.append('\b'); break;
+                    case 'f': value.append('\f'); break;
+                    case 'u':
+                        value.append((char) Integer.parseInt(text.substring(pos, pos + 4), 16));
+                        pos += 4;
+                        break;
+                    default: value.append(escaped);
+                }
+            }
+        }
+    }
+}
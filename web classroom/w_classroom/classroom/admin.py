@@ -1,8 +1,29 @@
 from django.contrib import admin
-from .models import CodeSession
+from .models import CodeSession, CodeSnapshot, RoomBan, RoomMute
+
+
+class RoomBanInline(admin.TabularInline):
+    model = RoomBan
+    extra = 0
+    readonly_fields = ['created_at']
+
+
+class RoomMuteInline(admin.TabularInline):
+    model = RoomMute
+    extra = 0
+    readonly_fields = ['created_at']
+
 
 @admin.register(CodeSession)
 class CodeSessionAdmin(admin.ModelAdmin):
     list_display = ['session_id', 'language', 'created_at', 'updated_at']
     search_fields = ['session_id']
     readonly_fields = ['created_at', 'updated_at']
+    inlines = [RoomBanInline, RoomMuteInline]
+
+
+@admin.register(CodeSnapshot)
+class CodeSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['session', 'version', 'created_at']
+    search_fields = ['session__session_id']
+    readonly_fields = ['created_at']
@@ -0,0 +1,188 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+
+from django.conf import settings
+
+# Get logger
+logger = logging.getLogger('classroom.execution')
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_version(compiler):
+    """Return the version banner of a compiler, raises FileNotFoundError if missing"""
+    result = subprocess.run(
+        [compiler, '--version'],
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+    banner = (result.stdout or result.stderr).strip()
+    return banner.splitlines()[0] if banner else compiler
+
+
+class CompileCache:
+    """Content-addressed cache of compiled programs with size-bounded LRU eviction
+
+    Every entry is a directory named after the hash of the source, language,
+    compiler version and flags. Entries are published with an atomic rename
+    and their mtime is refreshed on every hit, so eviction removes the least
+    recently used builds first. Runs never use an entry in place: a hit links
+    its files into the run's own directory, so an entry may be evicted while
+    programs built from it are still running.
+
+    The cache directory is created private to the server's user; an existing
+    one owned by another user or open to others is refused.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ensure_private_directory()
+
+    def _ensure_private_directory(self):
+        try:
+            os.makedirs(self.directory, mode=0o700)
+        except FileExistsError:
+            pass
+
+        info = os.lstat(self.directory)
+        if not stat.S_ISDIR(info.st_mode):
+            raise PermissionError(f"Compile cache {self.directory} is not a directory")
+        if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+            raise PermissionError(f"Compile cache {self.directory} is owned by another user")
+        if os.name == 'posix' and info.st_mode & 0o077:
+            raise PermissionError(f"Compile cache {self.directory} is accessible to other users")
+
+    def make_key(self, language, code, version, flags, source_name):
+        payload = json.dumps([language, version, list(flags), source_name, code])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, language, target_dir):
+        """Link the files of a cached build into target_dir, returns whether one was found"""
+        path = self._entry_path(key)
+        linked = []
+        try:
+            os.utime(path)
+            for name in os.listdir(path):
+                target = os.path.join(target_dir, name)
+                _link_or_copy(os.path.join(path, name), target)
+                linked.append(target)
+            found = True
+        except OSError:
+            # Missing, or evicted while being linked
+            for target in linked:
+                os.unlink(target)
+            found = False
+
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            hits, misses = self.hits, self.misses
+
+        logger.info(f"Compile cache {'hit' if found else 'miss'} for {language} (hits: {hits}, misses: {misses})")
+        return found
+
+    def put(self, key, build_dir, exclude=()):
+        """Store the files of build_dir and return the cached entry directory"""
+        path = self._entry_path(key)
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+        try:
+            for name in os.listdir(build_dir):
+                if name in exclude:
+                    continue
+                shutil.copy2(os.path.join(build_dir, name), os.path.join(staging, name))
+            try:
+                os.rename(staging, path)
+            except OSError:
+                # Another run published the same build first
+                shutil.rmtree(staging, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep=None):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            if path == keep:
+                continue
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+                )
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+            total += size
+
+        if keep is not None:
+            total += sum(os.path.getsize(os.path.join(keep, f)) for f in os.listdir(keep))
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logger.debug(f"Evicted compiled program {os.path.basename(path)[:12]} ({size} bytes)")
+
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        # Different filesystem or no hard link support
+        shutil.copy2(source, target)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_compile_cache():
+    """Return the shared compile cache, or None when caching is disabled"""
+    global _cache
+
+    max_bytes = getattr(settings, 'CLASSROOM_COMPILE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    if max_bytes <= 0:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                directory = getattr(
+                    settings,
+                    'CLASSROOM_COMPILE_CACHE_DIR',
+                    os.path.join(tempfile.gettempdir(), 'w_classroom_compile_cache')
+                )
+                try:
+                    _cache = CompileCache(directory, max_bytes)
+                except OSError as e:
+                    logger.warning(f"Compile cache disabled: {e}")
+                    _cache = False
+    return _cache or None
@@ -1,18 +1,51 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json
+from django.conf import settings
+import asyncio
 import logging
 
+from .documents import OperationError, compose, normalize
+from .lobby import invalidate_lobby
+from .metrics import CONNECTED_SOCKETS, MESSAGE_DURATION, MESSAGES, count_db_calls
+from .participant_counts import get_participant_counts
+from .persistence import get_code_persister
+from .protocol import COMPACT_SUBPROTOCOL, decode, encode
+from .rate_limit import TokenBucket, take_tokens, throttle_counts
+from .room_state import acquire_room_state, release_room_state
+from .room_store import get_room_store
+
 # Get logger
 logger = logging.getLogger('classroom.websocket')
 
-# Store participants per room with additional info
-# Structure: {session_id: {'owner': 'username', 'users': {'username': {'ip': 'ip_address', 'channel': 'channel_name'}}}}
-room_participants = {}
-
 class CodeConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for real-time code collaboration"""
     
+    # Message types reported in metrics, anything else is counted as 'other'
+    MESSAGE_TYPES = frozenset({
+        'code_delta', 'code_update', 'sync_request', 'language_update', 'output_update',
+        'kick_user', 'mute_user', 'unmute_user', 'ban_user', 'close_room',
+    })
+    # Tries to leave a room whose lock stays busy
+    LEAVE_ATTEMPTS = 3
+    # Editor messages held back over the rate limits, one per type
+    DEFERRED_TYPES = frozenset({'code_delta', 'code_update', 'language_update', 'output_update'})
+    
     async def connect(self):
+        self.room_state = None
+        self.joined = False
+        # Clients offering the compact subprotocol get short type codes
+        self.compact = COMPACT_SUBPROTOCOL in self.scope.get('subprotocols', [])
+        # This connection's view of the room, kept up to date from join and leave diffs
+        self.participants = []
+        self.owner = None
+        self.store = get_room_store()
+        self.message_bucket = TokenBucket(
+            getattr(settings, 'CLASSROOM_CONNECTION_MESSAGE_RATE', 20),
+            getattr(settings, 'CLASSROOM_CONNECTION_MESSAGE_BURST', 40),
+        )
+        # Room messages held back by the rate limits, latest per type
+        self.deferred = {}
+        self.deferred_handle = None
+        self.throttled = 0
         self.session_id = self.scope['url_route']['kwargs']['session_id']
         self.room_group_name = f'code_{self.session_id}'
         self.username = self.scope.get('session', {}).get('username', 'Anonymous')
@@ -25,20 +58,14 @@ class CodeConsumer(AsyncWebsocketConsumer):
         
         logger.info(f"WebSocket connection initiated - User: {self.username}, Session: {self.session_id}, IP: {self.ip_address}")
         
-        # Check if IP is banned
-        from channels.db import database_sync_to_async
-        from classroom.models import CodeSession
-        
-        @database_sync_to_async
-        def check_banned():
-            try:
-                session = CodeSession.objects.get(session_id=self.session_id)
-                return self.ip_address in session.get_banned_ips()
-            except CodeSession.DoesNotExist:
-                return False
+        # Load the room's cached state, the database is only read on first join
+        self.room_state = await acquire_room_state(self.session_id)
         
-        if await check_banned():
+        # Check if IP is banned
+        if self.ip_address in self.room_state.banned_ips:
             logger.warning(f"Banned IP {self.ip_address} attempted to connect to session {self.session_id}")
+            release_room_state(self.room_state)
+            self.room_state = None
             await self.close()
             return
         
@@ -48,204 +75,402 @@ class CodeConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
-        
-        # Initialize room if it doesn't exist
-        if self.session_id not in room_participants:
-            room_participants[self.session_id] = {'owner': self.username, 'users': {}}
+        await self.accept(COMPACT_SUBPROTOCOL if self.compact else None)
         
-        # Add participant to room
-        if self.username not in room_participants[self.session_id]['users']:
-            room_participants[self.session_id]['users'][self.username] = {
+        # Add participant to the room, the first one becomes the owner
+        try:
+            participants, owner = await self.store.join(self.session_id, self.username, {
                 'ip': self.ip_address,
                 'channel': self.channel_name
-            }
+            })
+        except OperationError as e:
+            # The room stayed locked, the client reconnects
+            logger.warning(f"Could not add {self.username} to session {self.session_id}: {e}")
+            await self.close()
+            return
+        self.joined = True
+        CONNECTED_SOCKETS.inc()
         
         # Update database participant count
-        await self.update_participant_count()
+        await self.update_participant_count(len(participants))
         
-        logger.info(f"User {self.username} joined session {self.session_id}. Total participants: {len(room_participants[self.session_id]['users'])}")
+        # Late joiners and reconnecting clients start from a full snapshot
+        await self.store.open_document(self.session_id, self.room_state.code)
+        await self.send_snapshot()
         
-        # Broadcast updated participant list
+        logger.info(f"User {self.username} joined session {self.session_id}. Total participants: {len(participants)}")
+        
+        # The newcomer gets the full list, everyone else only the change
+        self.participants, self.owner = list(participants), owner
+        await self.send_participants()
         await self.channel_layer.group_send(
             self.room_group_name,
             {
-                'type': 'participants_update',
-                'participants': list(room_participants[self.session_id]['users'].keys()),
-                'owner': room_participants[self.session_id]['owner']
+                'type': 'participant_joined',
+                'username': self.username,
+                'owner': owner
             }
         )
     
     async def disconnect(self, close_code):
         logger.info(f"WebSocket disconnecting - User: {self.username}, Session: {self.session_id}, Code: {close_code}")
         
-        # Check if user was the owner
-        was_owner = False
-        if self.session_id in room_participants:
-            was_owner = room_participants[self.session_id]['owner'] == self.username
-            
-            # Remove participant from room
-            if self.username in room_participants[self.session_id]['users']:
-                del room_participants[self.session_id]['users'][self.username]
-            
-            if not room_participants[self.session_id]['users']:
-                # Room is empty, clean up
-                del room_participants[self.session_id]
+        if self.deferred_handle is not None:
+            self.deferred_handle.cancel()
+        self.deferred.clear()
+        if self.throttled:
+            logger.info(f"User {self.username} had {self.throttled} messages throttled in session {self.session_id}")
+        
+        left = None
+        if self.joined:
+            self.joined = False
+            CONNECTED_SOCKETS.dec()
+            left = await self.leave_room()
+        
+        if left is not None:
+            participants, owner, owner_changed = left
+            if not participants:
                 logger.info(f"Session {self.session_id} now empty, removed from active rooms")
+                
+                # Last one out saves the code
+                try:
+                    final = await self.store.close_document(self.session_id)
+                except OperationError as e:
+                    # Left open, the next participant picks it up again
+                    logger.error(f"Could not close the document of session {self.session_id}: {e}")
+                    final = None
+                if final is not None:
+                    # Someone reconnecting while the save runs reopens this
+                    # text, not the code read when the room was first joined
+                    self.room_state.code = final['code']
+                    await get_code_persister().save_final(self.session_id, final)
+            elif self.username in participants:
+                # Still connected elsewhere, e.g. from another tab
+                logger.info(f"User {self.username} closed one of their connections to session {self.session_id}")
             else:
-                # Transfer ownership if owner left
-                if was_owner:
-                    # Give ownership to the next person
-                    new_owner = next(iter(room_participants[self.session_id]['users'].keys()))
-                    room_participants[self.session_id]['owner'] = new_owner
-                    logger.info(f"Ownership of session {self.session_id} transferred to {new_owner}")
+                if owner_changed:
+                    logger.info(f"Ownership of session {self.session_id} transferred to {owner}")
                 
-                # Broadcast updated participant list
+                # Broadcast the change to the participant list
                 await self.channel_layer.group_send(
                     self.room_group_name,
                     {
-                        'type': 'participants_update',
-                        'participants': list(room_participants[self.session_id]['users'].keys()),
-                        'owner': room_participants[self.session_id]['owner']
+                        'type': 'participant_left',
+                        'username': self.username,
+                        'owner': owner
                     }
                 )
-                logger.info(f"User {self.username} left session {self.session_id}. Remaining participants: {len(room_participants[self.session_id]['users'])}")
-        
-        # Update database participant count
-        await self.update_participant_count()
+                logger.info(f"User {self.username} left session {self.session_id}. Remaining participants: {len(participants)}")
+            
+            # Update database participant count
+            await self.update_participant_count(len(participants))
         
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        
+        if self.room_state is not None:
+            release_room_state(self.room_state)
+            self.room_state = None
+    
+    async def leave_room(self):
+        """Remove this connection from the room, returns (participants, owner, owner_changed) or None"""
+        for attempt in range(1, self.LEAVE_ATTEMPTS + 1):
+            try:
+                # Ownership passes to the next person
+                return await self.store.leave(self.session_id, self.username, self.channel_name)
+            except OperationError as e:
+                logger.warning(f"Could not remove {self.username} from session {self.session_id} (attempt {attempt}): {e}")
+        logger.error(f"Gave up removing {self.username} from session {self.session_id}")
+        return None
     
     async def receive(self, text_data):
         """Receive message from WebSocket"""
         try:
-            data = json.loads(text_data)
+            data = decode(text_data)
             message_type = data.get('type', 'unknown')
             logger.debug(f"Received message from {self.username} in session {self.session_id}: type={message_type}")
             
-            # Handle management commands
-            if message_type == 'kick_user':
-                await self.handle_kick_user(data)
-            elif message_type == 'mute_user':
-                await self.handle_mute_user(data)
-            elif message_type == 'unmute_user':
-                await self.handle_unmute_user(data)
-            elif message_type == 'ban_user':
-                await self.handle_ban_user(data)
-            elif message_type == 'close_room':
-                await self.handle_close_room()
-            else:
-                # Check if user is muted before allowing code updates
-                if message_type == 'code_update':
-                    from channels.db import database_sync_to_async
-                    from classroom.models import CodeSession
-                    
-                    @database_sync_to_async
-                    def is_muted():
-                        try:
-                            session = CodeSession.objects.get(session_id=self.session_id)
-                            return self.username in session.get_muted_users()
-                        except CodeSession.DoesNotExist:
-                            return False
-                    
-                    if await is_muted():
+            label = message_type if message_type in self.MESSAGE_TYPES else 'other'
+            MESSAGES.inc(type=label)
+            
+            with MESSAGE_DURATION.time(type=label):
+                # Handle management commands
+                if message_type == 'kick_user':
+                    await self.handle_kick_user(data)
+                elif message_type == 'mute_user':
+                    await self.handle_mute_user(data)
+                elif message_type == 'unmute_user':
+                    await self.handle_unmute_user(data)
+                elif message_type == 'ban_user':
+                    await self.handle_ban_user(data)
+                elif message_type == 'close_room':
+                    await self.handle_close_room()
+                elif message_type == 'sync_request':
+                    await self.send_snapshot()
+                else:
+                    # Check if user is muted before allowing code updates
+                    if message_type in ('code_delta', 'code_update') and self.username in self.room_state.muted_users:
                         logger.warning(f"Muted user {self.username} attempted to update code in session {self.session_id}")
+                        # Roll the client back to the shared text
+                        await self.send_snapshot()
                         return
-                
-                # Broadcast to room group
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'code_message',
-                        'data': data
-                    }
-                )
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON received from {self.username}: {e}")
+                    
+                    await self.throttle(data)
+        except ValueError as e:
+            logger.error(f"Invalid message received from {self.username}: {e}")
         except Exception as e:
             logger.error(f"Error processing message from {self.username}: {e}", exc_info=True)
     
+    async def throttle(self, data):
+        """Send a room message now, or hold it back until the rate limits allow"""
+        if self.deferred_handle is None and take_tokens(self.message_bucket, self.room_state.broadcasts):
+            await self.send_room_message(data)
+            return
+        
+        self.throttled += 1
+        message_type = data.get('type')
+        if message_type not in self.DEFERRED_TYPES:
+            # Holding arbitrary types would let a client grow the queue without bound
+            throttle_counts['dropped'] += 1
+            logger.warning(f"Dropped {message_type!r} message over the rate limit from {self.username} in session {self.session_id}")
+            return
+        held = self.deferred.get(message_type)
+        if held is None:
+            throttle_counts['deferred'] += 1
+            self.deferred[message_type] = data
+        elif message_type == 'code_delta':
+            # Clients wait for the acknowledgement before sending the next
+            # edit, one that did not is merged into the held edit
+            try:
+                if held.get('version') != data.get('version'):
+                    raise OperationError("edit is not based on the held edit")
+                held['op'] = compose(normalize(held.get('op')), normalize(data.get('op')))
+                throttle_counts['coalesced'] += 1
+            except OperationError as e:
+                logger.warning(f"Dropped held edits from {self.username} in session {self.session_id}: {e}")
+                throttle_counts['dropped'] += 2
+                del self.deferred[message_type]
+                await self.send_snapshot()
+        else:
+            # Only the latest state matters, e.g. the room's language
+            throttle_counts['coalesced'] += 1
+            self.deferred[message_type] = data
+        
+        self.schedule_deferred()
+    
+    def schedule_deferred(self):
+        if self.deferred_handle is not None or not self.deferred:
+            return
+        wait = max(self.message_bucket.wait_time(), self.room_state.broadcasts.wait_time())
+        loop = asyncio.get_running_loop()
+        self.deferred_handle = loop.call_later(wait, lambda: loop.create_task(self.send_deferred()))
+    
+    async def send_deferred(self):
+        """Send held messages in arrival order as far as the rate limits allow"""
+        try:
+            while self.joined and self.deferred and take_tokens(self.message_bucket, self.room_state.broadcasts):
+                message_type = next(iter(self.deferred))
+                await self.send_room_message(self.deferred.pop(message_type))
+        except Exception as e:
+            logger.error(f"Error sending held messages from {self.username}: {e}", exc_info=True)
+        finally:
+            self.deferred_handle = None
+        if self.joined:
+            self.schedule_deferred()
+    
+    async def send_room_message(self, data):
+        """Apply an edit or broadcast a message to the room"""
+        if data.get('type') in ('code_delta', 'code_update'):
+            await self.handle_code_edit(data)
+            return
+        
+        # Broadcast to room group
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'code_message',
+                'data': data
+            }
+        )
+    
+    async def handle_code_edit(self, data):
+        """Apply an edit to the shared document and broadcast it as a delta"""
+        try:
+            if data['type'] == 'code_update':
+                # Full-text update from an old client, applied as a replace
+                op, version = await self.store.replace_text(self.session_id, data.get('code', ''))
+            else:
+                op, version = await self.store.apply_edit(self.session_id, data.get('version'), data.get('op'))
+        except OperationError as e:
+            logger.warning(f"Rejected edit from {self.username} in session {self.session_id}: {e}")
+            await self.send_snapshot()
+            return
+        
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'code_delta',
+                'op': op,
+                'version': version,
+                'username': self.username,
+                'sender': self.channel_name
+            }
+        )
+        
+        # Saved to the database once the room goes quiet
+        get_code_persister().schedule(self.session_id, self.store)
+    
+    async def send_snapshot(self):
+        """Send the full document to this client"""
+        snapshot = await self.store.snapshot(self.session_id)
+        if snapshot is None:
+            logger.warning(f"Document of session {self.session_id} is not open, no snapshot sent to {self.username}")
+            return
+        
+        await self.send_message({
+            'type': 'code_snapshot',
+            **snapshot
+        })
+    
+    async def code_delta(self, event):
+        """Forward an edit to the room, the author only gets an acknowledgement"""
+        if event['sender'] == self.channel_name:
+            await self.send_message({
+                'type': 'code_ack',
+                'version': event['version']
+            })
+            return
+        
+        await self.send_message({
+            'type': 'code_delta',
+            'op': event['op'],
+            'version': event['version'],
+            'username': event['username']
+        })
+    
     async def code_message(self, event):
         """Receive message from room group"""
         data = event['data']
         
         # Send message to WebSocket
-        await self.send(text_data=json.dumps(data))
+        await self.send_message(data)
+    
+    async def send_message(self, message):
+        """Send a message to this client in the encoding it negotiated"""
+        await self.send(text_data=encode(message, self.compact))
     
-    async def participants_update(self, event):
-        """Send updated participant list"""
-        await self.send(text_data=json.dumps({
+    async def send_participants(self):
+        """Send this connection's participant list in full"""
+        await self.send_message({
             'type': 'participants_update',
-            'participants': event['participants'],
-            'owner': event['owner']
-        }))
+            'participants': self.participants,
+            'owner': self.owner
+        })
     
-    async def update_participant_count(self):
-        """Update participant count in database"""
-        from channels.db import database_sync_to_async
-        from classroom.models import CodeSession
-        
-        @database_sync_to_async
-        def update_count():
-            try:
-                session = CodeSession.objects.get(session_id=self.session_id)
-                count = len(room_participants.get(self.session_id, {}).get('users', {}))
-                session.participant_count = count
-                session.save(update_fields=['participant_count'])
-                logger.debug(f"Updated participant count for session {self.session_id}: {count}")
-            except CodeSession.DoesNotExist:
-                logger.warning(f"Attempted to update participant count for non-existent session: {self.session_id}")
-            except Exception as e:
-                logger.error(f"Error updating participant count for session {self.session_id}: {e}", exc_info=True)
+    async def participant_joined(self, event):
+        """Add a participant to the list"""
+        if event['username'] in self.participants and event['owner'] == self.owner:
+            # Nothing changed, e.g. the newcomer itself, which got the full list
+            return
+        if event['username'] not in self.participants:
+            self.participants.append(event['username'])
+        self.owner = event['owner']
+        await self.send_participant_change(event)
+    
+    async def participant_left(self, event):
+        """Remove a participant from the list, ownership may have moved on"""
+        if event['username'] in self.participants:
+            self.participants.remove(event['username'])
+        self.owner = event['owner']
+        await self.send_participant_change(event)
+    
+    async def send_participant_change(self, event):
+        """Compact clients apply the change themselves, others get the whole list as before"""
+        if not self.compact:
+            await self.send_participants()
+            return
         
-        await update_count()
+        await self.send_message({
+            'type': event['type'],
+            'username': event['username'],
+            'owner': event['owner']
+        })
+    
+    async def execution_status(self, event):
+        """Tell the room that a queued run started"""
+        await self.send_message({
+            'type': 'execution_status',
+            'job_id': event['job_id'],
+            'status': event['status'],
+            'username': event['username']
+        })
+    
+    async def output_chunk(self, event):
+        """Stream a piece of program output while the run is in progress"""
+        await self.send_message({
+            'type': 'output_chunk',
+            'job_id': event['job_id'],
+            'stream': event['stream'],
+            'data': event['data']
+        })
+    
+    async def execution_result(self, event):
+        """Push the output of a finished run to the room"""
+        await self.send_message({
+            'type': 'execution_result',
+            'job_id': event['job_id'],
+            'output': event['output'],
+            'isError': event['isError'],
+            'limit': event.get('limit'),
+            'username': event['username']
+        })
+    
+    async def update_participant_count(self, count):
+        """Queue the participant count for the next batched database write
+
+        The lobby cache is invalidated once the count has been written, so
+        it never caches the count from before a join or leave.
+        """
+        get_participant_counts().set(self.session_id, count)
+    
+    async def is_owner(self):
+        """Whether this connection's user owns the room"""
+        _, owner = await self.store.members(self.session_id)
+        return owner == self.username
     
     async def handle_kick_user(self, data):
         """Kick a user from the room (owner only)"""
-        if room_participants[self.session_id]['owner'] != self.username:
+        if not await self.is_owner():
             logger.warning(f"Non-owner {self.username} attempted to kick user")
             return
         
         target_user = data.get('target_user')
-        if target_user and target_user in room_participants[self.session_id]['users']:
-            # Get the target user's channel name
-            target_channel = room_participants[self.session_id]['users'][target_user]['channel']
-            
-            # Send kick notification to target user
-            await self.channel_layer.send(
-                target_channel,
-                {
-                    'type': 'user_kicked'
-                }
-            )
+        target = await self.store.get_user(self.session_id, target_user) if target_user else None
+        if target:
+            # Send kick notification to every connection of the target user
+            for target_channel in target['channels']:
+                await self.channel_layer.send(
+                    target_channel,
+                    {
+                        'type': 'user_kicked'
+                    }
+                )
             
             logger.info(f"User {target_user} kicked from session {self.session_id} by owner {self.username}")
     
     async def handle_mute_user(self, data):
         """Mute a user's input (owner only)"""
-        if room_participants[self.session_id]['owner'] != self.username:
+        if not await self.is_owner():
             logger.warning(f"Non-owner {self.username} attempted to mute user")
             return
         
         target_user = data.get('target_user')
         if target_user:
-            from channels.db import database_sync_to_async
-            from classroom.models import CodeSession
-            
-            @database_sync_to_async
-            def mute_user():
-                try:
-                    session = CodeSession.objects.get(session_id=self.session_id)
-                    session.add_muted_user(target_user)
-                    session.save()
-                except CodeSession.DoesNotExist:
-                    pass
-            
-            await mute_user()
+            # Saved to the database in the background
+            self.room_state.mute(target_user)
             
             # Notify all users about the mute
             await self.channel_layer.group_send(
@@ -256,39 +481,18 @@ class CodeConsumer(AsyncWebsocketConsumer):
                 }
             )
             
-            # Broadcast updated participant list to refresh UI
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'participants_update',
-                    'participants': list(room_participants[self.session_id]['users'].keys()),
-                    'owner': room_participants[self.session_id]['owner']
-                }
-            )
-            
             logger.info(f"User {target_user} muted in session {self.session_id} by owner {self.username}")
     
     async def handle_unmute_user(self, data):
         """Unmute a user's input (owner only)"""
-        if room_participants[self.session_id]['owner'] != self.username:
+        if not await self.is_owner():
             logger.warning(f"Non-owner {self.username} attempted to unmute user")
             return
         
         target_user = data.get('target_user')
         if target_user:
-            from channels.db import database_sync_to_async
-            from classroom.models import CodeSession
-            
-            @database_sync_to_async
-            def unmute_user():
-                try:
-                    session = CodeSession.objects.get(session_id=self.session_id)
-                    session.remove_muted_user(target_user)
-                    session.save()
-                except CodeSession.DoesNotExist:
-                    pass
-            
-            await unmute_user()
+            # Saved to the database in the background
+            self.room_state.unmute(target_user)
             
             # Notify all users about the unmute
             await self.channel_layer.group_send(
@@ -299,56 +503,43 @@ class CodeConsumer(AsyncWebsocketConsumer):
                 }
             )
             
-            # Broadcast updated participant list to refresh UI
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'participants_update',
-                    'participants': list(room_participants[self.session_id]['users'].keys()),
-                    'owner': room_participants[self.session_id]['owner']
-                }
-            )
-            
             logger.info(f"User {target_user} unmuted in session {self.session_id} by owner {self.username}")
     
     async def handle_ban_user(self, data):
         """Ban a user's IP address (owner only)"""
-        if room_participants[self.session_id]['owner'] != self.username:
+        if not await self.is_owner():
             logger.warning(f"Non-owner {self.username} attempted to ban user")
             return
         
         target_user = data.get('target_user')
-        if target_user and target_user in room_participants[self.session_id]['users']:
-            target_ip = room_participants[self.session_id]['users'][target_user]['ip']
-            target_channel = room_participants[self.session_id]['users'][target_user]['channel']
-            
-            from channels.db import database_sync_to_async
-            from classroom.models import CodeSession
-            
-            @database_sync_to_async
-            def ban_ip():
-                try:
-                    session = CodeSession.objects.get(session_id=self.session_id)
-                    session.add_banned_ip(target_ip)
-                    session.save()
-                except CodeSession.DoesNotExist:
-                    pass
+        target = await self.store.get_user(self.session_id, target_user) if target_user else None
+        if target:
+            target_ip = target['ip']
             
-            await ban_ip()
-            
-            # Send kick notification to target user
-            await self.channel_layer.send(
-                target_channel,
+            # Saved to the database in the background
+            self.room_state.ban(target_ip)
+            await self.channel_layer.group_send(
+                self.room_group_name,
                 {
-                    'type': 'user_banned'
+                    'type': 'ip_banned',
+                    'ip': target_ip
                 }
             )
             
+            # Send kick notification to every connection of the target user
+            for target_channel in target['channels']:
+                await self.channel_layer.send(
+                    target_channel,
+                    {
+                        'type': 'user_banned'
+                    }
+                )
+            
             logger.info(f"User {target_user} (IP: {target_ip}) banned from session {self.session_id} by owner {self.username}")
     
     async def handle_close_room(self):
         """Close the room and redirect all users to lobby (owner only)"""
-        if room_participants[self.session_id]['owner'] != self.username:
+        if not await self.is_owner():
             logger.warning(f"Non-owner {self.username} attempted to close room")
             return
         
@@ -357,6 +548,7 @@ class CodeConsumer(AsyncWebsocketConsumer):
         from classroom.models import CodeSession
         
         @database_sync_to_async
+        @count_db_calls('delete_room')
         def delete_room():
             try:
                 session = CodeSession.objects.get(session_id=self.session_id)
@@ -366,6 +558,7 @@ class CodeConsumer(AsyncWebsocketConsumer):
                 pass
         
         await delete_room()
+        await invalidate_lobby()
         
         # Notify all users to redirect to lobby
         await self.channel_layer.group_send(
@@ -379,34 +572,41 @@ class CodeConsumer(AsyncWebsocketConsumer):
     
     async def user_kicked(self, event):
         """Handle being kicked from the room"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'kicked'
-        }))
+        })
         await self.close()
     
     async def user_banned(self, event):
         """Handle being banned from the room"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'banned'
-        }))
+        })
         await self.close()
     
+    async def ip_banned(self, event):
+        """Record a ban made through another worker"""
+        self.room_state.banned_ips.add(event['ip'])
+    
     async def user_muted(self, event):
         """Broadcast that a user was muted"""
-        await self.send(text_data=json.dumps({
+        # Keeps the cache of workers other than the owner's in step
+        self.room_state.muted_users.add(event['username'])
+        await self.send_message({
             'type': 'user_muted',
             'username': event['username']
-        }))
+        })
     
     async def user_unmuted(self, event):
         """Broadcast that a user was unmuted"""
-        await self.send(text_data=json.dumps({
+        self.room_state.muted_users.discard(event['username'])
+        await self.send_message({
             'type': 'user_unmuted',
             'username': event['username']
-        }))
+        })
     
     async def room_closed(self, event):
         """Handle room being closed"""
-        await self.send(text_data=json.dumps({
+        await self.send_message({
             'type': 'room_closed'
-        }))
+        })
@@ -0,0 +1,266 @@
+from collections import deque
+
+# Operations use the ot.js format: a list of components where a positive int
+# retains characters, a negative int deletes characters and a string inserts
+# text. Lengths are counted in UTF-16 code units so they match JavaScript
+# string indexes in the editor.
+
+
+class OperationError(Exception):
+    """Raised when an operation does not fit the document it is applied to"""
+
+
+def text_length(text):
+    """Length of a string in UTF-16 code units"""
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+
+def is_retain(component):
+    return isinstance(component, int) and component > 0
+
+
+def is_delete(component):
+    return isinstance(component, int) and component < 0
+
+
+def is_insert(component):
+    return isinstance(component, str)
+
+
+def _push(ops, component):
+    """Append a component, merging it with its neighbour when possible"""
+    if is_insert(component):
+        if not component:
+            return
+        if ops and is_insert(ops[-1]):
+            ops[-1] += component
+        elif ops and is_delete(ops[-1]):
+            # Inserts always go before deletes so equal operations look equal
+            if len(ops) > 1 and is_insert(ops[-2]):
+                ops[-2] += component
+            else:
+                ops.insert(len(ops) - 1, component)
+        else:
+            ops.append(component)
+    elif is_retain(component):
+        if ops and is_retain(ops[-1]):
+            ops[-1] += component
+        else:
+            ops.append(component)
+    elif is_delete(component):
+        if ops and is_delete(ops[-1]):
+            ops[-1] += component
+        else:
+            ops.append(component)
+
+
+def normalize(op):
+    """Validate an operation received from a client and merge its components"""
+    if not isinstance(op, list):
+        raise OperationError("operation must be a list")
+    normalized = []
+    for component in op:
+        if isinstance(component, bool) or not isinstance(component, (int, str)):
+            raise OperationError(f"invalid component {component!r}")
+        _push(normalized, component)
+    return normalized
+
+
+def base_length(op):
+    return sum(c if is_retain(c) else -c for c in op if not is_insert(c))
+
+
+def target_length(op):
+    return sum(c if is_retain(c) else text_length(c) for c in op if not is_delete(c))
+
+
+def apply(text, op):
+    """Apply an operation to a string"""
+    units = text.encode('utf-16-le', 'surrogatepass')
+    if base_length(op) * 2 != len(units):
+        raise OperationError("operation length does not match the document")
+
+    parts = []
+    index = 0
+    for component in op:
+        if is_retain(component):
+            parts.append(units[index:index + component * 2])
+            index += component * 2
+        elif is_insert(component):
+            parts.append(component.encode('utf-16-le', 'surrogatepass'))
+        else:
+            index -= component * 2
+    return b''.join(parts).decode('utf-16-le', 'surrogatepass')
+
+
+def transform(op1, op2):
+    """Transform two concurrent operations, returns (op1', op2')
+
+    apply(apply(text, op1), op2') == apply(apply(text, op2), op1')
+    """
+    if base_length(op1) != base_length(op2):
+        raise OperationError("concurrent operations must have the same base length")
+
+    prime1, prime2 = [], []
+    ops1, ops2 = iter(op1), iter(op2)
+    a, b = next(ops1, None), next(ops2, None)
+    while a is not None or b is not None:
+        if is_insert(a):
+            _push(prime1, a)
+            _push(prime2, text_length(a))
+            a = next(ops1, None)
+            continue
+        if is_insert(b):
+            _push(prime1, text_length(b))
+            _push(prime2, b)
+            b = next(ops2, None)
+            continue
+        if a is None or b is None:
+            raise OperationError("operation is too short")
+
+        if is_retain(a) and is_retain(b):
+            length = min(a, b)
+            _push(prime1, length)
+            _push(prime2, length)
+        elif is_delete(a) and is_delete(b):
+            length = min(-a, -b)
+        elif is_delete(a) and is_retain(b):
+            length = min(-a, b)
+            _push(prime1, -length)
+        else:
+            length = min(a, -b)
+            _push(prime2, -length)
+
+        a = _consume(a, length, ops1)
+        b = _consume(b, length, ops2)
+    return prime1, prime2
+
+
+def compose(op1, op2):
+    """Combine two consecutive operations into one"""
+    if target_length(op1) != base_length(op2):
+        raise OperationError("operations are not consecutive")
+
+    composed = []
+    ops1, ops2 = iter(op1), iter(op2)
+    a, b = next(ops1, None), next(ops2, None)
+    while a is not None or b is not None:
+        if is_delete(a):
+            _push(composed, a)
+            a = next(ops1, None)
+            continue
+        if is_insert(b):
+            _push(composed, b)
+            b = next(ops2, None)
+            continue
+        if a is None or b is None:
+            raise OperationError("operation is too short")
+
+        if is_retain(a) and is_retain(b):
+            length = min(a, b)
+            _push(composed, length)
+        elif is_insert(a) and is_delete(b):
+            length = min(text_length(a), -b)
+        elif is_insert(a) and is_retain(b):
+            length = min(text_length(a), b)
+            _push(composed, _slice_units(a, 0, length))
+        else:
+            length = min(a, -b)
+            _push(composed, -length)
+
+        a = _consume(a, length, ops1)
+        b = _consume(b, length, ops2)
+    return composed
+
+
+def diff(old, new):
+    """Single-edit operation turning old into new"""
+    old_units = old.encode('utf-16-le', 'surrogatepass')
+    new_units = new.encode('utf-16-le', 'surrogatepass')
+    old_len, new_len = len(old_units) // 2, len(new_units) // 2
+
+    prefix = 0
+    limit = min(old_len, new_len)
+    while prefix < limit and old_units[prefix * 2:prefix * 2 + 2] == new_units[prefix * 2:prefix * 2 + 2]:
+        prefix += 1
+    suffix = 0
+    while (suffix < limit - prefix and
+           old_units[(old_len - suffix - 1) * 2:(old_len - suffix) * 2] ==
+           new_units[(new_len - suffix - 1) * 2:(new_len - suffix) * 2]):
+        suffix += 1
+
+    op = []
+    _push(op, prefix)
+    _push(op, new_units[prefix * 2:(new_len - suffix) * 2].decode('utf-16-le', 'surrogatepass'))
+    _push(op, -(old_len - prefix - suffix))
+    _push(op, suffix)
+    return op
+
+
+def _slice_units(text, start, end):
+    units = text.encode('utf-16-le', 'surrogatepass')
+    return units[start * 2:end * 2].decode('utf-16-le', 'surrogatepass')
+
+
+def _consume(component, length, rest):
+    """Shorten a component by length units, or move to the next one"""
+    if is_insert(component):
+        if text_length(component) > length:
+            return _slice_units(component, length, text_length(component))
+    elif is_retain(component):
+        if component > length:
+            return component - length
+    elif component + length < 0:
+        return component + length
+    return next(rest, None)
+
+
+class SharedDocument:
+    """Authoritative copy of a room's code with a bounded edit history
+
+    The server orders all edits. A client sends an operation with the
+    version it was based on, the server transforms it against every
+    operation applied since then and broadcasts the result with the new
+    version. When two inserts land at the same position, the one the
+    server receives later goes first, on every client.
+    """
+
+    HISTORY_LIMIT = 1000  # operations kept for transforming late edits
+
+    def __init__(self, text='', version=0):
+        self.text = text
+        self.version = version
+        self.history = deque(maxlen=self.HISTORY_LIMIT)
+
+    def receive(self, base_version, op):
+        """Apply a client operation based on base_version
+
+        Returns (transformed operation, new version). Raises OperationError
+        when the operation is malformed or based on a version that is no
+        longer in the history; the client must then resync from a snapshot.
+        """
+        op = normalize(op)
+        if not isinstance(base_version, int) or isinstance(base_version, bool):
+            raise OperationError("missing base version")
+        if base_version > self.version:
+            raise OperationError(f"version {base_version} is ahead of the server ({self.version})")
+
+        missed = self.version - base_version
+        if missed > len(self.history):
+            raise OperationError(f"version {base_version} is too old to transform")
+
+        if missed:
+            for concurrent in list(self.history)[-missed:]:
+                op, _ = transform(op, concurrent)
+
+        self.text = apply(self.text, op)
+        self.version += 1
+        self.history.append(op)
+        return op, self.version
+
+    def replace(self, text):
+        """Replace the whole text, returns (operation, new version)"""
+        return self.receive(self.version, diff(self.text, text))
+
+    def snapshot(self):
+        return {'code': self.text, 'version': self.version}
@@ -1,32 +1,107 @@
+import codecs
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 import os
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .compile_cache import compiler_version, get_compile_cache
+from .metrics import COMPILE_DURATION
+from .sandbox import LIMIT_MESSAGES, SandboxProfile, detect_limit
+from .worker_pool import (
+    WorkerError, WorkerRejected, WorkerTimeout, WorkerUnavailable, get_java_pool, get_node_pool, get_python_pool
+)
 
 # Get logger
 logger = logging.getLogger('classroom.execution')
 
+# Programs using modules or the process object need a real Node.js process,
+# the warm host only provides plain JavaScript globals
+NODE_HOST_UNSUPPORTED = re.compile(
+    r'\b(require|process|module|exports|__dirname|__filename|Buffer)\b|^\s*import\b', re.MULTILINE
+)
+
+
+def normalize_output(text):
+    """Output as compared with an expected one, ignoring trailing whitespace"""
+    return '\n'.join(line.rstrip() for line in text.rstrip().splitlines())
+
+
+class OutputCollector:
+    """Collects program output up to a byte limit, forwarding chunks as they arrive"""
+    
+    def __init__(self, limit, on_output=None):
+        self.limit = limit
+        self.on_output = on_output
+        self.size = 0
+        self.truncated = False
+        self._parts = {'stdout': [], 'stderr': []}
+        self._lock = threading.Lock()
+    
+    def feed(self, stream, text):
+        """Add a chunk of output, return False once the limit is reached"""
+        with self._lock:
+            if self.truncated:
+                return False
+            encoded = text.encode('utf-8')
+            if self.size + len(encoded) > self.limit:
+                text = encoded[:self.limit - self.size].decode('utf-8', errors='ignore')
+                encoded = text.encode('utf-8')
+                self.truncated = True
+            self.size += len(encoded)
+            self._parts[stream].append(text)
+        
+        if text and self.on_output is not None:
+            self.on_output(stream, text)
+        return not self.truncated
+    
+    def text(self, stream):
+        return ''.join(self._parts[stream])
+
 
 class CodeExecutor:
     """Execute code in different programming languages"""
     
     TIMEOUT = 10  # seconds
+    MAX_OUTPUT_BYTES = 256 * 1024  # output beyond this is dropped and the program stopped
+    CHUNK_SIZE = 4096  # bytes read from a pipe at a time
+    
+    LANGUAGES = ('python', 'javascript', 'java', 'cpp', 'c')
+    
+    BATCH_PARALLELISM = 4  # test cases of one batch running at the same time
+    BATCH_OUTPUT_PREVIEW = 1000  # characters of output returned for a failed case
     
-    def execute(self, code, language):
-        """Execute code and return output"""
+    # Compiler flags, part of the compile cache key
+    C_FLAGS = ()
+    CPP_FLAGS = ()
+    JAVA_FLAGS = ()
+    
+    def __init__(self, on_output=None):
+        # Called with (stream, text) for every chunk of program output
+        self.on_output = on_output
+        self.sandbox = SandboxProfile.from_settings()
+        # Name of the sandbox limit that stopped the last run, if any
+        self.limit_hit = None
+    
+    def execute(self, code, language, stdin=''):
+        """Execute code and return output, stdin is the program's input"""
         logger.info(f"Executing {language} code (length: {len(code)} chars)")
         try:
             if language == 'python':
-                result = self._execute_python(code)
+                result = self._execute_python(code, stdin)
             elif language == 'javascript':
-                result = self._execute_javascript(code)
+                result = self._execute_javascript(code, stdin)
             elif language == 'java':
-                result = self._execute_java(code)
+                result = self._execute_java(code, stdin)
             elif language == 'cpp':
-                result = self._execute_cpp(code)
+                result = self._execute_cpp(code, stdin)
             elif language == 'c':
-                result = self._execute_c(code)
+                result = self._execute_c(code, stdin)
             else:
                 result = f"Language '{language}' is not supported yet."
                 logger.warning(f"Unsupported language requested: {language}")
@@ -37,8 +112,154 @@ class CodeExecutor:
             logger.error(f"Execution error for {language}: {e}", exc_info=True)
             return f"Execution Error: {str(e)}"
     
-    def _execute_python(self, code):
-        """Execute Python code"""
+    def _format_output(self, stdout, stderr, truncated=False, returncode=0):
+        """Combine program output the way it is shown in the output panel"""
+        output = stdout
+        if stderr:
+            output += "\n" + stderr
+        
+        self.limit_hit = detect_limit(returncode, stderr, truncated)
+        if truncated:
+            output += f"\n\n[Output truncated after {self.MAX_OUTPUT_BYTES} bytes]"
+            logger.warning(f"Program output truncated at {self.MAX_OUTPUT_BYTES} bytes")
+        elif self.limit_hit:
+            output += f"\n\nError: {LIMIT_MESSAGES[self.limit_hit]}."
+            logger.warning(f"Program stopped by sandbox limit: {self.limit_hit}")
+        
+        return output.strip() if output else "Code executed successfully with no output."
+    
+    def _timed_out(self):
+        self.limit_hit = 'timeout'
+        return "Error: Code execution timed out."
+    
+    def _run_on_host(self, pool, code, **job):
+        """Run code on a warm runtime host
+        
+        Returns the worker result, or None when the program never started
+        on a host and should run in a fresh process instead. A host failing
+        once the program started ends the run, running it again would
+        repeat its output.
+        """
+        try:
+            return pool.run(code, self.TIMEOUT, self.MAX_OUTPUT_BYTES, self.on_output, **job)
+        except (WorkerUnavailable, WorkerRejected) as e:
+            logger.warning(f"{pool.worker_class.name} host unavailable, falling back to a fresh process: {e}")
+            return None
+        except WorkerTimeout:
+            # The program blocked the host past its deadline, the pool replaced it
+            return {'timed_out': True}
+        except WorkerError as e:
+            logger.warning(f"{pool.worker_class.name} host failed during a run: {e}")
+            return {
+                'stdout': e.stdout,
+                'stderr': e.stderr + "\nError: The program's runtime stopped unexpectedly.",
+                'truncated': False,
+                'returncode': 1,
+                'timed_out': False,
+            }
+    
+    def _host_output(self, result):
+        if result['timed_out']:
+            return self._timed_out()
+        return self._format_output(result['stdout'], result['stderr'], result['truncated'], result['returncode'])
+    
+    def _run_program(self, command, sandbox=None, stdin='', timeout=None):
+        """Run a sandboxed program, streaming its output and keeping at most MAX_OUTPUT_BYTES
+        
+        The program runs in a private temporary directory under the rlimits
+        of the sandbox profile and reads stdin as its input. Returns a tuple
+        (collector, returncode), raises subprocess.TimeoutExpired.
+        """
+        sandbox = sandbox or self.sandbox
+        collector = OutputCollector(self.MAX_OUTPUT_BYTES, self.on_output)
+        with tempfile.TemporaryDirectory(prefix='run-') as workdir:
+            process = subprocess.Popen(
+                sandbox.wrap(command),
+                stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=workdir,
+                env=sandbox.environment(workdir),
+                start_new_session=os.name == 'posix'
+            )
+            readers = [
+                threading.Thread(target=self._pump, args=(process, process.stdout, 'stdout', collector), daemon=True),
+                threading.Thread(target=self._pump, args=(process, process.stderr, 'stderr', collector), daemon=True),
+            ]
+            if stdin:
+                # Written from a thread, a program that never reads its input must not block us
+                readers.append(threading.Thread(target=self._feed, args=(process.stdin, stdin), daemon=True))
+            for reader in readers:
+                reader.start()
+            
+            try:
+                process.wait(timeout=timeout or self.TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self._kill(process)
+                process.wait()
+                raise
+            finally:
+                # Children left behind by the program must not outlive the run
+                self._kill(process)
+                for reader in readers:
+                    reader.join(timeout=1)
+        
+        return collector, process.returncode
+    
+    def _kill(self, process):
+        """Kill a program together with any process it started"""
+        try:
+            if os.name == 'posix':
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    def _feed(self, pipe, stdin):
+        try:
+            pipe.write(stdin.encode('utf-8'))
+            pipe.close()
+        except (BrokenPipeError, OSError):
+            # The program exited or closed its input early
+            pass
+    
+    def _pump(self, process, pipe, stream, collector):
+        """Forward one pipe to the collector chunk by chunk"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = pipe.read1(self.CHUNK_SIZE)
+            if not chunk:
+                collector.feed(stream, decoder.decode(b'', final=True))
+                return
+            if not collector.feed(stream, decoder.decode(chunk)):
+                # Output limit reached, stop the program instead of buffering more
+                self._kill(process)
+                return
+    
+    def _execute_python(self, code, stdin=''):
+        """Execute Python code on a warm pooled worker when available"""
+        pool = get_python_pool()
+        if pool is None:
+            return self._execute_python_subprocess(code, stdin)
+        
+        with tempfile.TemporaryDirectory(prefix='run-') as workdir:
+            result = self._run_on_host(pool, code, limits=self.sandbox.rlimits(), workdir=workdir, stdin=stdin)
+        if result is None:
+            return self._execute_python_subprocess(code, stdin)
+        
+        if result['timed_out']:
+            logger.warning("Python code execution timed out")
+            return self._timed_out()
+        
+        if result['stderr'] and result['returncode'] != 0 and not result['truncated']:
+            logger.warning(f"Python code executed with errors (return code: {result['returncode']})")
+        
+        return self._format_output(result['stdout'], result['stderr'], result['truncated'], result['returncode'])
+    
+    def _execute_python_subprocess(self, code, stdin=''):
+        """Execute Python code in a fresh interpreter"""
+        temp_file = None
         try:
             with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
                 f.write(code)
@@ -46,182 +267,276 @@ class CodeExecutor:
             
             logger.debug(f"Created temporary Python file: {temp_file}")
             
-            result = subprocess.run(
-                [sys.executable, temp_file],
-                capture_output=True,
-                text=True,
-                timeout=self.TIMEOUT
-            )
-            
-            os.unlink(temp_file)
+            collector, returncode = self._run_program([sys.executable, temp_file], stdin=stdin)
             
-            output = result.stdout
-            if result.stderr:
-                output += "\n" + result.stderr
-                if result.returncode != 0:
-                    logger.warning(f"Python code executed with errors (return code: {result.returncode})")
+            stderr = collector.text('stderr')
+            if stderr and returncode != 0 and not collector.truncated:
+                logger.warning(f"Python code executed with errors (return code: {returncode})")
             
-            return output.strip() if output else "Code executed successfully with no output."
+            return self._format_output(collector.text('stdout'), stderr, collector.truncated, returncode)
         except subprocess.TimeoutExpired:
             logger.warning("Python code execution timed out")
-            return "Error: Code execution timed out."
+            return self._timed_out()
         except Exception as e:
             logger.error(f"Python execution error: {e}", exc_info=True)
             return f"Error: {str(e)}"
+        finally:
+            if temp_file:
+                os.unlink(temp_file)
     
-    def _execute_javascript(self, code):
-        """Execute JavaScript code using Node.js"""
+    def _execute_javascript(self, code, stdin=''):
+        """Execute JavaScript code on a warm Node.js host, or in a fresh Node.js process"""
+        # The host has no process.stdin, programs given input always get a real process
+        pool = None if stdin or NODE_HOST_UNSUPPORTED.search(code) else get_node_pool()
+        if pool is not None:
+            result = self._run_on_host(pool, code)
+            if result is not None:
+                return self._host_output(result)
+        
+        temp_file = None
         try:
             with tempfile.NamedTemporaryFile(mode='w', suffix='.js', delete=False) as f:
                 f.write(code)
                 temp_file = f.name
             
-            result = subprocess.run(
-                ['node', temp_file],
-                capture_output=True,
-                text=True,
-                timeout=self.TIMEOUT
+            command = ['node']
+            if self.sandbox.memory_mb:
+                command.append(f'--max-old-space-size={self.sandbox.memory_mb}')
+            collector, returncode = self._run_program(
+                command + [temp_file], sandbox=self.sandbox.without_memory_limit(), stdin=stdin
             )
             
-            os.unlink(temp_file)
-            
-            output = result.stdout
-            if result.stderr:
-                output += "\n" + result.stderr
-            
-            return output.strip() if output else "Code executed successfully with no output."
+            return self._format_output(
+                collector.text('stdout'), collector.text('stderr'), collector.truncated, returncode
+            )
         except FileNotFoundError:
             return "Error: Node.js is not installed. Please install Node.js to run JavaScript code."
         except subprocess.TimeoutExpired:
-            return "Error: Code execution timed out."
+            return self._timed_out()
         except Exception as e:
             return f"Error: {str(e)}"
+        finally:
+            if temp_file:
+                os.unlink(temp_file)
+    
+    def _build(self, language, compiler, flags, code, source_name, build_dir):
+        """Compile code in build_dir, reusing a cached build of identical source
+        
+        Returns a tuple (program_dir, error_output).
+        """
+        cache = get_compile_cache()
+        key = None
+        if cache is not None:
+            key = cache.make_key(language, code, compiler_version(compiler), flags, source_name)
+            if cache.get(key, language, build_dir):
+                return build_dir, None
+        
+        source_file = os.path.join(build_dir, source_name)
+        with open(source_file, 'w') as f:
+            f.write(code)
+        
+        if language == 'java':
+            command = [compiler, *flags, '-d', build_dir, source_file]
+        else:
+            command = [compiler, source_file, *flags, '-o', os.path.join(build_dir, 'program.exe')]
+        
+        with COMPILE_DURATION.time(language=language):
+            compile_result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=self.TIMEOUT
+            )
+        
+        if compile_result.returncode != 0:
+            return None, f"Compilation Error:\n{compile_result.stderr}"
+        
+        if cache is not None:
+            cache.put(key, build_dir, exclude=(source_name,))
+        return build_dir, None
     
-    def _execute_java(self, code):
+    def _execute_java(self, code, stdin=''):
         """Execute Java code"""
         try:
             # Extract class name from code
-            import re
             class_match = re.search(r'public\s+class\s+(\w+)', code)
             if not class_match:
                 return "Error: No public class found in Java code."
             
             class_name = class_match.group(1)
             
+            pool = get_java_pool()
+            if pool is not None:
+                result = self._run_on_host(
+                    pool, code, class_name=class_name, flags=list(self.JAVA_FLAGS), stdin=stdin
+                )
+                if result is not None:
+                    if 'compile_time' in result:
+                        COMPILE_DURATION.observe(result['compile_time'], language='java')
+                    if 'compile_error' in result:
+                        return f"Compilation Error:\n{result['compile_error']}"
+                    return self._host_output(result)
+            
             with tempfile.TemporaryDirectory() as temp_dir:
-                java_file = os.path.join(temp_dir, f"{class_name}.java")
-                with open(java_file, 'w') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['javac', java_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.TIMEOUT
+                program_dir, error = self._build(
+                    'java', 'javac', self.JAVA_FLAGS, code, f"{class_name}.java", temp_dir
                 )
-                
-                if compile_result.returncode != 0:
-                    return f"Compilation Error:\n{compile_result.stderr}"
+                if error:
+                    return error
                 
                 # Run
-                run_result = subprocess.run(
-                    ['java', '-cp', temp_dir, class_name],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.TIMEOUT
+                command = ['java', '-XX:+UseSerialGC']
+                if self.sandbox.memory_mb:
+                    command.append(f'-Xmx{self.sandbox.memory_mb}m')
+                collector, returncode = self._run_program(
+                    command + ['-cp', program_dir, class_name], sandbox=self.sandbox.without_memory_limit(), stdin=stdin
                 )
                 
-                output = run_result.stdout
-                if run_result.stderr:
-                    output += "\n" + run_result.stderr
-                
-                return output.strip() if output else "Code executed successfully with no output."
+                return self._format_output(
+                    collector.text('stdout'), collector.text('stderr'), collector.truncated, returncode
+                )
         except FileNotFoundError:
             return "Error: Java is not installed. Please install JDK to run Java code."
         except subprocess.TimeoutExpired:
-            return "Error: Code execution timed out."
+            return self._timed_out()
         except Exception as e:
             return f"Error: {str(e)}"
     
-    def _execute_cpp(self, code):
+    def run_tests(self, code, language, cases, timeout=None):
+        """Build code once and run it against every test case
+        
+        Each case is a dict with the program's 'stdin' and optionally the
+        'expected' stdout; without one a case passes when the program exits
+        cleanly. Cases run in parallel, at most BATCH_PARALLELISM at a time,
+        each with its own timeout. Returns a dict with `compile_error` set
+        when the program does not build, otherwise with a compact result
+        per case.
+        """
+        timeout = min(timeout or self.TIMEOUT, self.TIMEOUT)
+        with tempfile.TemporaryDirectory(prefix='batch-') as build_dir:
+            started = time.perf_counter()
+            try:
+                command, sandbox, error = self._prepare(code, language, build_dir)
+            except FileNotFoundError:
+                command, sandbox, error = None, None, f"Error: The {language} toolchain is not installed."
+            except subprocess.TimeoutExpired:
+                command, sandbox, error = None, None, "Compilation Error:\nCompilation timed out."
+            compile_time = round(time.perf_counter() - started, 3)
+            if error:
+                return {'compile_error': error, 'compile_time': compile_time}
+            
+            with ThreadPoolExecutor(self.BATCH_PARALLELISM, thread_name_prefix='classroom-case') as pool:
+                results = list(pool.map(lambda case: self._run_case(command, sandbox, case, timeout), cases))
+        
+        logger.info(f"Ran {len(cases)} {language} test cases, {sum(r['passed'] for r in results)} passed")
+        return {
+            'compile_time': compile_time,
+            'passed': sum(result['passed'] for result in results),
+            'total': len(results),
+            'cases': results,
+        }
+    
+    def _prepare(self, code, language, build_dir):
+        """Write and build code in build_dir, returns (command, sandbox, error)"""
+        if language == 'python':
+            source_file = os.path.join(build_dir, 'main.py')
+            with open(source_file, 'w') as f:
+                f.write(code)
+            return [sys.executable, source_file], self.sandbox, None
+        
+        if language == 'javascript':
+            source_file = os.path.join(build_dir, 'main.js')
+            with open(source_file, 'w') as f:
+                f.write(code)
+            command = ['node']
+            if self.sandbox.memory_mb:
+                command.append(f'--max-old-space-size={self.sandbox.memory_mb}')
+            return command + [source_file], self.sandbox.without_memory_limit(), None
+        
+        if language == 'java':
+            class_match = re.search(r'public\s+class\s+(\w+)', code)
+            if not class_match:
+                return None, None, "Error: No public class found in Java code."
+            class_name = class_match.group(1)
+            program_dir, error = self._build('java', 'javac', self.JAVA_FLAGS, code, f"{class_name}.java", build_dir)
+            command = ['java', '-XX:+UseSerialGC']
+            if self.sandbox.memory_mb:
+                command.append(f'-Xmx{self.sandbox.memory_mb}m')
+            return command + ['-cp', program_dir or '', class_name], self.sandbox.without_memory_limit(), error
+        
+        if language in ('c', 'cpp'):
+            compiler, flags, source_name = (
+                ('gcc', self.C_FLAGS, 'program.c') if language == 'c' else ('g++', self.CPP_FLAGS, 'program.cpp')
+            )
+            program_dir, error = self._build(language, compiler, flags, code, source_name, build_dir)
+            return [os.path.join(program_dir or '', 'program.exe')], self.sandbox, error
+        
+        return None, None, f"Language '{language}' is not supported yet."
+    
+    def _run_case(self, command, sandbox, case, timeout):
+        """Run a built program on one test case"""
+        started = time.perf_counter()
+        try:
+            collector, returncode = self._run_program(command, sandbox, stdin=case.get('stdin', ''), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {'status': 'timeout', 'passed': False, 'time': round(time.perf_counter() - started, 3)}
+        except FileNotFoundError:
+            # The runtime is missing, e.g. node is not installed
+            return {
+                'status': 'error', 'passed': False, 'time': round(time.perf_counter() - started, 3),
+                'output': f"Error: {os.path.basename(command[0])} is not installed.",
+            }
+        elapsed = round(time.perf_counter() - started, 3)
+        
+        stdout, stderr = collector.text('stdout'), collector.text('stderr')
+        expected = case.get('expected')
+        limit = detect_limit(returncode, stderr, collector.truncated)
+        if limit:
+            status = limit
+        elif returncode != 0:
+            status = 'error'
+        elif expected is None or normalize_output(stdout) == normalize_output(expected):
+            status = 'passed'
+        else:
+            status = 'failed'
+        
+        result = {'status': status, 'passed': status == 'passed', 'time': elapsed}
+        if status != 'passed':
+            result['output'] = (stdout + stderr)[:self.BATCH_OUTPUT_PREVIEW]
+        return result
+    
+    def _execute_native(self, language, compiler, flags, code, source_name, stdin=''):
+        """Compile C or C++ code and run the resulting binary"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            program_dir, error = self._build(language, compiler, flags, code, source_name, temp_dir)
+            if error:
+                return error
+            
+            # Run
+            collector, returncode = self._run_program([os.path.join(program_dir, 'program.exe')], stdin=stdin)
+            
+            return self._format_output(
+                collector.text('stdout'), collector.text('stderr'), collector.truncated, returncode
+            )
+    
+    def _execute_cpp(self, code, stdin=''):
         """Execute C++ code"""
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                source_file = os.path.join(temp_dir, 'program.cpp')
-                exe_file = os.path.join(temp_dir, 'program.exe')
-                
-                with open(source_file, 'w') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['g++', source_file, '-o', exe_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.TIMEOUT
-                )
-                
-                if compile_result.returncode != 0:
-                    return f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    [exe_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.TIMEOUT
-                )
-                
-                output = run_result.stdout
-                if run_result.stderr:
-                    output += "\n" + run_result.stderr
-                
-                return output.strip() if output else "Code executed successfully with no output."
+            return self._execute_native('cpp', 'g++', self.CPP_FLAGS, code, 'program.cpp', stdin)
         except FileNotFoundError:
             return "Error: g++ is not installed. Please install MinGW or similar to compile C++ code."
         except subprocess.TimeoutExpired:
-            return "Error: Code execution timed out."
+            return self._timed_out()
         except Exception as e:
             return f"Error: {str(e)}"
     
-    def _execute_c(self, code):
+    def _execute_c(self, code, stdin=''):
         """Execute C code"""
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                source_file = os.path.join(temp_dir, 'program.c')
-                exe_file = os.path.join(temp_dir, 'program.exe')
-                
-                with open(source_file, 'w') as f:
-                    f.write(code)
-                
-                # Compile
-                compile_result = subprocess.run(
-                    ['gcc', source_file, '-o', exe_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.TIMEOUT
-                )
-                
-                if compile_result.returncode != 0:
-                    return f"Compilation Error:\n{compile_result.stderr}"
-                
-                # Run
-                run_result = subprocess.run(
-                    [exe_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.TIMEOUT
-                )
-                
-                output = run_result.stdout
-                if run_result.stderr:
-                    output += "\n" + run_result.stderr
-                
-                return output.strip() if output else "Code executed successfully with no output."
+            return self._execute_native('c', 'gcc', self.C_FLAGS, code, 'program.c', stdin)
         except FileNotFoundError:
             return "Error: gcc is not installed. Please install MinGW or similar to compile C code."
         except subprocess.TimeoutExpired:
-            return "Error: Code execution timed out."
+            return self._timed_out()
         except Exception as e:
             return f"Error: {str(e)}"
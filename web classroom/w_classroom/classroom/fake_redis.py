@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+
+class FakeRedis:
+    """In-process stand-in for redis.asyncio.Redis(decode_responses=True)
+
+    Implements only the commands RedisRoomStore uses. Several RedisRoomStore
+    instances sharing one FakeRedis behave like worker processes sharing a
+    Redis server, which is how the tests exercise multi-process rooms.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+
+    def _get(self, key, kind):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        value = self._data.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise TypeError(f"WRONGTYPE key {key} does not hold a {kind.__name__}")
+        return value
+
+    async def get(self, key):
+        return self._get(key, str)
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and self._get(key, object) is not None:
+            return None
+        self._data[key] = str(value)
+        self._expires.pop(key, None)
+        if px is not None:
+            self._expires[key] = time.monotonic() + px / 1000
+        return True
+
+    async def incr(self, key):
+        value = int(self._get(key, str) or 0) + 1
+        self._data[key] = str(value)
+        return value
+
+    async def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._get(key, object) is not None:
+                del self._data[key]
+                self._expires.pop(key, None)
+                removed += 1
+        return removed
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        values = dict(mapping or {})
+        if field is not None:
+            values[field] = value
+        hash_ = self._get(key, dict)
+        if hash_ is None:
+            hash_ = self._data[key] = {}
+        added = len(set(values) - set(hash_))
+        hash_.update({name: str(v) for name, v in values.items()})
+        return added
+
+    async def hsetnx(self, key, field, value):
+        hash_ = self._get(key, dict)
+        if hash_ is None:
+            hash_ = self._data[key] = {}
+        if field in hash_:
+            return 0
+        hash_[field] = str(value)
+        return 1
+
+    async def hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    async def hgetall(self, key):
+        return dict(self._get(key, dict) or {})
+
+    async def hdel(self, key, *fields):
+        hash_ = self._get(key, dict) or {}
+        removed = sum(1 for field in fields if hash_.pop(field, None) is not None)
+        if key in self._data and not hash_:
+            del self._data[key]
+        return removed
+
+    async def rpush(self, key, *values):
+        list_ = self._get(key, list)
+        if list_ is None:
+            list_ = self._data[key] = []
+        list_.extend(str(value) for value in values)
+        return len(list_)
+
+    async def lrange(self, key, start, end):
+        list_ = self._get(key, list) or []
+        # Both ends are inclusive and may count from the end, as in Redis
+        if start < 0:
+            start = max(len(list_) + start, 0)
+        if end < 0:
+            end = len(list_) + end
+        return list_[start:end + 1]
+
+    async def ltrim(self, key, start, end):
+        list_ = await self.lrange(key, start, end)
+        if list_:
+            self._data[key] = list_
+        else:
+            self._data.pop(key, None)
+        return True
+
+
+class InterleavingFakeRedis(FakeRedis):
+    """FakeRedis that lets other tasks run before each command, like a round trip to a server"""
+
+    def __getattribute__(self, name):
+        attr = super().__getattribute__(name)
+        if name.startswith('_') or not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def command(*args, **kwargs):
+            await asyncio.sleep(0)
+            return await attr(*args, **kwargs)
+        return command
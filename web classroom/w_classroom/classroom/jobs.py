@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .executor import CodeExecutor
+from .metrics import (
+    EXECUTION_DURATION, EXECUTIONS_QUEUED, EXECUTIONS_REJECTED, QUEUE_WAIT, RESULT_CACHE_HITS, count_db_calls,
+)
+from .result_cache import get_result_cache
+
+# Get logger
+logger = logging.getLogger('classroom.execution')
+
+
+class ExecutionRejected(Exception):
+    """Raised when a run cannot be queued because a limit was reached"""
+
+
+class ExecutionJob:
+    """A single queued Run request
+
+    `deterministic` marks a program whose output may be cached and reused,
+    `example` marks it as the room creator's, see ResultCache.
+    """
+
+    def __init__(self, session_id, code, language, username, deterministic=False, example=False, stdin=''):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.code = code
+        self.language = language
+        self.username = username
+        self.stdin = stdin
+        self.deterministic = deterministic
+        self.example = example
+        self.output = None
+        self.limit_hit = None
+        self.done = asyncio.Event()
+        self.queued_at = time.monotonic()
+        # Metric label, the language comes straight from the client
+        self.language_label = language if language in CodeExecutor.LANGUAGES else 'unsupported'
+        self.pending_output = []
+        self.flush_handle = None
+        self.output_lock = asyncio.Lock()
+
+    @property
+    def group_name(self):
+        return f'code_{self.session_id}'
+
+
+def is_error_output(output):
+    """Same heuristic the editor uses to colour the output panel"""
+    return 'Error:' in output
+
+
+class ExecutionDispatcher:
+    """Queues Run requests and executes them on a bounded thread pool
+
+    Jobs wait on asyncio semaphores instead of threads, so a burst of slow
+    submissions never occupies more than `max_workers` threads. Results are
+    pushed to the room's channel group once the run finishes, program output
+    is streamed to the group in `output_chunk` messages while it runs. Runs
+    answered from the result cache skip the semaphores altogether.
+    """
+    
+    OUTPUT_FLUSH_INTERVAL = 0.1  # seconds between output_chunk messages of a run
+
+    def __init__(self, loop, max_workers, queue_limit, room_concurrency, room_queue_limit):
+        self.loop = loop
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self.room_concurrency = room_concurrency
+        self.room_queue_limit = room_queue_limit
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='classroom-exec')
+        self._slots = asyncio.Semaphore(max_workers)
+        self._room_slots = {}
+        self._room_pending = {}
+        self._tasks = set()
+
+    @property
+    def pending(self):
+        """Number of queued or running jobs"""
+        return len(self._tasks)
+
+    def submit(self, session_id, code, language, username='Anonymous', deterministic=False, example=False, stdin=''):
+        """Queue a run, raise ExecutionRejected when a limit is reached"""
+        self._admit(session_id)
+        job = ExecutionJob(session_id, code, language, username, deterministic, example, stdin)
+        task = self.loop.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        logger.info(f"Queued run {job.job_id} for session {session_id} ({self.pending} jobs pending)")
+        return job
+
+    async def run_tests(self, session_id, code, language, cases, timeout=None):
+        """Build code once and run it against test cases, see CodeExecutor.run_tests
+
+        The whole batch takes a single execution slot of the server and the
+        room and counts as one queued job.
+        """
+        self._admit(session_id)
+        task = self.loop.create_task(self._run_tests(session_id, code, language, cases, timeout))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return await task
+
+    async def _run_tests(self, session_id, code, language, cases, timeout):
+        queued_at = time.monotonic()
+        language_label = language if language in CodeExecutor.LANGUAGES else 'unsupported'
+        try:
+            async with self._room_slots[session_id], self._slots:
+                QUEUE_WAIT.observe(time.monotonic() - queued_at, language=language_label)
+                return await self.loop.run_in_executor(
+                    self._executor, CodeExecutor().run_tests, code, language, cases, timeout
+                )
+        finally:
+            self._release_room(session_id)
+
+    def _admit(self, session_id):
+        """Reserve a place in the queues, raise ExecutionRejected when a limit is reached"""
+        if self.pending >= self.queue_limit:
+            logger.warning(f"Execution queue full ({self.pending} jobs), rejecting run for session {session_id}")
+            EXECUTIONS_REJECTED.inc(limit='server')
+            raise ExecutionRejected("The server is busy, please try again in a moment.")
+
+        room_pending = self._room_pending.get(session_id, 0)
+        if room_pending >= self.room_queue_limit:
+            logger.warning(f"Room {session_id} already has {room_pending} runs queued, rejecting run")
+            EXECUTIONS_REJECTED.inc(limit='room')
+            raise ExecutionRejected("This room already has too many runs queued.")
+
+        self._room_pending[session_id] = room_pending + 1
+        if session_id not in self._room_slots:
+            self._room_slots[session_id] = asyncio.Semaphore(self.room_concurrency)
+
+    async def _run(self, job):
+        try:
+            results = get_result_cache()
+            cached = await results.get(job.session_id, job.language, job.code, job.stdin, job.deterministic) if results else None
+            if cached is not None:
+                RESULT_CACHE_HITS.inc(language=job.language_label)
+                logger.info(f"Run {job.job_id} for session {job.session_id} answered from the result cache")
+                job.output = cached
+            else:
+                await self._execute(job)
+                if results and job.deterministic and job.limit_hit is None:
+                    await results.put(job.session_id, job.language, job.code, job.output, job.stdin, job.example)
+
+            await self._save(job)
+            await self._notify(job, {
+                'type': 'execution_result',
+                'job_id': job.job_id,
+                'output': job.output,
+                'isError': is_error_output(job.output),
+                'limit': job.limit_hit,
+                'username': job.username,
+            })
+        except Exception as e:
+            logger.error(f"Run {job.job_id} for session {job.session_id} failed: {e}", exc_info=True)
+            job.output = f"Error: {str(e)}"
+            await self._notify(job, {
+                'type': 'execution_result',
+                'job_id': job.job_id,
+                'output': job.output,
+                'isError': True,
+                'limit': None,
+                'username': job.username,
+            })
+        finally:
+            job.done.set()
+            self._release_room(job.session_id)
+
+    async def _execute(self, job):
+        async with self._room_slots[job.session_id], self._slots:
+            QUEUE_WAIT.observe(time.monotonic() - job.queued_at, language=job.language_label)
+            await self._notify(job, {
+                'type': 'execution_status',
+                'job_id': job.job_id,
+                'status': 'running',
+                'username': job.username,
+            })
+            executor = CodeExecutor(on_output=lambda stream, data: self.loop.call_soon_threadsafe(
+                self._queue_output, job, stream, data
+            ))
+            with EXECUTION_DURATION.time(language=job.language_label):
+                job.output = await self.loop.run_in_executor(
+                    self._executor, executor.execute, job.code, job.language, job.stdin
+                )
+            job.limit_hit = executor.limit_hit
+
+        await self._flush_output(job)
+
+    def _queue_output(self, job, stream, data):
+        """Buffer a chunk of output and schedule the next flush"""
+        job.pending_output.append((stream, data))
+        if job.flush_handle is None:
+            job.flush_handle = self.loop.call_later(
+                self.OUTPUT_FLUSH_INTERVAL,
+                lambda: self.loop.create_task(self._flush_output(job))
+            )
+
+    async def _flush_output(self, job):
+        """Send buffered output, merging adjacent chunks of the same stream"""
+        async with job.output_lock:
+            if job.flush_handle is not None:
+                job.flush_handle.cancel()
+                job.flush_handle = None
+            chunks, job.pending_output = job.pending_output, []
+
+            merged = []
+            for stream, data in chunks:
+                if merged and merged[-1][0] == stream:
+                    merged[-1][1].append(data)
+                else:
+                    merged.append((stream, [data]))
+
+            for stream, parts in merged:
+                await self._notify(job, {
+                    'type': 'output_chunk',
+                    'job_id': job.job_id,
+                    'stream': stream,
+                    'data': ''.join(parts),
+                })
+
+    def _release_room(self, session_id):
+        remaining = self._room_pending.get(session_id, 1) - 1
+        if remaining > 0:
+            self._room_pending[session_id] = remaining
+        else:
+            self._room_pending.pop(session_id, None)
+            self._room_slots.pop(session_id, None)
+
+    @database_sync_to_async
+    @count_db_calls('save_run')
+    def _save(self, job):
+        from classroom.models import CodeSession
+
+        # The code is the shared document's, written by the room's persister
+        updated = CodeSession.objects.filter(session_id=job.session_id).update(
+            language=job.language, output=job.output, updated_at=timezone.now()
+        )
+        if not updated:
+            logger.warning(f"Session {job.session_id} was deleted before run {job.job_id} finished")
+
+    async def _notify(self, job, message):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            await channel_layer.group_send(job.group_name, message)
+        except Exception as e:
+            logger.error(f"Could not deliver {message['type']} for run {job.job_id}: {e}")
+
+    async def join(self):
+        """Wait for every queued job to finish"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_dispatcher = None
+EXECUTIONS_QUEUED.set_function(lambda: _dispatcher.pending if _dispatcher is not None else 0)
+
+
+def get_dispatcher():
+    """Return the dispatcher bound to the running event loop
+
+    Queued jobs live on that loop, so it must be the ASGI server's, which
+    outlives requests. Under WSGI every async view gets a loop of its own
+    and jobs would be lost with it, see w_classroom/wsgi.py.
+    """
+    global _dispatcher
+
+    loop = asyncio.get_running_loop()
+    if _dispatcher is None or _dispatcher.loop is not loop:
+        if _dispatcher is not None:
+            _dispatcher.shutdown()
+        _dispatcher = ExecutionDispatcher(
+            loop,
+            max_workers=getattr(settings, 'CLASSROOM_EXECUTION_WORKERS', 8),
+            queue_limit=getattr(settings, 'CLASSROOM_EXECUTION_QUEUE_LIMIT', 100),
+            room_concurrency=getattr(settings, 'CLASSROOM_ROOM_CONCURRENT_RUNS', 1),
+            room_queue_limit=getattr(settings, 'CLASSROOM_ROOM_QUEUE_LIMIT', 5),
+        )
+    return _dispatcher
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils import timezone
+
+from .models import CodeSession
+
+# Rooms updated within this window are listed in the lobby
+ACTIVE_WINDOW = timedelta(hours=2)
+
+# Bumped whenever the listing changes, so every cached page goes stale at once
+VERSION_KEY = 'classroom:lobby:version'
+
+LISTING_FIELDS = ('session_id', 'room_name', 'participant_count', 'language')
+
+
+def get_lobby_page(page_number):
+    """One page of active rooms as plain data, served from the cache when possible"""
+    try:
+        page_number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        page_number = 1
+    version = cache.get(VERSION_KEY, 0)
+    per_page = getattr(settings, 'CLASSROOM_LOBBY_PAGE_SIZE', 20)
+    key = f'classroom:lobby:{version}:{per_page}:{page_number}'
+    page = cache.get(key)
+    if page is None:
+        page = _build_page(page_number, per_page)
+        cache.set(key, page, getattr(settings, 'CLASSROOM_LOBBY_CACHE_TTL', 5))
+    return page
+
+
+def _build_page(page_number, per_page):
+    cutoff_time = timezone.now() - ACTIVE_WINDOW
+    sessions = CodeSession.objects.filter(updated_at__gte=cutoff_time).only(*LISTING_FIELDS)
+    paginator = Paginator(sessions, per_page)
+    page = paginator.get_page(page_number)
+    return {
+        'rooms': [
+            {field: getattr(session, field) for field in LISTING_FIELDS}
+            for session in page
+        ],
+        'count': paginator.count,
+        'page': page.number,
+        'num_pages': paginator.num_pages,
+        'has_previous': page.has_previous(),
+        'has_next': page.has_next(),
+    }
+
+
+async def invalidate_lobby():
+    """Drop every cached lobby page"""
+    try:
+        await cache.aincr(VERSION_KEY)
+    except ValueError:
+        # incr fails on a missing key; the version only has to change
+        await cache.aset(VERSION_KEY, 1, None)
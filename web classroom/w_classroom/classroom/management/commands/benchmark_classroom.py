@@ -0,0 +1,227 @@
+import asyncio
+import json
+import math
+import platform
+import sys
+import time
+import uuid
+from collections import Counter
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.utils import timezone
+
+from classroom.models import CodeSession
+from classroom.participant_counts import get_participant_counts
+from classroom.rate_limit import throttle_counts
+from classroom.room_store import get_room_store
+from classroom.routing import websocket_urlpatterns
+
+try:
+    import resource
+except ImportError:  # Windows has no getrusage
+    resource = None
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds, nearest-rank"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return round(ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'p99': percentile(99),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3),
+    }
+
+
+def max_rss_kb():
+    """Peak resident memory of this process in KiB, or None when unknown"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test code execution and the room WebSocket in-process and write "
+        "latency, throughput and memory figures as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=5, help="Rooms used by both phases")
+        parser.add_argument('--clients', type=int, default=10, help="WebSocket clients per room")
+        parser.add_argument('--edits', type=int, default=10, help="Edits sent by each client")
+        parser.add_argument('--runs', type=int, default=50, help="Code runs submitted in total")
+        parser.add_argument('--concurrency', type=int, default=10, help="Runs in flight at the same time")
+        parser.add_argument('--language', default='python')
+        parser.add_argument('--code', default="print(sum(range(1000)))")
+        parser.add_argument('--timeout', type=float, default=30, help="Seconds to wait for any single message")
+        parser.add_argument('--skip-execution', action='store_true')
+        parser.add_argument('--skip-websocket', action='store_true')
+        parser.add_argument('--output', help="File to write the JSON results to, stdout by default")
+
+    def handle(self, *args, **options):
+        results = asyncio.run(self.benchmark(options))
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(report)
+
+    async def benchmark(self, options):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        session_ids = [f'{prefix}-{number}' for number in range(options['rooms'])]
+        await CodeSession.objects.abulk_create([
+            CodeSession(session_id=session_id, room_name=f'Benchmark {session_id}', language=options['language'])
+            for session_id in session_ids
+        ])
+
+        results = {
+            'started_at': timezone.now().isoformat(),
+            'config': {name: options[name] for name in (
+                'rooms', 'clients', 'edits', 'runs', 'concurrency', 'language', 'code'
+            )},
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'channel_layer': type(get_channel_layer()).__name__,
+                'room_store': type(get_room_store()).__name__,
+            },
+        }
+        try:
+            if not options['skip_execution']:
+                results['execution'] = await self.benchmark_execution(session_ids, options)
+            if not options['skip_websocket']:
+                results['websocket'] = await self.benchmark_websocket(session_ids, options)
+        finally:
+            await get_participant_counts().flush()
+            await CodeSession.objects.filter(session_id__startswith=f'{prefix}-').adelete()
+        return results
+
+    async def benchmark_execution(self, session_ids, options):
+        """Submit runs through the execute_code view and wait for each result"""
+        client = AsyncClient()
+        slots = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        statuses = {'completed': 0, 'rejected': 0, 'failed': 0}
+
+        async def run(number):
+            body = json.dumps({
+                'session_id': session_ids[number % len(session_ids)],
+                'code': options['code'],
+                'language': options['language'],
+                'wait': True,
+            })
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post('/api/execute/', body, content_type='application/json')
+                elapsed = time.perf_counter() - started
+            if response.status_code == 429:
+                statuses['rejected'] += 1
+            elif response.status_code == 200 and response.json().get('success'):
+                statuses['completed'] += 1
+                latencies.append(elapsed)
+            else:
+                statuses['failed'] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(number) for number in range(options['runs'])))
+        duration = time.perf_counter() - started
+
+        return {
+            'runs': options['runs'],
+            **statuses,
+            'duration': round(duration, 3),
+            'runs_per_second': round(statuses['completed'] / duration, 3) if duration else None,
+            'latency_ms': summarize(latencies),
+            'max_rss_kb': max_rss_kb(),
+        }
+
+    async def benchmark_websocket(self, session_ids, options):
+        """Connect every client, then have each room's clients take turns editing
+
+        Rooms edit concurrently. Fan-out latency is the time from sending an
+        edit until its author has the acknowledgement and every other client
+        in the room has the delta.
+        """
+        application = URLRouter(websocket_urlpatterns)
+        timeout = options['timeout']
+        connect_latencies = []
+        fanout_latencies = []
+        delivered = 0
+
+        async def receive(communicator, message_type, version=None):
+            nonlocal delivered
+            while True:
+                message = await communicator.receive_json_from(timeout)
+                delivered += 1
+                if message['type'] == message_type and version in (None, message.get('version')):
+                    return message
+
+        async def connect(session_id, number):
+            communicator = WebsocketCommunicator(application, f'/ws/code/{session_id}/')
+            communicator.scope['session'] = {'username': f'bench-user-{number}'}
+            started = time.perf_counter()
+            connected, _ = await communicator.connect(timeout)
+            if not connected:
+                raise RuntimeError(f"Client {number} could not connect to {session_id}")
+            snapshot = await receive(communicator, 'code_snapshot')
+            connect_latencies.append(time.perf_counter() - started)
+            return communicator, snapshot
+
+        async def edit_room(session_id):
+            clients = []
+            try:
+                for number in range(options['clients']):
+                    clients.append(await connect(session_id, number))
+                version = clients[-1][1]['version']
+                length = len(clients[-1][1]['code'])
+
+                for _ in range(options['edits']):
+                    for index, (sender, _) in enumerate(clients):
+                        op = [length, 'x'] if length else ['x']
+                        started = time.perf_counter()
+                        await sender.send_json_to({'type': 'code_delta', 'version': version, 'op': op})
+                        await asyncio.gather(*(
+                            receive(communicator, 'code_ack' if other == index else 'code_delta', version + 1)
+                            for other, (communicator, _) in enumerate(clients)
+                        ))
+                        fanout_latencies.append(time.perf_counter() - started)
+                        version += 1
+                        length += 1
+            finally:
+                for communicator, _ in clients:
+                    await communicator.disconnect()
+
+        throttled_before = Counter(throttle_counts)
+        started = time.perf_counter()
+        await asyncio.gather(*(edit_room(session_id) for session_id in session_ids))
+        duration = time.perf_counter() - started
+
+        return {
+            'rooms': len(session_ids),
+            'clients': len(session_ids) * options['clients'],
+            'edits': len(fanout_latencies),
+            'messages': delivered,
+            'duration': round(duration, 3),
+            'messages_per_second': round(delivered / duration, 3) if duration else None,
+            'connect_latency_ms': summarize(connect_latencies),
+            'fanout_latency_ms': summarize(fanout_latencies),
+            'throttled': dict(throttle_counts - throttled_before),
+            'max_rss_kb': max_rss_kb(),
+        }
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from classroom.reaper import BATCH_SIZE, compact_outputs, delete_stale_rooms, idle_cutoffs
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete rooms that have been idle for too long and clear the stored run "
+        "output of idle rooms. Meant to run periodically, e.g. from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rooms per DELETE or UPDATE statement")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted or cleared")
+
+    def handle(self, *args, **options):
+        rooms_before, empty_rooms_before, outputs_before = idle_cutoffs()
+        deleted = delete_stale_rooms(
+            rooms_before, empty_rooms_before, batch_size=options['batch_size'], dry_run=options['dry_run']
+        )
+        compacted = compact_outputs(outputs_before, batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            message = f"Would delete {deleted} stale rooms and clear the output of {compacted} idle rooms"
+        else:
+            message = f"Deleted {deleted} stale rooms and cleared the output of {compacted} idle rooms"
+        self.stdout.write(self.style.SUCCESS(message))
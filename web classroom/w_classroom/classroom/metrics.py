@@ -0,0 +1,214 @@
+import bisect
+import contextlib
+import functools
+import math
+import threading
+import time
+
+from django.db import connection
+
+# Upper bounds in seconds, wide enough for runs that hit the execution timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Every metric of the process in the order it is rendered
+registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with optional labels, in Prometheus' data model
+
+    Values are kept per combination of label values. Instead of being
+    updated, counters and gauges can read their values from a function at
+    render time with set_function().
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def set_function(self, function):
+        """Read the values from function() when rendering
+
+        It returns a number for a metric without labels, otherwise a dict
+        mapping tuples of label values to numbers.
+        """
+        self._function = function
+
+    def get(self, **labels):
+        return self._current().get(self._key(labels), 0)
+
+    def _current(self):
+        if self._function is None:
+            with self._lock:
+                return dict(self._values)
+        values = self._function()
+        return values if self.labelnames else {(): values}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        values = self._current()
+        if not values and not self.labelnames:
+            values = {(): 0}
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get(self, **labels):
+        """Number of observations"""
+        counts, _ = self._current().get(self._key(labels), ((), 0))
+        return sum(counts)
+
+    def _current(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for key, (counts, total) in sorted(self._current().items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+def count_db_calls(operation):
+    """Count calls of a synchronous database function and the SQL queries they run"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            queries = 0
+
+            def count(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            DB_CALLS.inc(operation=operation)
+            try:
+                with connection.execute_wrapper(count):
+                    return func(*args, **kwargs)
+            finally:
+                DB_QUERIES.inc(queries, operation=operation)
+        return wrapper
+    return decorator
+
+
+# Code execution
+EXECUTION_DURATION = Histogram(
+    'classroom_execution_duration_seconds', "Time spent running a program, compilation included", ['language']
+)
+COMPILE_DURATION = Histogram(
+    'classroom_compile_duration_seconds', "Time spent compiling C, C++ and Java programs", ['language']
+)
+QUEUE_WAIT = Histogram(
+    'classroom_execution_queue_wait_seconds', "Time a run waited for a free execution slot", ['language']
+)
+EXECUTIONS_QUEUED = Gauge('classroom_executions_queued', "Runs queued or executing")
+EXECUTIONS_REJECTED = Counter(
+    'classroom_executions_rejected_total', "Runs rejected because a queue limit was reached", ['limit']
+)
+RESULT_CACHE_HITS = Counter(
+    'classroom_result_cache_hits_total', "Runs answered from the result cache without executing", ['language']
+)
+
+# Rooms and WebSocket traffic
+ACTIVE_ROOMS = Gauge('classroom_active_rooms', "Rooms with at least one connection to this process")
+CONNECTED_SOCKETS = Gauge('classroom_connected_sockets', "Open room WebSocket connections")
+MESSAGES = Counter('classroom_websocket_messages_total', "Messages received from clients", ['type'])
+MESSAGE_DURATION = Histogram(
+    'classroom_websocket_message_duration_seconds', "Time spent handling a client message", ['type']
+)
+THROTTLED = Counter('classroom_throttled_messages_total', "Room messages held back, merged or dropped", ['reason'])
+
+# Database
+DB_CALLS = Counter('classroom_db_calls_total', "Database calls made by the room consumer", ['operation'])
+DB_QUERIES = Counter('classroom_db_queries_total', "SQL queries run by those calls", ['operation'])
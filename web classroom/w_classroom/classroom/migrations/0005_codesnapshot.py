@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 05:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0004_codesession_banned_ips_codesession_muted_users'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.TextField(blank=True, default='')),
+                ('version', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='classroom.codesession')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['session', '-created_at'], name='classroom_c_session_fc24c5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.14 on 2026-10-18 05:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0005_codesnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomBan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip', models.CharField(max_length=45)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bans', to='classroom.codesession')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RoomMute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mutes', to='classroom.codesession')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='roomban',
+            constraint=models.UniqueConstraint(fields=('session', 'ip'), name='unique_room_ban'),
+        ),
+        migrations.AddConstraint(
+            model_name='roommute',
+            constraint=models.UniqueConstraint(fields=('session', 'username'), name='unique_room_mute'),
+        ),
+    ]
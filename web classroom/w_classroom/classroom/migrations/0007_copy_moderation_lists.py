@@ -0,0 +1,48 @@
+import json
+
+from django.db import migrations
+
+
+def load_list(value):
+    try:
+        return json.loads(value or '[]')
+    except ValueError:
+        return []
+
+
+def copy_to_tables(apps, schema_editor):
+    """Move the JSON moderation lists into RoomBan and RoomMute rows"""
+    CodeSession = apps.get_model('classroom', 'CodeSession')
+    RoomBan = apps.get_model('classroom', 'RoomBan')
+    RoomMute = apps.get_model('classroom', 'RoomMute')
+
+    bans = []
+    mutes = []
+    sessions = CodeSession.objects.exclude(banned_ips__in=('', '[]'), muted_users__in=('', '[]'))
+    for session in sessions.only('banned_ips', 'muted_users').iterator():
+        bans.extend(RoomBan(session_id=session.pk, ip=ip) for ip in set(load_list(session.banned_ips)))
+        mutes.extend(RoomMute(session_id=session.pk, username=name) for name in set(load_list(session.muted_users)))
+    RoomBan.objects.bulk_create(bans, batch_size=500, ignore_conflicts=True)
+    RoomMute.objects.bulk_create(mutes, batch_size=500, ignore_conflicts=True)
+
+
+def copy_to_lists(apps, schema_editor):
+    CodeSession = apps.get_model('classroom', 'CodeSession')
+
+    for session in CodeSession.objects.filter(bans__isnull=False).distinct().iterator():
+        session.banned_ips = json.dumps(sorted(session.bans.values_list('ip', flat=True)))
+        session.save(update_fields=['banned_ips'])
+    for session in CodeSession.objects.filter(mutes__isnull=False).distinct().iterator():
+        session.muted_users = json.dumps(sorted(session.mutes.values_list('username', flat=True)))
+        session.save(update_fields=['muted_users'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0006_roomban_roommute'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_to_tables, copy_to_lists),
+    ]
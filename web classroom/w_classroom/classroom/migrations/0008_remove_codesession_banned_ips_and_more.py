@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 05:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0007_copy_moderation_lists'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='codesession',
+            name='banned_ips',
+        ),
+        migrations.RemoveField(
+            model_name='codesession',
+            name='muted_users',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classroom', '0008_remove_codesession_banned_ips_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='codesession',
+            index=models.Index(fields=['updated_at'], name='classroom_c_updated_3014af_idx'),
+        ),
+    ]
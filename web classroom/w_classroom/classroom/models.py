@@ -1,6 +1,5 @@
 from django.db import models
 import uuid
-import json
 
 
 class CodeSession(models.Model):
@@ -12,51 +11,88 @@ class CodeSession(models.Model):
     output = models.TextField(blank=True, default='')
     language = models.CharField(max_length=50, default='python')
     participant_count = models.IntegerField(default=0)
-    banned_ips = models.TextField(blank=True, default='[]')  # JSON array of banned IPs
-    muted_users = models.TextField(blank=True, default='[]')  # JSON array of muted usernames
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Serves the lobby's activity filter and the stale room reaper
+            models.Index(fields=['updated_at']),
+        ]
 
     def __str__(self):
         return f"{self.room_name or 'Session'} ({self.session_id[:8]}...)"
     
     def get_banned_ips(self):
         """Get list of banned IPs"""
-        try:
-            return json.loads(self.banned_ips)
-        except:
-            return []
+        return list(self.bans.order_by('ip').values_list('ip', flat=True))
+    
+    def is_banned(self, ip):
+        return self.bans.filter(ip=ip).exists()
     
     def add_banned_ip(self, ip):
         """Ban an IP address"""
-        banned = self.get_banned_ips()
-        if ip not in banned:
-            banned.append(ip)
-            self.banned_ips = json.dumps(banned)
-            self.save()
+        RoomBan.objects.bulk_create([RoomBan(session=self, ip=ip)], ignore_conflicts=True)
     
     def get_muted_users(self):
         """Get list of muted users"""
-        try:
-            return json.loads(self.muted_users)
-        except:
-            return []
+        return list(self.mutes.order_by('username').values_list('username', flat=True))
+    
+    def is_muted(self, username):
+        return self.mutes.filter(username=username).exists()
     
     def add_muted_user(self, username):
         """Mute a user"""
-        muted = self.get_muted_users()
-        if username not in muted:
-            muted.append(username)
-            self.muted_users = json.dumps(muted)
-            self.save()
+        RoomMute.objects.bulk_create([RoomMute(session=self, username=username)], ignore_conflicts=True)
     
     def remove_muted_user(self, username):
         """Unmute a user"""
-        muted = self.get_muted_users()
-        if username in muted:
-            muted.remove(username)
-            self.muted_users = json.dumps(muted)
-            self.save()
+        self.mutes.filter(username=username).delete()
+
+
+class RoomBan(models.Model):
+    """An IP address banned from a session"""
+    session = models.ForeignKey(CodeSession, on_delete=models.CASCADE, related_name='bans')
+    ip = models.CharField(max_length=45)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'ip'], name='unique_room_ban'),
+        ]
+
+    def __str__(self):
+        return f"{self.ip} banned from {self.session_id}"
+
+
+class RoomMute(models.Model):
+    """A user whose edits are ignored in a session"""
+    session = models.ForeignKey(CodeSession, on_delete=models.CASCADE, related_name='mutes')
+    username = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'username'], name='unique_room_mute'),
+        ]
+
+    def __str__(self):
+        return f"{self.username} muted in {self.session_id}"
+
+
+class CodeSnapshot(models.Model):
+    """Point-in-time copy of a session's code, a bounded number is kept per session"""
+    session = models.ForeignKey(CodeSession, on_delete=models.CASCADE, related_name='snapshots')
+    code = models.TextField(blank=True, default='')
+    version = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['session', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Snapshot of {self.session_id} at {self.created_at}"
@@ -0,0 +1,240 @@
+/*
+ * Warm Node.js host used by the classroom execution pool.
+ *
+ * The host reads one JSON job per line on stdin. While the job runs it
+ * writes one JSON line per output chunk on stdout, followed by a final line
+ * with the exit status, the same protocol as python_worker.py. Every job
+ * runs in a fresh vm context with its own globals, so submissions never
+ * see each other's variables and Node.js startup is only paid once per host.
+ *
+ * A vm context is not a security boundary; the host process itself runs
+ * under the sandbox limits. The main script and every timer callback run
+ * with the vm timeout; a program that still blocks the event loop makes
+ * the pool kill and replace this host.
+ *
+ * This file is executed as a standalone script and must only use Node.js
+ * built-in modules.
+ */
+
+'use strict';
+
+const fs = require('fs');
+const readline = require('readline');
+const util = require('util');
+const vm = require('vm');
+
+// Calls a callback inside the program's context, so the vm timeout applies to it
+const invokeCallback = new vm.Script('globalThis.__classroom_callback__()');
+
+function emit(message) {
+    fs.writeSync(1, JSON.stringify(message) + '\n');
+}
+
+class OutputLimitError extends Error {}
+
+let current = null;
+const jobs = [];
+
+// Errors created in a vm context are not instances of this context's Error
+function isError(value) {
+    return value !== null && typeof value === 'object' && typeof value.stack === 'string';
+}
+
+function cleanStack(error) {
+    if (!isError(error)) {
+        return `Uncaught ${util.inspect(error)}`;
+    }
+    // Drop the frames of this host, they only confuse students
+    return error.stack
+        .split('\n')
+        .filter(line => !/^\s+at .*(node:|node_worker\.js|evalmachine\.)/.test(line))
+        .join('\n');
+}
+
+function runJob(job) {
+    const timeout = Math.max(1, Math.round((job.timeout || 10) * 1000));
+    const maxOutput = job.max_output || 256 * 1024;
+    const deadline = Date.now() + timeout;
+    const timers = new Set();
+    const run = { finished: false, returncode: 0, timedOut: false, truncated: false, size: 0, fail: uncaught };
+    current = run;
+
+    function finish() {
+        if (run.finished) {
+            return;
+        }
+        run.finished = true;
+        clearTimeout(deadlineTimer);
+        for (const timer of timers) {
+            clearTimeout(timer);
+            clearInterval(timer);
+            clearImmediate(timer);
+        }
+        timers.clear();
+        current = null;
+        emit({
+            done: true,
+            returncode: run.returncode,
+            timed_out: run.timedOut,
+            truncated: run.truncated,
+        });
+        setImmediate(nextJob);
+    }
+
+    function uncaught(error) {
+        if (run.finished) {
+            return;
+        }
+        if (error && error.code === 'ERR_SCRIPT_EXECUTION_TIMEOUT') {
+            run.timedOut = true;
+        } else if (!(error instanceof OutputLimitError)) {
+            write('stderr', cleanStack(error) + '\n', false);
+            run.returncode = 1;
+        }
+        finish();
+    }
+
+    function write(stream, text, abort = true) {
+        if (run.finished) {
+            return;
+        }
+        const size = Buffer.byteLength(text);
+        if (run.size + size > maxOutput) {
+            text = Buffer.from(text).subarray(0, maxOutput - run.size).toString();
+            run.truncated = true;
+        }
+        run.size += size;
+        if (text) {
+            emit({ stream, data: text });
+        }
+        if (run.truncated) {
+            finish();
+            if (abort) {
+                // Unwinds the program, whatever it catches the vm timeout stops
+                throw new OutputLimitError('Output limit exceeded');
+            }
+        }
+    }
+
+    // Sends the host to the next job once no timer of the program is left
+    function settle() {
+        if (run.finished || timers.size) {
+            return;
+        }
+        setImmediate(() => {
+            if (!run.finished && !timers.size) {
+                finish();
+            }
+        });
+    }
+
+    function call(callback, args) {
+        if (run.finished) {
+            return;
+        }
+        context.__classroom_callback__ = () => callback(...args);
+        try {
+            invokeCallback.runInContext(context, { timeout: Math.max(1, deadline - Date.now()) });
+        } catch (error) {
+            uncaught(error);
+        } finally {
+            delete context.__classroom_callback__;
+        }
+        settle();
+    }
+
+    function schedule(set, takesDelay, repeat) {
+        return (callback, ...args) => {
+            if (typeof callback !== 'function') {
+                throw new TypeError('The "callback" argument must be of type function');
+            }
+            const delay = takesDelay ? args.shift() : undefined;
+            const fire = () => {
+                if (!repeat) {
+                    timers.delete(timer);
+                }
+                call(callback, args);
+            };
+            const timer = takesDelay ? set(fire, delay) : set(fire);
+            timers.add(timer);
+            return timer;
+        };
+    }
+
+    function cancel(clear) {
+        return timer => {
+            clear(timer);
+            timers.delete(timer);
+            settle();
+        };
+    }
+
+    function format(args) {
+        return util.format(...args) + '\n';
+    }
+
+    const console = {
+        log: (...args) => write('stdout', format(args)),
+        info: (...args) => write('stdout', format(args)),
+        debug: (...args) => write('stdout', format(args)),
+        error: (...args) => write('stderr', format(args)),
+        warn: (...args) => write('stderr', format(args)),
+        dir: (value) => write('stdout', util.inspect(value) + '\n'),
+    };
+
+    const context = vm.createContext({
+        console,
+        setTimeout: schedule(setTimeout, true, false),
+        setInterval: schedule(setInterval, true, true),
+        setImmediate: schedule(setImmediate, false, false),
+        clearTimeout: cancel(clearTimeout),
+        clearInterval: cancel(clearInterval),
+        clearImmediate: cancel(clearImmediate),
+        queueMicrotask,
+        structuredClone,
+        TextEncoder,
+        TextDecoder,
+        URL,
+        URLSearchParams,
+    });
+
+    const deadlineTimer = setTimeout(() => {
+        run.timedOut = true;
+        finish();
+    }, timeout);
+
+    try {
+        const script = new vm.Script(job.code || '', { filename: 'main.js' });
+        script.runInContext(context, { timeout });
+    } catch (error) {
+        uncaught(error);
+    }
+    settle();
+}
+
+function nextJob() {
+    if (current === null && jobs.length) {
+        runJob(jobs.shift());
+    }
+}
+
+// Errors that escape the vm, e.g. from promise callbacks, end the program like in plain node
+process.on('unhandledRejection', reason => {
+    if (current !== null) {
+        current.fail(isError(reason) ? reason : new Error(`Unhandled promise rejection: ${util.inspect(reason)}`));
+    }
+});
+process.on('uncaughtException', error => {
+    if (current === null) {
+        // A fault of the host itself, the pool starts a fresh one
+        process.exit(70);
+    }
+    current.fail(error);
+});
+
+readline.createInterface({ input: process.stdin }).on('line', line => {
+    if (line.trim()) {
+        jobs.push(JSON.parse(line));
+        nextJob();
+    }
+});
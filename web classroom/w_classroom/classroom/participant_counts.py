@@ -0,0 +1,91 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+from .lobby import invalidate_lobby
+from .metrics import count_db_calls
+
+# Get logger
+logger = logging.getLogger('classroom.websocket')
+
+
+class ParticipantCountWriter:
+    """Coalesces participant_count changes and writes them in bulk
+
+    Consumers only record the latest count of their room; a flush scheduled
+    `interval` seconds after the first change writes every pending room
+    with a single UPDATE and invalidates the cached lobby, which lists
+    these counts. Whatever is still pending when the process exits
+    is written by an atexit hook.
+    """
+
+    BATCH_SIZE = 500  # rooms per UPDATE statement
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_handle = None
+
+    def set(self, session_id, count):
+        """Record the current participant count of a room"""
+        with self._lock:
+            self._pending[session_id] = count
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.interval, lambda: loop.create_task(self.flush()))
+
+    async def flush(self):
+        """Write all pending counts"""
+        self._flush_handle = None
+        await database_sync_to_async(self.flush_now)()
+        await invalidate_lobby()
+
+    @count_db_calls('write_participant_counts')
+    def flush_now(self):
+        """Write all pending counts from synchronous code"""
+        from classroom.models import CodeSession
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        items = list(pending.items())
+        try:
+            for start in range(0, len(items), self.BATCH_SIZE):
+                batch = items[start:start + self.BATCH_SIZE]
+                updated = CodeSession.objects.filter(session_id__in=[session_id for session_id, _ in batch]).update(
+                    participant_count=Case(
+                        *[When(session_id=session_id, then=Value(count)) for session_id, count in batch],
+                        output_field=IntegerField(),
+                    )
+                )
+                logger.debug(f"Updated participant counts of {updated} sessions")
+        except Exception as e:
+            logger.error(f"Error updating participant counts: {e}", exc_info=True)
+            # Keep the counts for the next flush unless newer ones arrived meanwhile
+            with self._lock:
+                for session_id, count in items:
+                    self._pending.setdefault(session_id, count)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_participant_counts():
+    """Return the shared participant count writer"""
+    global _writer
+
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ParticipantCountWriter(getattr(settings, 'CLASSROOM_PARTICIPANT_COUNT_FLUSH_INTERVAL', 0.25))
+                atexit.register(_writer.flush_now)
+    return _writer
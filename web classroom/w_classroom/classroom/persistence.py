@@ -0,0 +1,163 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import count_db_calls
+
+# Get logger
+logger = logging.getLogger('classroom.websocket')
+
+
+class CodePersister:
+    """Debounced writes of the shared document to CodeSession.code
+
+    A save happens `delay` seconds after the last edit of a room, but no
+    later than `max_delay` seconds after the first unsaved one, and when
+    the last participant leaves. At most one CodeSnapshot is recorded per
+    `snapshot_interval` and only the newest `history` are kept. Saves still
+    pending when the process exits are written by an atexit hook.
+    """
+
+    def __init__(self, delay, max_delay, snapshot_interval, history):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.snapshot_interval = snapshot_interval
+        self.history = history
+        self._timers = {}
+        self._stores = {}
+        self._first_change = {}
+        self._saved_code = {}
+        self._last_snapshot = {}
+
+    def schedule(self, session_id, store):
+        """Record that a room changed and (re)start its save timer"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        first_change = self._first_change.setdefault(session_id, now)
+        delay = min(self.delay, max(0, first_change + self.max_delay - now))
+
+        timer = self._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._stores[session_id] = store
+        self._timers[session_id] = loop.call_later(
+            delay, lambda: loop.create_task(self.save(session_id, store))
+        )
+
+    def flush_now(self):
+        """Write every pending save from synchronous code, e.g. at exit"""
+        pending = {session_id: self._stores[session_id] for session_id in list(self._timers)}
+        for session_id in pending:
+            self._cancel(session_id)
+        if not pending:
+            return
+
+        for session_id, snapshot in asyncio.run(self._snapshots(pending)).items():
+            if snapshot is None or self._saved_code.get(session_id) == snapshot['code']:
+                continue
+            try:
+                write_code_now(session_id, snapshot['code'], snapshot['version'], True, self.history)
+            except Exception as e:
+                logger.error(f"Could not save code of session {session_id}: {e}", exc_info=True)
+                continue
+            self._saved_code[session_id] = snapshot['code']
+        logger.info(f"Flushed pending code of {len(pending)} sessions")
+
+    async def _snapshots(self, pending):
+        snapshots = {}
+        for session_id, store in pending.items():
+            try:
+                snapshots[session_id] = await store.snapshot(session_id)
+            except Exception as e:
+                # E.g. a Redis client tied to the stopped loop, the document then stays in Redis
+                logger.error(f"Could not read code of session {session_id}: {e}", exc_info=True)
+        return snapshots
+
+    async def save(self, session_id, store):
+        """Write the room's current document if it changed since the last save"""
+        self._cancel(session_id)
+        snapshot = await store.snapshot(session_id)
+        if snapshot is not None:
+            await self._write(session_id, snapshot, final=False)
+
+    async def save_final(self, session_id, snapshot):
+        """Write the document of a room whose last participant left"""
+        self._cancel(session_id)
+        try:
+            await self._write(session_id, snapshot, final=True)
+        finally:
+            self._saved_code.pop(session_id, None)
+            self._last_snapshot.pop(session_id, None)
+
+    def _cancel(self, session_id):
+        timer = self._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._stores.pop(session_id, None)
+        self._first_change.pop(session_id, None)
+
+    async def _write(self, session_id, snapshot, final):
+        code = snapshot['code']
+        if self._saved_code.get(session_id) == code:
+            return
+
+        now = timezone.now()
+        last_snapshot = self._last_snapshot.get(session_id)
+        take_snapshot = final or last_snapshot is None or \
+            (now - last_snapshot).total_seconds() >= self.snapshot_interval
+        try:
+            await write_code(session_id, code, snapshot['version'], take_snapshot, self.history)
+        except Exception as e:
+            logger.error(f"Could not save code of session {session_id}: {e}", exc_info=True)
+            return
+
+        self._saved_code[session_id] = code
+        if take_snapshot:
+            self._last_snapshot[session_id] = now
+        logger.debug(f"Saved code of session {session_id} (version {snapshot['version']}, snapshot: {take_snapshot})")
+
+
+@count_db_calls('write_code')
+def write_code_now(session_id, code, version, take_snapshot, history):
+    from classroom.models import CodeSession, CodeSnapshot
+
+    with transaction.atomic():
+        # updated_at drives the lobby's activity filter
+        updated = CodeSession.objects.filter(session_id=session_id).update(code=code, updated_at=timezone.now())
+        if not updated or not take_snapshot:
+            return
+
+        session_pk = CodeSession.objects.values_list('pk', flat=True).get(session_id=session_id)
+        CodeSnapshot.objects.create(session_id=session_pk, code=code, version=version)
+        keep = CodeSnapshot.objects.filter(session_id=session_pk).order_by('-created_at', '-pk').values_list('pk', flat=True)[:history]
+        CodeSnapshot.objects.filter(session_id=session_pk).exclude(pk__in=list(keep)).delete()
+
+
+write_code = database_sync_to_async(write_code_now)
+
+
+_persister = None
+_persister_lock = threading.Lock()
+
+
+def get_code_persister():
+    """Return the shared code persister"""
+    global _persister
+
+    if _persister is None:
+        with _persister_lock:
+            if _persister is None:
+                _persister = CodePersister(
+                    delay=getattr(settings, 'CLASSROOM_CODE_SAVE_DELAY', 2),
+                    max_delay=getattr(settings, 'CLASSROOM_CODE_SAVE_MAX_DELAY', 10),
+                    snapshot_interval=getattr(settings, 'CLASSROOM_SNAPSHOT_INTERVAL', 60),
+                    history=getattr(settings, 'CLASSROOM_SNAPSHOT_HISTORY', 20),
+                )
+                atexit.register(_persister.flush_now)
+    return _persister
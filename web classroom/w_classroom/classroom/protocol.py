@@ -0,0 +1,43 @@
+import json
+
+# Clients that offer this WebSocket subprotocol get the compact encoding
+COMPACT_SUBPROTOCOL = 'classroom.compact.v1'
+
+# High-frequency messages are sent as arrays: a short type code followed by
+# the fields in this order
+COMPACT_MESSAGES = {
+    'code_delta': ('d', ('version', 'op', 'username')),
+    'code_ack': ('a', ('version',)),
+    'output_chunk': ('o', ('job_id', 'stream', 'data')),
+    'participant_joined': ('j', ('username', 'owner')),
+    'participant_left': ('l', ('username', 'owner')),
+}
+COMPACT_TYPES = {code: (message_type, fields) for message_type, (code, fields) in COMPACT_MESSAGES.items()}
+
+COMPACT_SEPARATORS = (',', ':')
+
+
+def encode(message, compact=False):
+    """Serialize a message for a client, using short type codes if it negotiated them"""
+    if not compact:
+        return json.dumps(message)
+    entry = COMPACT_MESSAGES.get(message.get('type'))
+    if entry is None:
+        return json.dumps(message, separators=COMPACT_SEPARATORS)
+    code, fields = entry
+    return json.dumps([code, *(message.get(field) for field in fields)], separators=COMPACT_SEPARATORS)
+
+
+def decode(text):
+    """Parse a message from a client, in either encoding, into a dict
+
+    Raises ValueError for invalid JSON and unknown type codes.
+    """
+    data = json.loads(text)
+    if isinstance(data, dict):
+        return data
+    if not isinstance(data, list) or not data or not isinstance(data[0], str) or data[0] not in COMPACT_TYPES:
+        raise ValueError("not a message object or a known compact message")
+    message_type, fields = COMPACT_TYPES[data[0]]
+    # Trailing fields may be left out, e.g. clients never send a username
+    return {'type': message_type, **dict(zip(fields, data[1:]))}
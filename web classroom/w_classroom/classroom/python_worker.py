@@ -0,0 +1,222 @@
+"""
+Warm Python worker used by the classroom execution pool.
+
+The worker reads one JSON job per line on stdin. While the job runs it
+writes one JSON line per output chunk on stdout, followed by a final line
+with the exit status. Every job runs in a child forked from this
+already-started interpreter, so submissions never share state with each
+other and the interpreter startup cost is only paid once per worker.
+
+This file is executed as a standalone script and must not import anything
+from the Django project.
+"""
+
+import codecs
+import json
+import os
+import select
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def run_user_code(code):
+    """Run the submission in the current (forked) process, return exit code"""
+    namespace = {'__name__': '__main__', '__builtins__': __builtins__}
+    try:
+        exec(compile(code, 'main.py', 'exec'), namespace)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        etype, value, tb = sys.exc_info()
+        # Hide this frame so tracebacks look like a plain `python main.py`
+        traceback.print_exception(etype, value, tb.tb_next)
+        return 1
+    return 0
+
+
+def apply_sandbox(job):
+    """Confine the child to its private directory and resource limits"""
+    workdir = job.get('workdir')
+    if workdir:
+        os.chdir(workdir)
+        for name in ('TMPDIR', 'TEMP', 'TMP'):
+            os.environ[name] = workdir
+
+    if resource is None:
+        return
+    for name, soft, hard in job.get('limits', []):
+        limit = getattr(resource, name, None)
+        if limit is None:
+            continue
+        _, current_hard = resource.getrlimit(limit)
+        if current_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        resource.setrlimit(limit, (soft, hard))
+
+
+def redirect_stdin(job):
+    """Feed the job's input to the child, from an already deleted temporary file"""
+    data = job.get('stdin') or ''
+    if data:
+        source = tempfile.TemporaryFile(dir=job.get('workdir'))
+        source.write(data.encode('utf-8'))
+        source.seek(0)
+        fd = source.fileno()
+    else:
+        fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(fd, 0)
+    sys.stdin = open(0, encoding='utf-8', errors='replace', closefd=False)
+
+
+def child_main(job, out_w, err_w):
+    """Entry point of the forked child, never returns"""
+    exit_code = 1
+    try:
+        os.setsid()
+        redirect_stdin(job)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        sys.argv = ['main.py']
+        apply_sandbox(job)
+        exit_code = run_user_code(job.get('code', ''))
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def kill_group(pid):
+    """Kill the child and anything it spawned"""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def wait_for_exit(pid, deadline):
+    """Wait for the child to exit, return its wait status or None on timeout"""
+    pidfd = None
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+
+    try:
+        while True:
+            waited_pid, status = os.waitpid(pid, os.WNOHANG)
+            if waited_pid:
+                return status
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if pidfd is not None:
+                select.select([pidfd], [], [], remaining)
+            else:
+                time.sleep(min(remaining, 0.001))
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def handle_job(job, emit):
+    """Fork a child for one submission and stream its output through emit"""
+    timeout = job.get('timeout', 10)
+    max_output = job.get('max_output', 256 * 1024)
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        child_main(job, out_w, err_w)
+
+    os.close(out_w)
+    os.close(err_w)
+
+    deadline = time.monotonic() + timeout
+    streams = {out_r: 'stdout', err_r: 'stderr'}
+    decoders = {fd: codecs.getincrementaldecoder('utf-8')(errors='replace') for fd in streams}
+    open_fds = [out_r, err_r]
+    output_size = 0
+    timed_out = False
+    truncated = False
+
+    while open_fds and not truncated:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        readable, _, _ = select.select(open_fds, [], [], remaining)
+        for fd in readable:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                open_fds.remove(fd)
+                data = decoders[fd].decode(b'', final=True)
+                if data:
+                    emit({'stream': streams[fd], 'data': data})
+                continue
+            if output_size + len(chunk) > max_output:
+                chunk = chunk[:max_output - output_size]
+                truncated = True
+            output_size += len(chunk)
+            data = decoders[fd].decode(chunk, final=truncated)
+            if data:
+                emit({'stream': streams[fd], 'data': data})
+            if truncated:
+                break
+
+    status = None
+    if not timed_out and not truncated:
+        status = wait_for_exit(pid, deadline)
+        timed_out = status is None
+
+    kill_group(pid)
+    if status is None:
+        _, status = os.waitpid(pid, 0)
+
+    os.close(out_r)
+    os.close(err_r)
+
+    return {
+        'done': True,
+        'returncode': os.waitstatus_to_exitcode(status),
+        'timed_out': timed_out,
+        'truncated': truncated,
+    }
+
+
+def main():
+    stdin = sys.stdin.buffer
+    stdout = sys.stdout.buffer
+
+    def emit(message):
+        stdout.write(json.dumps(message).encode('utf-8') + b'\n')
+        stdout.flush()
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        emit(handle_job(json.loads(line), emit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import time
+from collections import Counter
+
+from .metrics import THROTTLED
+
+# Messages held back, merged or dropped by the WebSocket rate limits since
+# the process started, by reason
+throttle_counts = Counter()
+THROTTLED.set_function(lambda: {(reason,): count for reason, count in throttle_counts.items()})
+
+
+class TokenBucket:
+    """Allows `rate` messages per second on average and bursts of `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        """Whether a message may be sent now"""
+        self._refill()
+        return self.tokens >= 1
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def wait_time(self):
+        """Seconds until the next message may be sent"""
+        self._refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+def take_tokens(*buckets):
+    """Take a token from every bucket if all of them have one"""
+    if not all(bucket.available() for bucket in buckets):
+        return False
+    for bucket in buckets:
+        bucket.take()
+    return True
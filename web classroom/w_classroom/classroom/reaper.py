@@ -0,0 +1,93 @@
+import logging
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .lobby import invalidate_lobby
+from .models import CodeSession
+
+# Get logger
+logger = logging.getLogger('classroom')
+
+BATCH_SIZE = 500  # rooms per DELETE or UPDATE statement
+
+
+def idle_cutoffs(now=None):
+    """Times before which rooms count as abandoned, from the settings
+
+    Returns a tuple (rooms, empty_rooms, outputs): rooms idle since before
+    `rooms` are deleted, rooms that never got any code already once idle
+    since before `empty_rooms`, and the last run output of rooms idle since
+    before `outputs` is cleared.
+    """
+    now = now or timezone.now()
+    return (
+        now - timedelta(days=getattr(settings, 'CLASSROOM_ROOM_IDLE_DAYS', 30)),
+        now - timedelta(hours=getattr(settings, 'CLASSROOM_EMPTY_ROOM_IDLE_HOURS', 2)),
+        now - timedelta(hours=getattr(settings, 'CLASSROOM_OUTPUT_RETENTION_HOURS', 24)),
+    )
+
+
+def stale_rooms(idle_before, empty_idle_before):
+    """Rooms nobody has touched since idle_before, or empty ones since empty_idle_before
+
+    Empty rooms are mostly created by visiting a room URL; they are only
+    reaped early while nobody is in them.
+    """
+    return CodeSession.objects.filter(
+        Q(updated_at__lt=idle_before) | Q(updated_at__lt=empty_idle_before, code='', participant_count=0)
+    )
+
+
+def delete_stale_rooms(idle_before, empty_idle_before, batch_size=BATCH_SIZE, dry_run=False):
+    """Delete stale rooms with their snapshots and moderation rows, batch by batch
+
+    Every batch is deleted in its own transaction and the idle condition
+    is checked again at delete time, so a room that became active since
+    its batch was selected is kept. Returns the number of rooms deleted.
+    """
+    rooms = stale_rooms(idle_before, empty_idle_before)
+    if dry_run:
+        return rooms.count()
+
+    deleted = 0
+    while True:
+        batch = list(rooms.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            # Rooms updated meanwhile are skipped and no longer match the next batch
+            _, counts = rooms.filter(pk__in=batch).delete()
+        deleted += counts.get(CodeSession._meta.label, 0)
+        logger.debug(f"Deleted a batch of {counts.get(CodeSession._meta.label, 0)} stale rooms")
+
+    if deleted:
+        async_to_sync(invalidate_lobby)()
+        logger.info(f"Deleted {deleted} stale rooms")
+    return deleted
+
+
+def compact_outputs(idle_before, batch_size=BATCH_SIZE, dry_run=False):
+    """Clear the stored run output of rooms idle since idle_before
+
+    updated_at is left alone so compaction never makes a room look active.
+    Returns the number of rooms compacted.
+    """
+    rooms = CodeSession.objects.filter(updated_at__lt=idle_before).exclude(output='')
+    if dry_run:
+        return rooms.count()
+
+    compacted = 0
+    while True:
+        batch = list(rooms.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        compacted += rooms.filter(pk__in=batch).update(output='')
+
+    if compacted:
+        logger.info(f"Cleared the run output of {compacted} idle rooms")
+    return compacted
@@ -0,0 +1,47 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def make_key(session_id, language, code, stdin=''):
+    digest = hashlib.sha256('\0'.join((str(session_id), language, stdin, code)).encode('utf-8')).hexdigest()
+    return f'classroom:result:{digest}'
+
+
+class ResultCache:
+    """Outputs of runs marked deterministic, reused for identical submissions
+
+    Entries belong to one room. Only runs whose submitter marked the program
+    deterministic are stored, and only when they finished without hitting a
+    sandbox limit. An entry stored from a run of the room's creator is an
+    example: it is also served to unmarked runs of the same code in that
+    room, so students running the teacher's starter code get its output
+    without taking an executor slot.
+    """
+
+    def __init__(self, cache, ttl, max_bytes):
+        self.cache = cache
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    async def get(self, session_id, language, code, stdin='', deterministic=False):
+        """Return the output of a cached run the submission may use, or None"""
+        entry = await self.cache.aget(make_key(session_id, language, code, stdin))
+        if entry is None or not (deterministic or entry['example']):
+            return None
+        return entry['output']
+
+    async def put(self, session_id, language, code, output, stdin='', example=False):
+        if len(output.encode('utf-8')) > self.max_bytes:
+            return
+        await self.cache.aset(make_key(session_id, language, code, stdin), {'output': output, 'example': example}, self.ttl)
+
+
+def get_result_cache():
+    """Return the shared result cache, or None when it is disabled"""
+    ttl = getattr(settings, 'CLASSROOM_RESULT_CACHE_TTL', 600)
+    if ttl <= 0:
+        return None
+    alias = 'results' if 'results' in settings.CACHES else 'default'
+    return ResultCache(caches[alias], ttl, getattr(settings, 'CLASSROOM_RESULT_CACHE_MAX_BYTES', 64 * 1024))
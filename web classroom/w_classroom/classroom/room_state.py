@@ -0,0 +1,143 @@
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import ACTIVE_ROOMS, count_db_calls
+from .rate_limit import TokenBucket
+
+# Get logger
+logger = logging.getLogger('classroom.websocket')
+
+
+class RoomState:
+    """Per-process cache of a room's saved code and moderation lists
+
+    Loaded from the database when the first participant connects and kept
+    until the last one leaves, so mute and ban checks never touch the
+    database. Changes are applied in place and queued; the queue is written
+    back in the background as single-row inserts and deletes, and a room is
+    only dropped once its pending writes are done. `code` is replaced by the
+    final text when the last participant leaves, before it is saved.
+    Other workers learn about changes from the room's group messages.
+    `broadcasts` limits the messages this process sends to the room group.
+    """
+
+    def __init__(self, session_id, code='', muted_users=(), banned_ips=()):
+        self.session_id = session_id
+        self.code = code
+        self.muted_users = set(muted_users)
+        self.banned_ips = set(banned_ips)
+        self.connections = 0
+        self.broadcasts = TokenBucket(
+            getattr(settings, 'CLASSROOM_ROOM_MESSAGE_RATE', 100),
+            getattr(settings, 'CLASSROOM_ROOM_MESSAGE_BURST', 200),
+        )
+        self._changes = []
+        self._save_task = None
+
+    @property
+    def saving(self):
+        return self._save_task is not None and not self._save_task.done()
+
+    def mute(self, username):
+        self.muted_users.add(username)
+        self.schedule_save('mute', username)
+
+    def unmute(self, username):
+        self.muted_users.discard(username)
+        self.schedule_save('unmute', username)
+
+    def ban(self, ip):
+        self.banned_ips.add(ip)
+        self.schedule_save('ban', ip)
+
+    def schedule_save(self, action, value):
+        """Write a moderation change to the database in the background"""
+        self._changes.append((action, value))
+        if not self.saving:
+            self._save_task = asyncio.get_running_loop().create_task(self._save())
+
+    async def _save(self):
+        # Changes made while a write is in flight are picked up by the next pass
+        while self._changes:
+            changes, self._changes = self._changes, []
+            try:
+                await write_moderation(self.session_id, changes)
+            except Exception as e:
+                logger.error(f"Could not save moderation lists of session {self.session_id}: {e}", exc_info=True)
+
+        if self.connections == 0 and room_states.get(self.session_id) is self:
+            del room_states[self.session_id]
+
+    async def wait_saved(self):
+        """Wait until every scheduled write has reached the database"""
+        while self.saving:
+            await asyncio.shield(self._save_task)
+
+
+@database_sync_to_async
+@count_db_calls('read_room')
+def read_room(session_id):
+    from classroom.models import CodeSession
+
+    try:
+        session = CodeSession.objects.only('code').get(session_id=session_id)
+    except CodeSession.DoesNotExist:
+        return RoomState(session_id)
+    return RoomState(
+        session_id,
+        session.code,
+        session.mutes.values_list('username', flat=True),
+        session.bans.values_list('ip', flat=True),
+    )
+
+
+@database_sync_to_async
+@count_db_calls('write_moderation')
+def write_moderation(session_id, changes):
+    """Apply queued (action, value) moderation changes in one transaction"""
+    from classroom.models import CodeSession, RoomBan, RoomMute
+
+    with transaction.atomic():
+        try:
+            session_pk = CodeSession.objects.values_list('pk', flat=True).get(session_id=session_id)
+        except CodeSession.DoesNotExist:
+            # Closed while the changes were queued
+            return
+
+        for action, value in changes:
+            if action == 'mute':
+                RoomMute.objects.bulk_create([RoomMute(session_id=session_pk, username=value)], ignore_conflicts=True)
+            elif action == 'unmute':
+                RoomMute.objects.filter(session_id=session_pk, username=value).delete()
+            elif action == 'ban':
+                RoomBan.objects.bulk_create([RoomBan(session_id=session_pk, ip=value)], ignore_conflicts=True)
+
+
+async def acquire_room_state(session_id):
+    """Return the cached state of a room, loading it on first use"""
+    state = room_states.get(session_id)
+    if state is None:
+        loaded = await read_room(session_id)
+        # Another connection may have loaded it while we were waiting
+        state = room_states.setdefault(session_id, loaded)
+    state.connections += 1
+    return state
+
+
+def release_room_state(state):
+    """Drop a room from the cache once its last connection is gone"""
+    state.connections -= 1
+    if state.connections > 0 or state.saving:
+        return
+    if room_states.get(state.session_id) is state:
+        del room_states[state.session_id]
+        logger.debug(f"Released cached state of session {state.session_id}")
+
+
+# Rooms with at least one connection in this process
+room_states = {}
+ACTIVE_ROOMS.set_function(lambda: len(room_states))
@@ -0,0 +1,353 @@
+import asyncio
+import contextlib
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .documents import OperationError, SharedDocument, diff
+
+# Get logger
+logger = logging.getLogger('classroom.websocket')
+
+
+def _remove_connection(user, channel):
+    """Drop one connection of a participant, returns whether any are left"""
+    channels = user['channels']
+    if channel in channels:
+        channels.remove(channel)
+    elif channels:
+        channels.pop()
+    return bool(channels)
+
+
+class MemoryRoomStore:
+    """Room membership and shared documents kept in this process
+
+    Only correct with a single ASGI worker, set CLASSROOM_REDIS_URL to run
+    several workers.
+    """
+
+    def __init__(self):
+        # Structure: {session_id: {'owner': 'username', 'users': {'username': {'ip': ..., 'channel': ..., 'channels': [...]}}}}
+        self.rooms = {}
+        self.documents = {}
+
+    async def join(self, session_id, username, info):
+        """Add a connection of a participant, returns (participants, owner)
+
+        A name may be connected several times, e.g. from two tabs; it stays
+        a participant until its last connection leaves.
+        """
+        room = self.rooms.setdefault(session_id, {'owner': username, 'users': {}})
+        user = room['users'].setdefault(username, {**info, 'channels': []})
+        user['channels'].append(info['channel'])
+        return list(room['users']), room['owner']
+
+    async def leave(self, session_id, username, channel=None):
+        """Remove a connection of a participant, returns (participants, owner, owner_changed)
+
+        The next participant becomes the owner when the owner leaves. An
+        empty room's document stays open until close_document is called.
+        """
+        room = self.rooms.get(session_id)
+        if room is None:
+            return [], None, False
+        user = room['users'].get(username)
+        if user is not None and _remove_connection(user, channel):
+            return list(room['users']), room['owner'], False
+        room['users'].pop(username, None)
+        if not room['users']:
+            del self.rooms[session_id]
+            return [], None, False
+
+        owner_changed = room['owner'] == username
+        if owner_changed:
+            room['owner'] = next(iter(room['users']))
+        return list(room['users']), room['owner'], owner_changed
+
+    async def members(self, session_id):
+        """Return (participants, owner) of a room"""
+        room = self.rooms.get(session_id)
+        if room is None:
+            return [], None
+        return list(room['users']), room['owner']
+
+    async def get_user(self, session_id, username):
+        """Connection info of a participant, or None"""
+        return self.rooms.get(session_id, {}).get('users', {}).get(username)
+
+    async def open_document(self, session_id, code):
+        """Create the room's document from the saved code unless it exists"""
+        self.documents.setdefault(session_id, SharedDocument(code))
+
+    async def snapshot(self, session_id):
+        """Current text and version of the document, or None when it is not open"""
+        document = self.documents.get(session_id)
+        return document.snapshot() if document is not None else None
+
+    async def close_document(self, session_id):
+        """Drop the document of an empty room, returns its final snapshot or None"""
+        if session_id in self.rooms or session_id not in self.documents:
+            return None
+        return self.documents.pop(session_id).snapshot()
+
+    async def apply_edit(self, session_id, base_version, op):
+        """Apply a client operation, returns (transformed operation, version)"""
+        document = self.documents.get(session_id)
+        if document is None:
+            raise OperationError("document is not open")
+        return document.receive(base_version, op)
+
+    async def replace_text(self, session_id, text):
+        """Replace the whole document, returns (operation, version)"""
+        document = self.documents.get(session_id)
+        if document is None:
+            raise OperationError("document is not open")
+        return document.replace(text)
+
+
+class RedisRoomStore:
+    """Room membership and shared documents shared by all workers through Redis
+
+    Keys per room: `users` (hash of participant info and connections in
+    join order), `owner`, `seq` (join counter), `doc` (hash with text and
+    version), `ops` (recent operations for transforming late edits) and
+    `lock`. Joins, leaves, edits and closing the document take the room's
+    lock so they happen in one global order.
+
+    Every connection records the worker it came in through. A worker with
+    connections refreshes its `worker` key every HEARTBEAT_INTERVAL; the
+    connections of a worker whose key expired, e.g. because it crashed,
+    are dropped by the next join or leave of the room and ignored until then.
+    """
+
+    LOCK_TIMEOUT = 2  # seconds an edit may hold a room's document lock
+    LOCK_RETRY = 0.005  # seconds between attempts to take the lock
+    WORKER_TTL = 30  # seconds a worker's connections outlive its last heartbeat
+    HEARTBEAT_INTERVAL = 10  # seconds between heartbeats
+
+    def __init__(self, client, prefix='classroom'):
+        self.client = client
+        self.prefix = prefix
+        self.worker_id = uuid.uuid4().hex
+        self._connections = 0
+        self._heartbeat = None
+
+    def _key(self, session_id, name):
+        return f'{self.prefix}:room:{session_id}:{name}'
+
+    def _worker_key(self, worker_id):
+        return f'{self.prefix}:worker:{worker_id}'
+
+    async def join(self, session_id, username, info):
+        # Under the room's lock so a join can't slip between a last leave's steps
+        async with self._lock(session_id):
+            await self._start_heartbeat()
+            await self._prune(session_id)
+            users_key = self._key(session_id, 'users')
+            user = await self.get_user(session_id, username)
+            if user is None:
+                seq = await self.client.incr(self._key(session_id, 'seq'))
+                user = {**info, 'seq': seq, 'channels': [], 'workers': {}}
+            user['channels'].append(info['channel'])
+            user['workers'][info['channel']] = self.worker_id
+            await self.client.hset(users_key, username, json.dumps(user))
+            await self.client.set(self._key(session_id, 'owner'), username, nx=True)
+            self._connections += 1
+            return await self.members(session_id)
+
+    async def leave(self, session_id, username, channel=None):
+        async with self._lock(session_id):
+            self._connections -= 1
+            if self._connections <= 0:
+                self._stop_heartbeat()
+            await self._prune(session_id)
+            users_key = self._key(session_id, 'users')
+            user = await self.get_user(session_id, username)
+            if user is not None:
+                user['workers'].pop(channel, None)
+                if _remove_connection(user, channel):
+                    await self.client.hset(users_key, username, json.dumps(user))
+                    return (*await self.members(session_id), False)
+            await self.client.hdel(users_key, username)
+            participants, _ = await self.members(session_id)
+            if not participants:
+                await self.client.delete(*(
+                    self._key(session_id, name) for name in ('users', 'owner', 'seq')
+                ))
+                return [], None, False
+
+            owner = await self.client.get(self._key(session_id, 'owner'))
+            owner_changed = owner not in participants
+            if owner_changed:
+                owner = participants[0]
+                await self.client.set(self._key(session_id, 'owner'), owner)
+            return participants, owner, owner_changed
+
+    async def members(self, session_id):
+        users, _ = await self._load_users(session_id)
+        participants = sorted(users, key=lambda name: users[name]['seq'])
+        owner = await self.client.get(self._key(session_id, 'owner'))
+        if owner not in users:
+            # Its worker died, the next join or leave hands ownership on
+            owner = participants[0] if participants else None
+        return participants, owner
+
+    async def _load_users(self, session_id):
+        """Participants without the connections of dead workers, and whether any were dropped"""
+        users = {
+            name: json.loads(info)
+            for name, info in (await self.client.hgetall(self._key(session_id, 'users'))).items()
+        }
+        dead = set()
+        for worker in {worker for user in users.values() for worker in user.setdefault('workers', {}).values()}:
+            if worker != self.worker_id and await self.client.get(self._worker_key(worker)) is None:
+                dead.add(worker)
+
+        pruned = False
+        for name, user in list(users.items()):
+            for channel, worker in list(user['workers'].items()):
+                if worker in dead:
+                    del user['workers'][channel]
+                    if channel in user['channels']:
+                        user['channels'].remove(channel)
+                    pruned = True
+            if not user['channels']:
+                del users[name]
+        return users, pruned
+
+    async def _prune(self, session_id):
+        """Write back the room without the connections of dead workers, the room's lock must be held"""
+        users, pruned = await self._load_users(session_id)
+        if not pruned:
+            return
+        logger.warning(f"Dropped connections of dead workers from session {session_id}, participants left: {sorted(users)}")
+        users_key = self._key(session_id, 'users')
+        await self.client.delete(users_key)
+        if users:
+            await self.client.hset(users_key, mapping={name: json.dumps(user) for name, user in users.items()})
+        _, owner = await self.members(session_id)
+        if owner is None:
+            await self.client.delete(self._key(session_id, 'owner'))
+        else:
+            await self.client.set(self._key(session_id, 'owner'), owner)
+
+    async def _start_heartbeat(self):
+        if self._heartbeat is not None and not self._heartbeat.done():
+            return
+        await self._beat_once()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._beat())
+
+    def _stop_heartbeat(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    async def _beat_once(self):
+        await self.client.set(self._worker_key(self.worker_id), '1', px=self.WORKER_TTL * 1000)
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+            try:
+                await self._beat_once()
+            except Exception as e:
+                logger.error(f"Room store heartbeat of worker {self.worker_id} failed: {e}")
+
+    async def get_user(self, session_id, username):
+        info = await self.client.hget(self._key(session_id, 'users'), username)
+        return json.loads(info) if info is not None else None
+
+    async def open_document(self, session_id, code):
+        key = self._key(session_id, 'doc')
+        await self.client.hsetnx(key, 'text', code)
+        await self.client.hsetnx(key, 'version', 0)
+
+    async def snapshot(self, session_id):
+        doc = await self.client.hgetall(self._key(session_id, 'doc'))
+        if 'text' not in doc:
+            return None
+        return {'code': doc['text'], 'version': int(doc['version'])}
+
+    async def close_document(self, session_id):
+        async with self._lock(session_id):
+            # Someone may have joined through another worker meanwhile
+            if await self.client.hgetall(self._key(session_id, 'users')):
+                return None
+            snapshot = await self.snapshot(session_id)
+            await self.client.delete(self._key(session_id, 'doc'), self._key(session_id, 'ops'))
+            return snapshot
+
+    async def apply_edit(self, session_id, base_version, op):
+        async with self._lock(session_id):
+            document = await self._load_document(session_id, base_version)
+            return await self._save_edit(session_id, document, document.receive(base_version, op))
+
+    async def replace_text(self, session_id, text):
+        async with self._lock(session_id):
+            document = await self._load_document(session_id)
+            return await self._save_edit(session_id, document, document.receive(
+                document.version, diff(document.text, text)
+            ))
+
+    async def _load_document(self, session_id, base_version=None):
+        """Document with the operations applied since base_version as history"""
+        doc = await self.client.hgetall(self._key(session_id, 'doc'))
+        if 'text' not in doc:
+            raise OperationError("document is not open")
+
+        document = SharedDocument(doc['text'], int(doc['version']))
+        if isinstance(base_version, int) and base_version < document.version:
+            missed = min(document.version - base_version, SharedDocument.HISTORY_LIMIT)
+            ops = await self.client.lrange(self._key(session_id, 'ops'), -missed, -1)
+            document.history.extend(json.loads(op) for op in ops)
+        return document
+
+    async def _save_edit(self, session_id, document, result):
+        op, version = result
+        await self.client.hset(self._key(session_id, 'doc'), mapping={'text': document.text, 'version': version})
+        ops_key = self._key(session_id, 'ops')
+        await self.client.rpush(ops_key, json.dumps(op))
+        await self.client.ltrim(ops_key, -SharedDocument.HISTORY_LIMIT, -1)
+        return op, version
+
+    @contextlib.asynccontextmanager
+    async def _lock(self, session_id):
+        key = self._key(session_id, 'lock')
+        token = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.LOCK_TIMEOUT
+        while not await self.client.set(key, token, nx=True, px=int(self.LOCK_TIMEOUT * 1000)):
+            if loop.time() > deadline:
+                raise OperationError(f"document of session {session_id} is busy")
+            await asyncio.sleep(self.LOCK_RETRY)
+        try:
+            yield
+        finally:
+            # The lock may have expired and been taken by another worker
+            if await self.client.get(key) == token:
+                await self.client.delete(key)
+
+
+_store = None
+
+
+def get_room_store():
+    """Return the room store selected by CLASSROOM_REDIS_URL"""
+    global _store
+
+    if _store is None:
+        url = getattr(settings, 'CLASSROOM_REDIS_URL', None)
+        if url:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise ImproperlyConfigured("CLASSROOM_REDIS_URL is set but the redis package is not installed")
+            _store = RedisRoomStore(redis.from_url(url, decode_responses=True))
+            logger.info("Room registry is shared through Redis")
+        else:
+            _store = MemoryRoomStore()
+    return _store
@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import signal
+import sys
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits
+    resource = None
+
+SANDBOX_EXEC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_exec.py')
+
+LIMIT_MESSAGES = {
+    'timeout': 'Code execution timed out',
+    'cpu': 'CPU time limit exceeded',
+    'memory': 'Memory limit exceeded',
+    'processes': 'Process limit exceeded',
+    'open_files': 'Open file limit exceeded',
+    'file_size': 'File size limit exceeded',
+    'output': 'Output limit exceeded',
+}
+
+# Error text printed by the runtimes when an allocation or fork is refused
+MEMORY_ERRORS = (
+    'MemoryError',
+    'std::bad_alloc',
+    'java.lang.OutOfMemoryError',
+    'JavaScript heap out of memory',
+    'Cannot allocate memory',
+)
+PROCESS_ERRORS = (
+    'Resource temporarily unavailable',
+    'unable to create native thread',
+)
+OPEN_FILE_ERRORS = (
+    'Too many open files',
+)
+FILE_SIZE_ERRORS = (
+    'File too large',
+)
+
+
+class SandboxProfile:
+    """Resource limits applied to every executed program
+
+    Limits are enforced with setrlimit by the sandbox_exec.py wrapper,
+    which then execs the program. On platforms without the resource module
+    only the wall-clock timeout and output cap apply.
+
+    RLIMIT_NPROC counts every process and thread of the user, not just the
+    program's, so the process limit is off unless the server runs under a
+    dedicated user.
+    """
+
+    MB = 1024 * 1024
+
+    def __init__(self, cpu_seconds=10, memory_mb=512, processes=None, open_files=64, file_size_mb=16):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.processes = processes
+        self.open_files = open_files
+        self.file_size_mb = file_size_mb
+
+    @classmethod
+    def from_settings(cls):
+        return cls(**getattr(settings, 'CLASSROOM_SANDBOX', {}))
+
+    def without_memory_limit(self):
+        """Copy of the profile for runtimes that reserve a large address space
+
+        The JVM and V8 reserve gigabytes of virtual memory up front and
+        refuse to start under RLIMIT_AS, their heap is capped with runtime
+        flags instead.
+        """
+        return SandboxProfile(
+            cpu_seconds=self.cpu_seconds,
+            memory_mb=None,
+            processes=self.processes,
+            open_files=self.open_files,
+            file_size_mb=self.file_size_mb,
+        )
+
+    def for_runtime_host(self):
+        """Copy of the profile for long-lived runtime hosts
+
+        Besides the memory limit the CPU limit is left out, it would add up
+        over every run the host serves. Each run is bounded by its timeout.
+        """
+        profile = self.without_memory_limit()
+        profile.cpu_seconds = None
+        return profile
+
+    def rlimits(self):
+        """List of (resource name, soft, hard) tuples for this profile"""
+        limits = []
+        if self.cpu_seconds:
+            # The soft limit sends SIGXCPU, the hard limit a second later kills
+            limits.append(('RLIMIT_CPU', self.cpu_seconds, self.cpu_seconds + 1))
+        if self.memory_mb:
+            limits.append(('RLIMIT_AS', self.memory_mb * self.MB, self.memory_mb * self.MB))
+        if self.processes:
+            limits.append(('RLIMIT_NPROC', self.processes, self.processes))
+        if self.open_files:
+            limits.append(('RLIMIT_NOFILE', self.open_files, self.open_files))
+        if self.file_size_mb:
+            limits.append(('RLIMIT_FSIZE', self.file_size_mb * self.MB, self.file_size_mb * self.MB))
+        return limits
+
+    def wrap(self, command):
+        """Command that starts `command` under the limits of this profile
+
+        Raises FileNotFoundError when the program does not exist, like
+        subprocess.Popen would.
+        """
+        limits = self.rlimits()
+        if resource is None or not limits:
+            return list(command)
+
+        program = shutil.which(command[0])
+        if program is None:
+            raise FileNotFoundError(f"No such program: {command[0]!r}")
+        return [sys.executable, '-I', '-S', SANDBOX_EXEC, json.dumps(limits), program, *command[1:]]
+
+    def environment(self, workdir):
+        """Environment for a program confined to its private temp dir"""
+        env = dict(os.environ)
+        env.update({'TMPDIR': workdir, 'TEMP': workdir, 'TMP': workdir})
+        return env
+
+
+def detect_limit(returncode, stderr, truncated=False):
+    """Name of the sandbox limit that stopped the program, or None"""
+    if truncated:
+        return 'output'
+    if returncode is not None and returncode < 0:
+        signum = -returncode
+        if signum == getattr(signal, 'SIGXCPU', None):
+            return 'cpu'
+        if signum == getattr(signal, 'SIGXFSZ', None):
+            return 'file_size'
+    if returncode:
+        if any(error in stderr for error in MEMORY_ERRORS):
+            return 'memory'
+        if any(error in stderr for error in OPEN_FILE_ERRORS):
+            return 'open_files'
+        if any(error in stderr for error in FILE_SIZE_ERRORS):
+            return 'file_size'
+        if any(error in stderr for error in PROCESS_ERRORS):
+            return 'processes'
+    return None
@@ -0,0 +1,52 @@
+"""
+Exec wrapper that starts a program under resource limits.
+
+Usage: sandbox_exec.py LIMITS PROGRAM [ARGS...]
+
+LIMITS is a JSON list of [resource name, soft, hard] entries. They are
+applied to this process, which then replaces itself with PROGRAM. The
+server starts programs through this wrapper instead of a preexec_fn,
+which is not safe to use from the threads that run code.
+
+This file is executed as a standalone script and must not import anything
+from the Django project.
+"""
+
+import json
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def apply_limits(limits):
+    if resource is None:
+        return
+    for name, soft, hard in limits:
+        limit = getattr(resource, name, None)
+        if limit is None:
+            continue
+        _, current_hard = resource.getrlimit(limit)
+        if current_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        resource.setrlimit(limit, (soft, hard))
+
+
+def main(argv):
+    if len(argv) < 3:
+        print(f"usage: {argv[0]} LIMITS PROGRAM [ARGS...]", file=sys.stderr)
+        return 2
+
+    apply_limits(json.loads(argv[1]))
+    try:
+        os.execv(argv[2], argv[2:])
+    except OSError as e:
+        print(f"{argv[2]}: {e.strerror}", file=sys.stderr)
+        return 127
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
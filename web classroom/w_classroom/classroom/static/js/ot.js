@@ -0,0 +1,272 @@
+// Operational transform for the shared editor, mirrors classroom/documents.py
+// An operation is a list of components: a positive number retains characters,
+// a negative number deletes characters and a string inserts text.
+const OT = (function() {
+    function isRetain(c) { return typeof c === 'number' && c > 0; }
+    function isDelete(c) { return typeof c === 'number' && c < 0; }
+    function isInsert(c) { return typeof c === 'string'; }
+
+    // Append a component, merging it with its neighbour when possible
+    function push(ops, c) {
+        const last = ops[ops.length - 1];
+        if (isInsert(c)) {
+            if (!c) return;
+            if (isInsert(last)) {
+                ops[ops.length - 1] = last + c;
+            } else if (isDelete(last)) {
+                // Inserts always go before deletes so equal operations look equal
+                if (isInsert(ops[ops.length - 2])) {
+                    ops[ops.length - 2] += c;
+                } else {
+                    ops.splice(ops.length - 1, 0, c);
+                }
+            } else {
+                ops.push(c);
+            }
+        } else if (isRetain(c)) {
+            if (isRetain(last)) ops[ops.length - 1] = last + c;
+            else ops.push(c);
+        } else if (isDelete(c)) {
+            if (isDelete(last)) ops[ops.length - 1] = last + c;
+            else ops.push(c);
+        }
+    }
+
+    function baseLength(op) {
+        return op.reduce((n, c) => isInsert(c) ? n : n + Math.abs(c), 0);
+    }
+
+    function targetLength(op) {
+        return op.reduce((n, c) => isDelete(c) ? n : n + (isInsert(c) ? c.length : c), 0);
+    }
+
+    function isNoop(op) {
+        return op.every(isRetain);
+    }
+
+    function apply(text, op) {
+        if (baseLength(op) !== text.length) {
+            throw new Error('operation length does not match the document');
+        }
+        const parts = [];
+        let index = 0;
+        for (const c of op) {
+            if (isRetain(c)) {
+                parts.push(text.slice(index, index + c));
+                index += c;
+            } else if (isInsert(c)) {
+                parts.push(c);
+            } else {
+                index -= c;
+            }
+        }
+        return parts.join('');
+    }
+
+    // What is left of a component after length characters, undefined when used up
+    function shorten(c, length) {
+        if (isInsert(c)) {
+            if (c.length > length) return c.slice(length);
+        } else if (isRetain(c)) {
+            if (c > length) return c - length;
+        } else if (c + length < 0) {
+            return c + length;
+        }
+        return undefined;
+    }
+
+    // Returns [op1', op2'] so that apply(apply(s, op1), op2') === apply(apply(s, op2), op1')
+    function transform(op1, op2) {
+        if (baseLength(op1) !== baseLength(op2)) {
+            throw new Error('concurrent operations must have the same base length');
+        }
+        const prime1 = [], prime2 = [];
+        let i1 = 0, i2 = 0;
+        let a = op1[i1++], b = op2[i2++];
+        while (a !== undefined || b !== undefined) {
+            if (isInsert(a)) {
+                push(prime1, a);
+                push(prime2, a.length);
+                a = op1[i1++];
+                continue;
+            }
+            if (isInsert(b)) {
+                push(prime1, b.length);
+                push(prime2, b);
+                b = op2[i2++];
+                continue;
+            }
+            if (a === undefined || b === undefined) {
+                throw new Error('operation is too short');
+            }
+
+            let length;
+            if (isRetain(a) && isRetain(b)) {
+                length = Math.min(a, b);
+                push(prime1, length);
+                push(prime2, length);
+            } else if (isDelete(a) && isDelete(b)) {
+                length = Math.min(-a, -b);
+            } else if (isDelete(a) && isRetain(b)) {
+                length = Math.min(-a, b);
+                push(prime1, -length);
+            } else {
+                length = Math.min(a, -b);
+                push(prime2, -length);
+            }
+            a = shorten(a, length);
+            if (a === undefined) a = op1[i1++];
+            b = shorten(b, length);
+            if (b === undefined) b = op2[i2++];
+        }
+        return [prime1, prime2];
+    }
+
+    // Combine two consecutive operations into one
+    function compose(op1, op2) {
+        if (targetLength(op1) !== baseLength(op2)) {
+            throw new Error('operations are not consecutive');
+        }
+        const composed = [];
+        let i1 = 0, i2 = 0;
+        let a = op1[i1++], b = op2[i2++];
+        while (a !== undefined || b !== undefined) {
+            if (isDelete(a)) {
+                push(composed, a);
+                a = op1[i1++];
+                continue;
+            }
+            if (isInsert(b)) {
+                push(composed, b);
+                b = op2[i2++];
+                continue;
+            }
+            if (a === undefined || b === undefined) {
+                throw new Error('operation is too short');
+            }
+
+            let length;
+            if (isRetain(a) && isRetain(b)) {
+                length = Math.min(a, b);
+                push(composed, length);
+            } else if (isInsert(a) && isDelete(b)) {
+                length = Math.min(a.length, -b);
+            } else if (isInsert(a) && isRetain(b)) {
+                length = Math.min(a.length, b);
+                push(composed, a.slice(0, length));
+            } else {
+                length = Math.min(a, -b);
+                push(composed, -length);
+            }
+            a = shorten(a, length);
+            if (a === undefined) a = op1[i1++];
+            b = shorten(b, length);
+            if (b === undefined) b = op2[i2++];
+        }
+        return composed;
+    }
+
+    // Single-edit operation turning oldText into newText
+    function diff(oldText, newText) {
+        const limit = Math.min(oldText.length, newText.length);
+        let prefix = 0;
+        while (prefix < limit && oldText[prefix] === newText[prefix]) prefix++;
+        let suffix = 0;
+        while (suffix < limit - prefix &&
+               oldText[oldText.length - suffix - 1] === newText[newText.length - suffix - 1]) {
+            suffix++;
+        }
+        const op = [];
+        push(op, prefix);
+        push(op, newText.slice(prefix, newText.length - suffix));
+        push(op, -(oldText.length - prefix - suffix));
+        push(op, suffix);
+        return op;
+    }
+
+    // Where a cursor at index ends up after the operation
+    function transformIndex(op, index) {
+        let newIndex = index;
+        let position = 0;
+        for (const c of op) {
+            if (position > index) break;
+            if (isRetain(c)) {
+                position += c;
+            } else if (isInsert(c)) {
+                newIndex += c.length;
+            } else {
+                newIndex -= Math.min(index - position, -c);
+                position -= c;
+            }
+        }
+        return newIndex;
+    }
+
+    return { apply, transform, compose, diff, transformIndex, isNoop };
+})();
+
+// Client side of the versioned edit protocol. At most one operation is in
+// flight; edits made while waiting for its acknowledgement are composed into
+// a buffer and sent together once the server confirms.
+class CodeSync {
+    constructor(send, applyRemote) {
+        this.send = send;               // (version, op) => void
+        this.applyRemote = applyRemote; // (op) => void
+        this.reset('', 0);
+    }
+
+    reset(text, version) {
+        this.text = text;
+        this.version = version;
+        this.outstanding = null;
+        this.buffer = null;
+    }
+
+    get hasPendingChanges() {
+        return this.outstanding !== null;
+    }
+
+    // The editor text changed locally
+    localChange(newText) {
+        const op = OT.diff(this.text, newText);
+        this.text = newText;
+        if (OT.isNoop(op)) return;
+
+        if (this.outstanding === null) {
+            this.outstanding = op;
+            this.send(this.version, op);
+        } else if (this.buffer === null) {
+            this.buffer = op;
+        } else {
+            this.buffer = OT.compose(this.buffer, op);
+        }
+    }
+
+    // An edit from another participant, returns false when versions are out of step
+    serverDelta(op, version) {
+        if (version !== this.version + 1) return false;
+        this.version = version;
+
+        if (this.outstanding !== null) {
+            [this.outstanding, op] = OT.transform(this.outstanding, op);
+            if (this.buffer !== null) {
+                [this.buffer, op] = OT.transform(this.buffer, op);
+            }
+        }
+        this.text = OT.apply(this.text, op);
+        this.applyRemote(op);
+        return true;
+    }
+
+    // The server applied our outstanding operation
+    serverAck(version) {
+        if (this.outstanding === null || version !== this.version + 1) return false;
+        this.version = version;
+        this.outstanding = this.buffer;
+        this.buffer = null;
+        if (this.outstanding !== null) {
+            this.send(this.version, this.outstanding);
+        }
+        return true;
+    }
+}
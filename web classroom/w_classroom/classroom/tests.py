@@ -1 +1,1391 @@
-# Create your tests here.
+import asyncio
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .compile_cache import CompileCache
+from .consumers import CodeConsumer
+from .documents import OperationError, SharedDocument, apply, compose, diff, transform
+from .executor import CodeExecutor
+from .fake_redis import FakeRedis, InterleavingFakeRedis
+from .jobs import get_dispatcher
+from .lobby import invalidate_lobby
+from . import metrics
+from .models import CodeSession, CodeSnapshot, RoomMute
+from .participant_counts import ParticipantCountWriter
+from .persistence import CodePersister, write_code
+from .protocol import COMPACT_SUBPROTOCOL, decode, encode
+from .rate_limit import throttle_counts
+from .room_state import read_room, room_states
+from .room_store import MemoryRoomStore, RedisRoomStore, get_room_store
+from .sandbox import SandboxProfile
+from .worker_pool import (
+    JavaWorker, NodeWorker, PythonWorkerPool, WorkerExited, WorkerPool, WorkerRejected, WorkerTimeout,
+    WorkerUnavailable,
+)
+from .views import MAX_CREATED_ROOMS, remember_created_room
+
+
+class PythonWorkerPoolTests(SimpleTestCase):
+    """Tests for the warm Python worker pool"""
+
+    def setUp(self):
+        self.pool = PythonWorkerPool(size=1, max_runs=3)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_runs_code_and_captures_output(self):
+        result = self.pool.run("print('hello')\nimport sys\nprint('oops', file=sys.stderr)", timeout=5)
+        self.assertEqual(result['stdout'], 'hello\n')
+        self.assertEqual(result['stderr'], 'oops\n')
+        self.assertEqual(result['returncode'], 0)
+        self.assertFalse(result['timed_out'])
+
+    def test_runs_do_not_share_state(self):
+        self.pool.run("import builtins\nbuiltins.leaked = 1", timeout=5)
+        result = self.pool.run("import builtins\nprint(hasattr(builtins, 'leaked'))", timeout=5)
+        self.assertEqual(result['stdout'], 'False\n')
+
+    def test_timeout_kills_run_and_worker_survives(self):
+        result = self.pool.run("while True:\n    pass", timeout=0.5)
+        self.assertTrue(result['timed_out'])
+        result = self.pool.run("print(1 + 1)", timeout=5)
+        self.assertEqual(result['stdout'], '2\n')
+
+    def test_exceptions_and_exit_codes(self):
+        result = self.pool.run("raise ValueError('bad')", timeout=5)
+        self.assertEqual(result['returncode'], 1)
+        self.assertIn('ValueError: bad', result['stderr'])
+        self.assertIn('File "main.py", line 1', result['stderr'])
+        result = self.pool.run("import sys\nsys.exit(3)", timeout=5)
+        self.assertEqual(result['returncode'], 3)
+
+    def test_worker_recycled_after_max_runs(self):
+        pids = [self.pool.run("import os\nprint(os.getppid())", timeout=5)['stdout'] for _ in range(4)]
+        self.assertEqual(len(set(pids[:3])), 1)
+        self.assertNotEqual(pids[0], pids[3])
+
+    def test_failed_respawn_does_not_block_runs(self):
+        class BrokenWorker:
+            name = 'python'
+
+            def __init__(self):
+                raise OSError("fork failed")
+
+        self.pool.ACQUIRE_TIMEOUT = 0.2
+        self.pool.max_runs = 1
+        with mock.patch.object(self.pool, 'worker_class', BrokenWorker):
+            self.pool.run("print(1)", timeout=5)
+            with self.assertRaises(WorkerUnavailable):
+                self.pool.run("print(2)", timeout=5)
+        # The lost slot is refilled once workers start again
+        self.assertEqual(self.pool.run("print(3)", timeout=5)['stdout'], '3\n')
+
+    def test_crashed_worker_is_replaced(self):
+        worker = self.pool._idle.get()
+        self.pool._idle.put(worker)
+        worker.process.kill()
+        worker.process.wait()
+        result = self.pool.run("print('alive')", timeout=5)
+        self.assertEqual(result['stdout'], 'alive\n')
+
+
+@override_settings(CLASSROOM_PYTHON_WORKERS=0)
+class PythonSubprocessFallbackTests(SimpleTestCase):
+    """The executor still works without the worker pool"""
+
+    def test_execute_python_without_pool(self):
+        self.assertEqual(CodeExecutor().execute("print('hi')", 'python'), 'hi')
+
+
+class WorkerFailureTests(SimpleTestCase):
+    """A program falls back to a fresh process only if it never started on a worker"""
+
+    def execute(self, error):
+        pool = mock.Mock(**{'run.side_effect': error})
+        pool.worker_class.name = 'Python'
+        executor = CodeExecutor()
+        with mock.patch('classroom.executor.get_python_pool', return_value=pool), \
+                mock.patch.object(executor, '_execute_python_subprocess', return_value='fresh') as fresh:
+            output = executor.execute("print('hi')", 'python')
+        return executor, output, fresh
+
+    def test_unavailable_worker_falls_back(self):
+        _, output, fresh = self.execute(WorkerUnavailable("no idle worker"))
+        self.assertEqual(output, 'fresh')
+        fresh.assert_called_once()
+
+    def test_rejected_job_falls_back(self):
+        _, output, fresh = self.execute(WorkerRejected("broken pipe"))
+        self.assertEqual(output, 'fresh')
+
+    def test_timeout_is_the_result(self):
+        executor, output, fresh = self.execute(WorkerTimeout("no answer"))
+        fresh.assert_not_called()
+        self.assertEqual(executor.limit_hit, 'timeout')
+
+    def test_worker_exit_keeps_the_output_so_far(self):
+        error = WorkerExited("exited")
+        error.stdout = 'hi\n'
+        _, output, fresh = self.execute(error)
+        fresh.assert_not_called()
+        self.assertTrue(output.startswith('hi'))
+        self.assertIn('stopped unexpectedly', output)
+
+
+@skipUnless(os.name == 'posix' and shutil.which('node'), 'node is not installed')
+class NodeWorkerPoolTests(SimpleTestCase):
+    """Tests for the warm Node.js host"""
+
+    def setUp(self):
+        self.pool = WorkerPool(1, 3, NodeWorker)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def worker_pids(self):
+        return {worker.pid for worker in self.pool._workers}
+
+    def test_runs_code_and_timers(self):
+        result = self.pool.run("console.log('hello')\nsetTimeout(() => console.error('later'), 10)", timeout=5)
+        self.assertEqual(result['stdout'], 'hello\n')
+        self.assertEqual(result['stderr'], 'later\n')
+        self.assertEqual(result['returncode'], 0)
+
+    def test_runs_do_not_share_globals(self):
+        self.pool.run("globalThis.leaked = 1\nvar shared = 2", timeout=5)
+        result = self.pool.run("console.log(typeof leaked, typeof shared)", timeout=5)
+        self.assertEqual(result['stdout'], 'undefined undefined\n')
+
+    def test_timeout_stops_run_and_host_survives(self):
+        pids = self.worker_pids()
+        result = self.pool.run("while (true) {}", timeout=0.5)
+        self.assertTrue(result['timed_out'])
+        result = self.pool.run("console.log(1 + 1)", timeout=5)
+        self.assertEqual(result['stdout'], '2\n')
+        self.assertEqual(self.worker_pids(), pids)
+
+    def test_errors_set_exit_code(self):
+        result = self.pool.run("null.field", timeout=5)
+        self.assertEqual(result['returncode'], 1)
+        self.assertIn('TypeError', result['stderr'])
+        self.assertNotIn('node_worker.js', result['stderr'])
+        result = self.pool.run("Promise.reject(new Error('async'))", timeout=5)
+        self.assertEqual(result['returncode'], 1)
+        self.assertIn('Error: async', result['stderr'])
+
+    def test_output_limit(self):
+        result = self.pool.run("while (true) console.log('x'.repeat(1000))", timeout=5, max_output=10000)
+        self.assertTrue(result['truncated'])
+        self.assertLessEqual(len(result['stdout']), 10000)
+
+    def test_host_recycled_after_max_runs(self):
+        pids = self.worker_pids()
+        for _ in range(3):
+            self.pool.run("console.log(1)", timeout=5)
+        self.assertTrue(self.worker_pids().isdisjoint(pids))
+
+    def test_executor_uses_host_unless_code_needs_node_modules(self):
+        with mock.patch('classroom.executor.get_node_pool', return_value=self.pool):
+            self.assertEqual(CodeExecutor().execute("console.log([1, 2].map(x => x * 2))", 'javascript'), '[ 2, 4 ]')
+            self.assertEqual(
+                CodeExecutor().execute("console.log(require('path').basename('/a/b.js'))", 'javascript'), 'b.js'
+            )
+        self.assertEqual(sum(worker.runs for worker in self.pool._workers), 1)
+
+
+@skipUnless(os.name == 'posix' and shutil.which('javac'), 'a JDK is not installed')
+class JavaWorkerPoolTests(SimpleTestCase):
+    """Tests for the warm JVM host"""
+
+    PROGRAM = "public class Main {{ public static void main(String[] args) {{ {} }} }}"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pool = WorkerPool(1, 50, JavaWorker)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        super().tearDownClass()
+
+    def run_java(self, body, timeout=10):
+        return self.pool.run(self.PROGRAM.format(body), timeout, class_name='Main', flags=[])
+
+    def test_runs_code_and_captures_output(self):
+        result = self.run_java('System.out.println("hello"); System.err.println("oops");')
+        self.assertEqual(result['stdout'], 'hello\n')
+        self.assertEqual(result['stderr'], 'oops\n')
+        self.assertEqual(result['returncode'], 0)
+
+    def test_compile_error(self):
+        result = self.run_java('int x = "text";')
+        self.assertIn('Main.java', result['compile_error'])
+
+    def test_exception_sets_exit_code(self):
+        result = self.run_java('throw new IllegalStateException("bad");')
+        self.assertEqual(result['returncode'], 1)
+        self.assertIn('Exception in thread "main" java.lang.IllegalStateException: bad', result['stderr'])
+
+    def test_system_exit_replaces_host(self):
+        result = self.run_java('System.exit(3);')
+        self.assertEqual(result['returncode'], 3)
+        self.assertEqual(self.run_java('System.out.println(1 + 1);')['stdout'], '2\n')
+
+    def test_timeout(self):
+        result = self.run_java('while (true) {}', timeout=1)
+        self.assertTrue(result['timed_out'])
+
+
+class OutputStreamingTests(SimpleTestCase):
+    """Output is forwarded in chunks and capped instead of buffered"""
+
+    STREAMING_CODE = "import time\nfor i in range(3):\n    print(i, flush=True)\n    time.sleep(0.05)"
+    FLOOD_CODE = "while True:\n    print('x' * 1000)"
+
+    def run_streaming(self):
+        chunks = []
+        output = CodeExecutor(on_output=lambda stream, data: chunks.append((stream, data))).execute(
+            self.STREAMING_CODE, 'python'
+        )
+        self.assertEqual(output, '0\n1\n2')
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(data for _, data in chunks), '0\n1\n2\n')
+
+    def run_flood(self):
+        executor = CodeExecutor()
+        executor.MAX_OUTPUT_BYTES = 10000
+        output = executor.execute(self.FLOOD_CODE, 'python')
+        self.assertIn('[Output truncated after 10000 bytes]', output)
+        self.assertLess(len(output), 10100)
+
+    def test_pooled_python_streams_output(self):
+        self.run_streaming()
+
+    def test_pooled_python_output_is_capped(self):
+        self.run_flood()
+
+    @override_settings(CLASSROOM_PYTHON_WORKERS=0)
+    def test_subprocess_streams_output(self):
+        self.run_streaming()
+
+    @override_settings(CLASSROOM_PYTHON_WORKERS=0)
+    def test_subprocess_output_is_capped(self):
+        self.run_flood()
+
+
+class ExecuteCodeViewTests(TransactionTestCase):
+    """Tests for the queued execution path behind the Run button"""
+
+    def setUp(self):
+        CodeSession.objects.create(session_id='room-1', room_name='Room 1')
+        self.client = AsyncClient()
+
+    async def post(self, payload):
+        return await self.client.post('/api/execute/', json.dumps(payload), content_type='application/json')
+
+    async def test_wait_returns_output_and_saves_it(self):
+        response = await self.post({'session_id': 'room-1', 'code': "print('hi')", 'wait': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['output'], 'hi')
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertEqual(session.output, 'hi')
+        # The shared document is saved by the room, not by whoever ran it
+        self.assertEqual(session.code, '')
+
+    async def test_result_is_pushed_to_room_group(self):
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add('code_room-1', channel)
+
+        response = await self.post({'session_id': 'room-1', 'code': "print(6 * 7)"})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        await get_dispatcher().join()
+
+        status = await channel_layer.receive(channel)
+        self.assertEqual(status['type'], 'execution_status')
+        chunk = await channel_layer.receive(channel)
+        self.assertEqual(chunk['type'], 'output_chunk')
+        self.assertEqual((chunk['stream'], chunk['data']), ('stdout', '42\n'))
+        result = await channel_layer.receive(channel)
+        self.assertEqual(result['type'], 'execution_result')
+        self.assertEqual(result['job_id'], job_id)
+        self.assertEqual(result['output'], '42')
+        self.assertFalse(result['isError'])
+
+    @override_settings(CLASSROOM_ROOM_QUEUE_LIMIT=1)
+    async def test_room_queue_limit_rejects_runs(self):
+        first = await self.post({'session_id': 'room-1', 'code': "import time\ntime.sleep(0.2)"})
+        second = await self.post({'session_id': 'room-1', 'code': "print(1)"})
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 429)
+        await get_dispatcher().join()
+
+    async def test_unknown_session_returns_404(self):
+        response = await self.post({'session_id': 'missing', 'code': "print(1)"})
+        self.assertEqual(response.status_code, 404)
+
+
+class StdinTests(SimpleTestCase):
+    """Programs read the input given to execute()"""
+
+    REVERSE = "import sys\nfor line in sys.stdin:\n    print(line.strip()[::-1])"
+
+    def test_pooled_python_reads_stdin(self):
+        self.assertEqual(CodeExecutor().execute(self.REVERSE, 'python', stdin='abc\ndef\n'), 'cba\nfed')
+        self.assertEqual(CodeExecutor().execute("print(len(input()))", 'python', stdin='x' * 100000), '100000')
+
+    @override_settings(CLASSROOM_PYTHON_WORKERS=0)
+    def test_subprocess_python_reads_stdin(self):
+        self.assertEqual(CodeExecutor().execute(self.REVERSE, 'python', stdin='abc\n'), 'cba')
+
+    def test_program_ignoring_stdin_is_not_blocked(self):
+        self.assertEqual(
+            CodeExecutor()._execute_python_subprocess("print('done')", stdin='x' * 1024 * 1024), 'done'
+        )
+
+
+class RunTestsViewTests(TransactionTestCase):
+    """A program is built once and run against every test case"""
+
+    SUM = "a, b = map(int, input().split())\nprint(a + b)"
+
+    def setUp(self):
+        CodeSession.objects.create(session_id='room-1', room_name='Room 1')
+        self.client = AsyncClient()
+
+    async def post(self, **payload):
+        return await self.client.post(
+            '/api/run-tests/', json.dumps({'session_id': 'room-1', **payload}), content_type='application/json'
+        )
+
+    async def test_cases_pass_fail_and_time_out(self):
+        response = await self.post(code=self.SUM, timeout=1, cases=[
+            {'stdin': '1 2\n', 'expected': '3\n'},
+            {'stdin': '2 2', 'expected': '5'},
+            {'stdin': 'x y', 'expected': '0'},
+        ])
+        result = response.json()
+        self.assertEqual((result['passed'], result['total']), (1, 3))
+        self.assertEqual([case['status'] for case in result['cases']], ['passed', 'failed', 'error'])
+        self.assertNotIn('output', result['cases'][0])
+        self.assertEqual(result['cases'][1]['output'], '4\n')
+        self.assertIn('ValueError', result['cases'][2]['output'])
+
+        response = await self.post(code="while True:\n    pass", timeout=0.5, cases=[{'stdin': ''}])
+        self.assertEqual(response.json()['cases'][0]['status'], 'timeout')
+
+    @skipUnless(shutil.which('gcc'), 'gcc is not installed')
+    async def test_c_program_is_compiled_once(self):
+        code = "#include <stdio.h>\nint main() { int n; scanf(\"%d\", &n); printf(\"%d\\n\", n * n); return 0; }"
+        code += f"\n// {uuid.uuid4()}"
+        compiles = metrics.COMPILE_DURATION.get(language='c')
+        response = await self.post(language='c', code=code, cases=[
+            {'stdin': str(n), 'expected': str(n * n)} for n in range(6)
+        ])
+        self.assertEqual(response.json()['passed'], 6)
+        self.assertEqual(metrics.COMPILE_DURATION.get(language='c'), compiles + 1)
+
+        response = await self.post(language='c', code="int main() { return x; }", cases=[{'stdin': ''}])
+        self.assertIn('Compilation Error', response.json()['compile_error'])
+
+    async def test_missing_runtime_is_reported_per_case(self):
+        prepared = (['/nonexistent/node', 'main.js'], CodeExecutor().sandbox, None)
+        with mock.patch.object(CodeExecutor, '_prepare', return_value=prepared):
+            response = await self.post(language='javascript', code="console.log(1)", cases=[{'stdin': ''}] * 2)
+        result = response.json()
+        self.assertEqual((result['passed'], result['total']), (0, 2))
+        self.assertEqual([case['status'] for case in result['cases']], ['error', 'error'])
+        self.assertEqual(result['cases'][0]['output'], 'Error: node is not installed.')
+
+    async def test_invalid_requests(self):
+        self.assertEqual((await self.post(code=self.SUM, cases=[])).status_code, 400)
+        self.assertEqual((await self.post(code=self.SUM, cases=[{'stdin': 1}])).status_code, 400)
+        with override_settings(CLASSROOM_BATCH_MAX_CASES=2):
+            self.assertEqual((await self.post(code=self.SUM, cases=[{}] * 3)).status_code, 400)
+        response = await self.client.post(
+            '/api/run-tests/', json.dumps({'session_id': 'missing', 'cases': [{}]}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ResultCacheTests(TransactionTestCase):
+    """Outputs of deterministic runs are reused without executing"""
+
+    RANDOM_CODE = "import random\nprint(random.random())"
+
+    def setUp(self):
+        CodeSession.objects.create(session_id='room-1', room_name='Room 1')
+        caches['results'].clear()
+        self.client = AsyncClient()
+        self.store = get_room_store()
+
+    async def run_code(self, code, session_id='room-1', **flags):
+        response = await self.client.post(
+            '/api/execute/',
+            json.dumps({'session_id': session_id, 'code': code, 'wait': True, **flags}),
+            content_type='application/json',
+        )
+        return response.json()['output']
+
+    @sync_to_async
+    def create_room(self):
+        """Log the test client in as the creator of room-1"""
+        session = self.client.session
+        session['created_rooms'] = ['room-1']
+        session.save()
+
+    async def test_deterministic_runs_are_cached(self):
+        hits = metrics.RESULT_CACHE_HITS.get(language='python')
+        first = await self.run_code(self.RANDOM_CODE, deterministic=True)
+        self.assertEqual(await self.run_code(self.RANDOM_CODE, deterministic=True), first)
+        self.assertEqual(metrics.RESULT_CACHE_HITS.get(language='python'), hits + 1)
+        # Nobody vouched for the cached output on behalf of unmarked runs
+        self.assertNotEqual(await self.run_code(self.RANDOM_CODE), first)
+
+    async def test_creator_runs_are_served_to_the_room(self):
+        await self.create_room()
+        first = await self.run_code(self.RANDOM_CODE, deterministic=True)
+        self.assertEqual(await self.run_code(self.RANDOM_CODE), first)
+
+    def test_created_rooms_of_a_session_are_capped(self):
+        request = mock.Mock(session={})
+        for number in range(MAX_CREATED_ROOMS + 10):
+            remember_created_room(request, f'room-{number}')
+        remember_created_room(request, 'room-20')
+        rooms = request.session['created_rooms']
+        self.assertEqual(len(rooms), MAX_CREATED_ROOMS)
+        self.assertEqual(rooms[-2:], [f'room-{MAX_CREATED_ROOMS + 9}', 'room-20'])
+        self.assertNotIn('room-0', rooms)
+
+    async def test_entries_stay_in_their_room(self):
+        await CodeSession.objects.acreate(session_id='room-2', room_name='Room 2')
+        first = await self.run_code(self.RANDOM_CODE, deterministic=True)
+        self.assertNotEqual(await self.run_code(self.RANDOM_CODE, session_id='room-2', deterministic=True), first)
+
+    async def test_room_owner_by_name_is_not_the_creator(self):
+        # Anyone can join under the name of the first participant
+        await self.store.join('room-1', 'Anonymous', {'ip': '127.0.0.1', 'channel': 'test'})
+        try:
+            first = await self.run_code(self.RANDOM_CODE, deterministic=True)
+            self.assertNotEqual(await self.run_code(self.RANDOM_CODE), first)
+        finally:
+            await self.store.leave('room-1', 'Anonymous')
+
+    async def test_unmarked_runs_and_limits_are_not_cached(self):
+        first = await self.run_code(self.RANDOM_CODE)
+        self.assertNotEqual(await self.run_code(self.RANDOM_CODE, deterministic=True), first)
+        with override_settings(CLASSROOM_RESULT_CACHE_MAX_BYTES=10):
+            first = await self.run_code("print('x' * 20)\nimport random\nprint(random.random())", deterministic=True)
+            self.assertNotEqual(
+                await self.run_code("print('x' * 20)\nimport random\nprint(random.random())", deterministic=True), first
+            )
+
+
+class ServerRequirementTests(SimpleTestCase):
+    """Queued runs live on the ASGI server's event loop"""
+
+    def test_wsgi_application_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            importlib.import_module('w_classroom.wsgi')
+
+
+@skipUnless(os.name == 'posix', 'rlimits are only applied on POSIX systems')
+class SandboxTests(SimpleTestCase):
+    """Programs run under per-run rlimits in a private temp dir"""
+
+    def test_memory_limit_is_reported(self):
+        executor = CodeExecutor()
+        output = executor.execute("data = bytearray(2 * 1024 ** 3)", 'python')
+        self.assertEqual(executor.limit_hit, 'memory')
+        self.assertIn('Memory limit exceeded', output)
+
+    @override_settings(CLASSROOM_PYTHON_WORKERS=0)
+    def test_memory_limit_without_pool(self):
+        executor = CodeExecutor()
+        executor.execute("data = bytearray(2 * 1024 ** 3)", 'python')
+        self.assertEqual(executor.limit_hit, 'memory')
+
+    @override_settings(CLASSROOM_SANDBOX={'cpu_seconds': 1})
+    def test_cpu_limit_is_reported(self):
+        executor = CodeExecutor()
+        output = executor.execute("while True:\n    pass", 'python')
+        self.assertEqual(executor.limit_hit, 'cpu')
+        self.assertIn('CPU time limit exceeded', output)
+
+    @override_settings(CLASSROOM_SANDBOX={'file_size_mb': 1})
+    def test_file_size_limit_is_reported(self):
+        executor = CodeExecutor()
+        executor.execute("open('big.bin', 'wb').write(b'x' * 2 * 1024 * 1024)", 'python')
+        self.assertEqual(executor.limit_hit, 'file_size')
+
+    def test_runs_in_private_temp_dir(self):
+        code = "import os, tempfile\nprint(os.getcwd() == os.path.realpath(tempfile.gettempdir()))\nprint(os.getcwd())"
+        executor = CodeExecutor()
+        same_dir, workdir = executor.execute(code, 'python').splitlines()
+        self.assertEqual(same_dir, 'True')
+        self.assertFalse(os.path.exists(workdir))
+        self.assertIsNone(executor.limit_hit)
+
+    def test_timeout_is_reported(self):
+        executor = CodeExecutor()
+        executor.TIMEOUT = 0.5
+        executor.execute("import time\ntime.sleep(5)", 'python')
+        self.assertEqual(executor.limit_hit, 'timeout')
+
+    @override_settings(CLASSROOM_PYTHON_WORKERS=0)
+    def test_limits_are_applied_by_the_exec_wrapper(self):
+        executor = CodeExecutor()
+        with mock.patch('classroom.executor.subprocess.Popen', wraps=__import__('subprocess').Popen) as popen:
+            output = executor.execute("import resource\nprint(resource.getrlimit(resource.RLIMIT_NOFILE))", 'python')
+        self.assertEqual(output, '(64, 64)')
+        self.assertNotIn('preexec_fn', popen.call_args.kwargs)
+
+    def test_process_limit_is_off_by_default(self):
+        names = [name for name, _, _ in SandboxProfile().rlimits()]
+        self.assertNotIn('RLIMIT_NPROC', names)
+
+    def test_missing_program_is_reported_before_exec(self):
+        with self.assertRaises(FileNotFoundError):
+            SandboxProfile().wrap(['no-such-program-here'])
+
+
+@skipUnless(shutil.which('gcc'), 'gcc is not installed')
+class CompileCacheTests(SimpleTestCase):
+    """Tests for reuse of compiled programs"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = CompileCache(self.directory, max_bytes=64 * 1024 * 1024)
+        patcher = mock.patch('classroom.executor.get_compile_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def test_unchanged_source_skips_compiler(self):
+        code = '#include <stdio.h>\nint main() { printf("hi"); return 0; }'
+        executor = CodeExecutor()
+        self.assertEqual(executor.execute(code, 'c'), 'hi')
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+        with mock.patch('classroom.executor.subprocess.run', wraps=__import__('subprocess').run) as run:
+            self.assertEqual(executor.execute(code, 'c'), 'hi')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        commands = [call.args[0][0] for call in run.call_args_list]
+        self.assertNotIn('gcc', commands)
+
+    def test_compilation_errors_are_not_cached(self):
+        executor = CodeExecutor()
+        self.assertIn('Compilation Error', executor.execute('int main() { return }', 'c'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_key_depends_on_flags_and_compiler(self):
+        key = self.cache.make_key('c', 'int main(){}', 'gcc 12', (), 'program.c')
+        self.assertNotEqual(key, self.cache.make_key('c', 'int main(){}', 'gcc 12', ('-O2',), 'program.c'))
+        self.assertNotEqual(key, self.cache.make_key('c', 'int main(){}', 'gcc 13', (), 'program.c'))
+
+    def test_least_recently_used_builds_are_evicted(self):
+        build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, build_dir, True)
+        with open(os.path.join(build_dir, 'program.exe'), 'wb') as f:
+            f.write(b'x' * 100)
+
+        self.cache.max_bytes = 250
+        first = self.cache.put('a' * 64, build_dir)
+        os.utime(first, (1, 1))
+        second = self.cache.put('b' * 64, build_dir)
+        os.utime(second, (2, 2))
+        run_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, run_dir, True)
+        self.cache.get('a' * 64, 'c', run_dir)
+        self.cache.put('c' * 64, build_dir)
+
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a' * 64, 'c' * 64])
+
+    def test_eviction_keeps_builds_of_running_programs(self):
+        build_dir = tempfile.mkdtemp()
+        run_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, build_dir, True)
+        self.addCleanup(shutil.rmtree, run_dir, True)
+        with open(os.path.join(build_dir, 'program.exe'), 'wb') as f:
+            f.write(b'x' * 100)
+
+        entry = self.cache.put('a' * 64, build_dir)
+        self.assertTrue(self.cache.get('a' * 64, 'c', run_dir))
+        shutil.rmtree(entry)
+
+        with open(os.path.join(run_dir, 'program.exe'), 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 100)
+        self.assertFalse(self.cache.get('a' * 64, 'c', run_dir))
+
+    def test_cache_hit_runs_from_the_run_directory(self):
+        code = '#include <stdio.h>\nint main() { printf("hi"); return 0; }'
+        executor = CodeExecutor()
+        executor.execute(code, 'c')
+
+        with mock.patch.object(executor, '_run_program', wraps=executor._run_program) as run:
+            self.assertEqual(executor.execute(code, 'c'), 'hi')
+        self.assertFalse(run.call_args.args[0][0].startswith(self.directory))
+
+    @skipUnless(os.name == 'posix', 'POSIX permissions only')
+    def test_directory_open_to_others_is_refused(self):
+        os.chmod(self.directory, 0o777)
+        with self.assertRaises(PermissionError):
+            CompileCache(self.directory, max_bytes=1024)
+
+    @skipUnless(os.name == 'posix', 'POSIX permissions only')
+    def test_new_directory_is_private(self):
+        directory = os.path.join(self.directory, 'cache')
+        CompileCache(directory, max_bytes=1024)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+
+class SharedDocumentTests(SimpleTestCase):
+    """Versioned delta sync of the shared editor"""
+
+    def random_edit(self, rng, text):
+        start = rng.randint(0, len(text))
+        end = rng.randint(start, min(len(text), start + 3))
+        return text[:start] + rng.choice(['', 'a', 'xy', '\n', '\U0001F600']) + text[end:]
+
+    def test_transform_converges(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            text = 'hello \U0001F600 world'[:rng.randint(0, 14)]
+            a = diff(text, self.random_edit(rng, text))
+            b = diff(text, self.random_edit(rng, text))
+            a_prime, b_prime = transform(a, b)
+            self.assertEqual(apply(apply(text, a), b_prime), apply(apply(text, b), a_prime))
+
+            after_a = apply(text, a)
+            c = diff(after_a, self.random_edit(rng, after_a))
+            self.assertEqual(apply(text, compose(a, c)), apply(after_a, c))
+
+    def test_lengths_are_utf16_code_units(self):
+        # An emoji is two code units in the browser
+        self.assertEqual(apply('\U0001F600!', [2, '?', -1]), '\U0001F600?')
+
+    def test_concurrent_edits_are_transformed(self):
+        document = SharedDocument('print()')
+        document.receive(0, [6, "'a'", 1])
+        op, version = document.receive(0, ['# note\n', 7])
+        self.assertEqual(version, 2)
+        self.assertEqual(op, ['# note\n', 10])
+        self.assertEqual(document.text, "# note\nprint('a')")
+
+    def test_inserts_at_the_same_position_are_ordered_by_the_server(self):
+        document = SharedDocument('')
+        document.receive(0, ['first'])
+        document.receive(0, ['second'])
+        self.assertEqual(document.text, 'secondfirst')
+
+    def test_invalid_operations_are_rejected(self):
+        document = SharedDocument('abc')
+        with self.assertRaises(OperationError):
+            document.receive(0, [5])
+        with self.assertRaises(OperationError):
+            document.receive(1, [3])
+        with self.assertRaises(OperationError):
+            document.receive(0, [None])
+        self.assertEqual((document.text, document.version), ('abc', 0))
+
+    def test_versions_older_than_the_history_need_a_snapshot(self):
+        with mock.patch.object(SharedDocument, 'HISTORY_LIMIT', 2):
+            document = SharedDocument('')
+        for i in range(3):
+            document.receive(i, [i, 'x'])
+        with self.assertRaises(OperationError):
+            document.receive(0, ['y'])
+        document.receive(1, [1, 'y'])
+        self.assertEqual(document.text, 'xyxx')
+
+
+class ConsumerTestCase(TransactionTestCase):
+    """Connects test clients to a room through CodeConsumer"""
+
+    def setUp(self):
+        CodeSession.objects.create(session_id='room-1', room_name='Room 1', code='x = 1')
+        self.addCleanup(room_states.clear)
+        self.store = MemoryRoomStore()
+        for target in ('classroom.consumers.get_room_store', 'classroom.views.get_room_store'):
+            patcher = mock.patch(target, side_effect=self.get_store)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Counts are dropped instead of being written to the real database at exit
+        self.counts = ParticipantCountWriter(interval=60)
+        patcher = mock.patch('classroom.consumers.get_participant_counts', return_value=self.counts)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.persister = CodePersister(delay=0.05, max_delay=1, snapshot_interval=60, history=3)
+        patcher = mock.patch('classroom.consumers.get_code_persister', return_value=self.persister)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_store(self):
+        return self.store
+
+    async def connect(self, username, ip='127.0.0.1', expect_connected=True, subprotocols=None):
+        communicator = WebsocketCommunicator(
+            CodeConsumer.as_asgi(), '/ws/code/room-1/', headers=[(b'x-real-ip', ip.encode())],
+            subprotocols=subprotocols
+        )
+        communicator.scope['url_route'] = {'kwargs': {'session_id': 'room-1'}}
+        communicator.scope['session'] = {'username': username}
+        connected, _ = await communicator.connect()
+        self.assertEqual(connected, expect_connected)
+        return communicator
+
+    async def receive(self, communicator, message_type):
+        while True:
+            message = await communicator.receive_json_from()
+            if message['type'] == message_type:
+                return message
+
+
+class CodeDeltaConsumerTests(ConsumerTestCase):
+    """Edits are exchanged as deltas over the room WebSocket"""
+
+    async def test_same_name_connected_twice_keeps_the_document_open(self):
+        first = await self.connect('Anonymous')
+        await self.receive(first, 'code_snapshot')
+        second = await self.connect('Anonymous')
+        await self.receive(second, 'code_snapshot')
+
+        await first.disconnect()
+        self.assertEqual(await self.store.members('room-1'), (['Anonymous'], 'Anonymous'))
+        await second.send_json_to({'type': 'code_delta', 'version': 0, 'op': [5, '0']})
+        self.assertEqual(await self.receive(second, 'code_ack'), {'type': 'code_ack', 'version': 1})
+
+        await second.disconnect()
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertEqual(session.code, 'x = 10')
+
+    async def test_edits_are_acknowledged_and_broadcast(self):
+        alice = await self.connect('alice')
+        snapshot = await self.receive(alice, 'code_snapshot')
+        self.assertEqual((snapshot['code'], snapshot['version']), ('x = 1', 0))
+        bob = await self.connect('bob')
+        await self.receive(bob, 'code_snapshot')
+
+        await alice.send_json_to({'type': 'code_delta', 'version': 0, 'op': [4, -1, '2']})
+        self.assertEqual(await self.receive(alice, 'code_ack'), {'type': 'code_ack', 'version': 1})
+        delta = await self.receive(bob, 'code_delta')
+        self.assertEqual((delta['op'], delta['version'], delta['username']), ([4, '2', -1], 1, 'alice'))
+
+        # A concurrent edit from bob, still based on version 0
+        await bob.send_json_to({'type': 'code_delta', 'version': 0, 'op': [5, '\n']})
+        await self.receive(bob, 'code_ack')
+        delta = await self.receive(alice, 'code_delta')
+        self.assertEqual((delta['op'], delta['version']), ([5, '\n'], 2))
+        self.assertEqual((await self.store.snapshot('room-1'))['code'], 'x = 2\n')
+
+        # Late joiners get the current text as a snapshot
+        carol = await self.connect('carol')
+        snapshot = await self.receive(carol, 'code_snapshot')
+        self.assertEqual((snapshot['code'], snapshot['version']), ('x = 2\n', 2))
+
+        for communicator in (alice, bob, carol):
+            await communicator.disconnect()
+        self.assertNotIn('room-1', room_states)
+
+    async def test_invalid_delta_is_answered_with_a_snapshot(self):
+        alice = await self.connect('alice')
+        await self.receive(alice, 'code_snapshot')
+        await alice.send_json_to({'type': 'code_delta', 'version': 0, 'op': [99]})
+        snapshot = await self.receive(alice, 'code_snapshot')
+        self.assertEqual((snapshot['code'], snapshot['version']), ('x = 1', 0))
+        await alice.disconnect()
+
+    async def test_full_code_update_is_applied_as_a_delta(self):
+        alice = await self.connect('alice')
+        await self.receive(alice, 'code_snapshot')
+        bob = await self.connect('bob')
+        await self.receive(bob, 'code_snapshot')
+        await alice.send_json_to({'type': 'code_update', 'code': 'x = 10'})
+        delta = await self.receive(bob, 'code_delta')
+        self.assertEqual((delta['op'], delta['version']), ([5, '0'], 1))
+        await alice.disconnect()
+        await bob.disconnect()
+
+
+class CompactProtocolTests(ConsumerTestCase):
+    """Clients negotiating the compact subprotocol get short type codes and participant diffs"""
+
+    async def receive_compact(self, communicator, code):
+        while True:
+            message = json.loads(await communicator.receive_from())
+            if isinstance(message, list) and message[0] == code:
+                return message
+
+    def test_messages_round_trip(self):
+        delta = {'type': 'code_delta', 'version': 3, 'op': [2, 'x'], 'username': 'alice'}
+        self.assertEqual(encode(delta, compact=True), '["d",3,[2,"x"],"alice"]')
+        self.assertEqual(decode(encode(delta, compact=True)), delta)
+        self.assertEqual(json.loads(encode(delta)), delta)
+        # Other messages stay objects, without the whitespace
+        self.assertEqual(encode({'type': 'kicked'}, compact=True), '{"type":"kicked"}')
+        self.assertEqual(decode('["d",0,[1]]'), {'type': 'code_delta', 'version': 0, 'op': [1]})
+        for text in ('["zz"]', '[]', '3', 'not json'):
+            with self.assertRaises(ValueError):
+                decode(text)
+
+    async def test_compact_clients_get_diffs_and_legacy_clients_full_lists(self):
+        alice = await self.connect('alice', subprotocols=[COMPACT_SUBPROTOCOL])
+        update = decode(await alice.receive_from())
+        while update['type'] != 'participants_update':
+            update = decode(await alice.receive_from())
+        self.assertEqual((update['participants'], update['owner']), (['alice'], 'alice'))
+
+        bob = await self.connect('bob')
+        self.assertEqual(await self.receive_compact(alice, 'j'), ['j', 'bob', 'alice'])
+        update = await self.receive(bob, 'participants_update')
+        self.assertEqual(update['participants'], ['alice', 'bob'])
+
+        await alice.send_to(text_data=json.dumps(['d', 0, [4, -1, '2']]))
+        self.assertEqual(await self.receive_compact(alice, 'a'), ['a', 1])
+        delta = await self.receive(bob, 'code_delta')
+        self.assertEqual((delta['op'], delta['version'], delta['username']), ([4, '2', -1], 1, 'alice'))
+
+        carol = await self.connect('carol', subprotocols=[COMPACT_SUBPROTOCOL])
+        await self.receive_compact(alice, 'j')
+        await bob.disconnect()
+        self.assertEqual(await self.receive_compact(carol, 'l'), ['l', 'bob', 'alice'])
+
+        # Legacy clients are sent the whole list, rebuilt from the diffs
+        await alice.disconnect()
+        dave = await self.connect('dave')
+        update = await self.receive(dave, 'participants_update')
+        self.assertEqual((update['participants'], update['owner']), (['carol', 'dave'], 'carol'))
+        for communicator in (carol, dave):
+            await communicator.disconnect()
+
+
+@override_settings(CLASSROOM_CONNECTION_MESSAGE_RATE=20, CLASSROOM_CONNECTION_MESSAGE_BURST=1)
+class RateLimitTests(ConsumerTestCase):
+    """Messages over the rate limits are held back and coalesced"""
+
+    async def connect_pair(self):
+        alice = await self.connect('alice')
+        await self.receive(alice, 'code_snapshot')
+        bob = await self.connect('bob')
+        await self.receive(bob, 'code_snapshot')
+        return alice, bob
+
+    async def test_only_the_latest_held_message_is_sent(self):
+        alice, bob = await self.connect_pair()
+        coalesced = throttle_counts['coalesced']
+        for language in ('python', 'c', 'java'):
+            await alice.send_json_to({'type': 'language_update', 'language': language})
+        self.assertEqual((await self.receive(bob, 'language_update'))['language'], 'python')
+        self.assertEqual((await self.receive(bob, 'language_update'))['language'], 'java')
+        self.assertEqual(throttle_counts['coalesced'], coalesced + 1)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_unknown_types_are_dropped_not_held(self):
+        alice, bob = await self.connect_pair()
+        dropped = throttle_counts['dropped']
+        await alice.send_json_to({'type': 'language_update', 'language': 'c'})
+        for i in range(5):
+            await alice.send_json_to({'type': f'flood_{i}'})
+        await alice.send_json_to({'type': 'language_update', 'language': 'java'})
+        self.assertEqual((await self.receive(bob, 'language_update'))['language'], 'c')
+        self.assertEqual((await self.receive(bob, 'language_update'))['language'], 'java')
+        self.assertEqual(throttle_counts['dropped'], dropped + 5)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_edits_sent_without_waiting_are_composed(self):
+        alice, bob = await self.connect_pair()
+        await alice.send_json_to({'type': 'code_delta', 'version': 0, 'op': [5, '2']})
+        await self.receive(alice, 'code_ack')
+        await alice.send_json_to({'type': 'code_delta', 'version': 1, 'op': [6, '3']})
+        await alice.send_json_to({'type': 'code_delta', 'version': 1, 'op': [7, '4']})
+
+        self.assertEqual(await self.receive(alice, 'code_ack'), {'type': 'code_ack', 'version': 2})
+        await self.receive(bob, 'code_delta')
+        delta = await self.receive(bob, 'code_delta')
+        self.assertEqual((delta['op'], delta['version']), ([6, '34'], 2))
+        self.assertEqual((await self.store.snapshot('room-1'))['code'], 'x = 1234')
+        await alice.disconnect()
+        await bob.disconnect()
+
+
+class MetricsTests(ConsumerTestCase):
+    """Hot paths are measured and exported in the Prometheus text format"""
+
+    def test_histogram_rendering(self):
+        histogram = metrics.Histogram('test_duration_seconds', "Test", ['language'], buckets=(0.1, 1))
+        self.addCleanup(metrics.registry.remove, histogram)
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, language='c')
+        self.assertEqual(histogram.render()[2:], [
+            'test_duration_seconds_bucket{language="c",le="0.1"} 1',
+            'test_duration_seconds_bucket{language="c",le="1"} 2',
+            'test_duration_seconds_bucket{language="c",le="+Inf"} 3',
+            'test_duration_seconds_sum{language="c"} 5.55',
+            'test_duration_seconds_count{language="c"} 3',
+        ])
+        with self.assertRaises(ValueError):
+            histogram.observe(1, lang='c')
+
+    async def test_consumer_activity_is_counted(self):
+        deltas = metrics.MESSAGES.get(type='code_delta')
+        others = metrics.MESSAGES.get(type='other')
+        room_reads = metrics.DB_CALLS.get(operation='read_room')
+
+        alice = await self.connect('alice')
+        await self.receive(alice, 'code_snapshot')
+        self.assertEqual(metrics.CONNECTED_SOCKETS.get(), 1)
+        self.assertEqual(metrics.ACTIVE_ROOMS.get(), 1)
+        await alice.send_json_to({'type': 'code_delta', 'version': 0, 'op': [5, '2']})
+        await self.receive(alice, 'code_ack')
+        await alice.send_json_to({'type': 'made_up'})
+        await self.receive(alice, 'made_up')
+
+        self.assertEqual(metrics.MESSAGES.get(type='code_delta'), deltas + 1)
+        self.assertEqual(metrics.MESSAGES.get(type='other'), others + 1)
+        self.assertEqual(metrics.DB_CALLS.get(operation='read_room'), room_reads + 1)
+        self.assertGreaterEqual(metrics.DB_QUERIES.get(operation='read_room'), 1)
+
+        with self.settings(CLASSROOM_METRICS_TOKEN='secret'):
+            response = await AsyncClient().get('/metrics/', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE classroom_websocket_message_duration_seconds histogram', body)
+        self.assertIn('classroom_connected_sockets 1', body)
+        await alice.disconnect()
+        self.assertEqual(metrics.CONNECTED_SOCKETS.get(), 0)
+
+
+    @override_settings(CLASSROOM_METRICS_TOKEN='secret')
+    async def test_metrics_need_the_token(self):
+        self.assertEqual((await AsyncClient().get('/metrics/')).status_code, 403)
+        response = await AsyncClient().get('/metrics/', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+
+    async def test_metrics_are_refused_without_a_token_configured(self):
+        response = await AsyncClient().get('/metrics/', headers={'Authorization': 'Bearer '})
+        self.assertEqual(response.status_code, 403)
+
+
+class RoomStateCacheTests(ConsumerTestCase):
+    """Mute and ban checks use the cached room state"""
+
+    async def test_room_is_read_once_and_mutes_are_written_back(self):
+        with mock.patch('classroom.room_state.read_room', wraps=read_room) as read:
+            alice = await self.connect('alice')
+            bob = await self.connect('bob')
+        self.assertEqual(read.call_count, 1)
+
+        await alice.send_json_to({'type': 'mute_user', 'target_user': 'bob'})
+        await self.receive(bob, 'user_muted')
+        await bob.send_json_to({'type': 'code_delta', 'version': 0, 'op': ['# hi\n', 5]})
+        snapshot = await self.receive(bob, 'code_snapshot')
+        self.assertEqual(snapshot['code'], 'x = 1')
+        self.assertEqual((await self.store.snapshot('room-1'))['version'], 0)
+
+        await room_states['room-1'].wait_saved()
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertTrue(await RoomMute.objects.filter(session=session, username='bob').aexists())
+
+        await alice.send_json_to({'type': 'unmute_user', 'target_user': 'bob'})
+        await self.receive(bob, 'user_unmuted')
+        await room_states['room-1'].wait_saved()
+        self.assertFalse(await RoomMute.objects.filter(session=session).aexists())
+
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_banned_ip_cannot_reconnect(self):
+        alice = await self.connect('alice')
+        mallory = await self.connect('mallory', ip='10.0.0.9')
+        await alice.send_json_to({'type': 'ban_user', 'target_user': 'mallory'})
+        await self.receive(mallory, 'banned')
+        await mallory.disconnect()
+
+        await self.connect('mallory', ip='10.0.0.9', expect_connected=False)
+        await room_states['room-1'].wait_saved()
+        await alice.disconnect()
+        self.assertNotIn('room-1', room_states)
+
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertEqual([ip async for ip in session.bans.values_list('ip', flat=True)], ['10.0.0.9'])
+
+
+class ModerationModelTests(TestCase):
+    """Bans and mutes are rows with a unique index, not JSON lists"""
+
+    def setUp(self):
+        self.session = CodeSession.objects.create(session_id='room-1')
+
+    def test_mutes_are_idempotent_single_writes(self):
+        with self.assertNumQueries(1):
+            self.session.add_muted_user('bob')
+        self.session.add_muted_user('bob')
+        self.session.add_muted_user('alice')
+        self.assertEqual(self.session.get_muted_users(), ['alice', 'bob'])
+        self.assertTrue(self.session.is_muted('bob'))
+
+        self.session.remove_muted_user('bob')
+        self.assertFalse(self.session.is_muted('bob'))
+
+    def test_bans_are_per_session(self):
+        other = CodeSession.objects.create(session_id='room-2')
+        self.session.add_banned_ip('10.0.0.9')
+        self.session.add_banned_ip('10.0.0.9')
+        self.assertEqual(self.session.get_banned_ips(), ['10.0.0.9'])
+        self.assertTrue(self.session.is_banned('10.0.0.9'))
+        self.assertFalse(other.is_banned('10.0.0.9'))
+
+
+class RedisRoomStoreTests(SimpleTestCase):
+    """Two stores on one Redis behave like two worker processes"""
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.worker_a = RedisRoomStore(self.redis)
+        self.worker_b = RedisRoomStore(self.redis)
+
+    async def test_membership_and_ownership_are_shared(self):
+        await self.worker_a.join('room-1', 'alice', {'ip': '1.1.1.1', 'channel': 'a!1'})
+        participants, owner = await self.worker_b.join('room-1', 'bob', {'ip': '2.2.2.2', 'channel': 'b!1'})
+        self.assertEqual((participants, owner), (['alice', 'bob'], 'alice'))
+        self.assertEqual((await self.worker_a.get_user('room-1', 'bob'))['channel'], 'b!1')
+
+        participants, owner, owner_changed = await self.worker_a.leave('room-1', 'alice')
+        self.assertEqual((participants, owner, owner_changed), (['bob'], 'bob', True))
+        self.assertEqual(await self.worker_a.members('room-1'), (['bob'], 'bob'))
+
+        await self.worker_b.leave('room-1', 'bob')
+        self.assertEqual(await self.worker_a.members('room-1'), ([], None))
+
+    async def test_a_name_stays_until_its_last_connection_leaves(self):
+        await self.worker_a.join('room-1', 'alice', {'ip': '1.1.1.1', 'channel': 'a!1'})
+        await self.worker_b.join('room-1', 'alice', {'ip': '1.1.1.1', 'channel': 'b!1'})
+        self.assertEqual((await self.worker_a.get_user('room-1', 'alice'))['channels'], ['a!1', 'b!1'])
+
+        self.assertEqual(await self.worker_a.leave('room-1', 'alice', 'a!1'), (['alice'], 'alice', False))
+        self.assertEqual(await self.worker_b.leave('room-1', 'alice', 'b!1'), ([], None, False))
+
+    async def test_last_leave_and_join_do_not_interleave(self):
+        redis = InterleavingFakeRedis()
+        worker_a, worker_b = RedisRoomStore(redis), RedisRoomStore(redis)
+        await worker_a.join('room-1', 'alice', {'ip': '1.1.1.1', 'channel': 'a!1'})
+
+        await asyncio.gather(
+            worker_a.leave('room-1', 'alice'),
+            worker_b.join('room-1', 'bob', {'ip': '2.2.2.2', 'channel': 'b!1'}),
+        )
+        self.assertEqual(await worker_a.members('room-1'), (['bob'], 'bob'))
+        await worker_b.leave('room-1', 'bob', 'b!1')
+
+    async def test_connections_of_a_dead_worker_are_dropped(self):
+        await self.worker_a.join('room-1', 'alice', {'ip': '1.1.1.1', 'channel': 'a!1'})
+        await self.worker_b.join('room-1', 'bob', {'ip': '2.2.2.2', 'channel': 'b!1'})
+
+        # Worker a is killed without leaving, its heartbeat runs out
+        self.worker_a._stop_heartbeat()
+        await self.redis.delete(self.worker_a._worker_key(self.worker_a.worker_id))
+
+        self.assertEqual(await self.worker_b.members('room-1'), (['bob'], 'bob'))
+        self.assertEqual(await self.worker_b.leave('room-1', 'bob', 'b!1'), ([], None, False))
+
+    async def test_concurrent_edits_from_both_workers_are_ordered(self):
+        await self.worker_a.open_document('room-1', 'print()')
+        await self.worker_b.open_document('room-1', 'ignored, already open')
+
+        results = await asyncio.gather(
+            self.worker_a.apply_edit('room-1', 0, [6, "'a'", 1]),
+            self.worker_b.apply_edit('room-1', 0, ['# note\n', 7]),
+        )
+        self.assertEqual(sorted(version for _, version in results), [1, 2])
+        snapshot = await self.worker_b.snapshot('room-1')
+        self.assertEqual(snapshot, {'code': "# note\nprint('a')", 'version': 2})
+
+
+class MultiWorkerConsumerTests(ConsumerTestCase):
+    """Participants connected to different workers share one room"""
+
+    def setUp(self):
+        super().setUp()
+        redis = FakeRedis()
+        self.workers = {'alice': RedisRoomStore(redis), 'bob': RedisRoomStore(redis)}
+
+    def get_store(self):
+        # Consumers pick their worker's store when they connect
+        return self.workers[self.connecting]
+
+    async def connect(self, username, **kwargs):
+        self.connecting = username
+        return await super().connect(username, **kwargs)
+
+    async def test_participants_and_edits_cross_workers(self):
+        alice = await self.connect('alice')
+        bob = await self.connect('bob')
+        update = await self.receive(alice, 'participants_update')
+        while update['participants'] != ['alice', 'bob']:
+            update = await self.receive(alice, 'participants_update')
+        self.assertEqual(update['owner'], 'alice')
+
+        await bob.send_json_to({'type': 'code_delta', 'version': 0, 'op': [5, '0']})
+        delta = await self.receive(alice, 'code_delta')
+        self.assertEqual((delta['op'], delta['version']), ([5, '0'], 1))
+
+        await alice.disconnect()
+        update = await self.receive(bob, 'participants_update')
+        while update['participants'] != ['bob']:
+            update = await self.receive(bob, 'participants_update')
+        self.assertEqual(update['owner'], 'bob')
+        await bob.disconnect()
+
+    async def test_busy_room_lock_is_retried_on_leave(self):
+        alice = await self.connect('alice')
+        await self.receive(alice, 'code_snapshot')
+        store = self.workers['alice']
+        leave, attempts = store.leave, []
+
+        async def busy_once(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise OperationError("document of session room-1 is busy")
+            return await leave(*args)
+
+        with mock.patch.object(store, 'leave', busy_once):
+            await alice.disconnect()
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(await store.members('room-1'), ([], None))
+        self.assertIsNone(await store.snapshot('room-1'))
+
+    async def test_busy_room_lock_closes_the_connection(self):
+        with mock.patch.object(RedisRoomStore, 'join', side_effect=OperationError("busy")):
+            alice = await self.connect('alice')
+            self.assertEqual((await alice.receive_output())['type'], 'websocket.close')
+        await alice.disconnect()
+        self.assertNotIn('room-1', room_states)
+
+
+class ParticipantCountWriterTests(TestCase):
+    """Participant counts are coalesced into batched updates"""
+
+    def setUp(self):
+        for session_id in ('room-1', 'room-2', 'room-3'):
+            CodeSession.objects.create(session_id=session_id)
+
+    def test_latest_counts_are_written_in_one_query(self):
+        writer = ParticipantCountWriter(interval=60)
+
+        async def record():
+            for count in range(1, 51):
+                writer.set('room-1', count)
+            writer.set('room-2', 3)
+            writer.set('room-2', 2)
+
+        asyncio.run(record())
+        with self.assertNumQueries(1):
+            writer.flush_now()
+        with self.assertNumQueries(0):
+            writer.flush_now()
+
+        counts = dict(CodeSession.objects.values_list('session_id', 'participant_count'))
+        self.assertEqual(counts, {'room-1': 50, 'room-2': 2, 'room-3': 0})
+
+
+@override_settings(CLASSROOM_LOBBY_PAGE_SIZE=2, CLASSROOM_LOBBY_CACHE_TTL=60)
+class LobbyTests(TestCase):
+    """The lobby lists active rooms a page at a time from the cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for number in range(3):
+            CodeSession.objects.create(session_id=f'room-{number}', room_name=f'Room {number}', code='x' * 1000)
+
+    def test_rooms_are_paginated(self):
+        first = self.client.get('/api/rooms/').json()
+        self.assertEqual(first['count'], 3)
+        self.assertEqual((first['page'], first['num_pages'], first['has_next']), (1, 2, True))
+        self.assertEqual(first['rooms'][0].keys(), {'session_id', 'room_name', 'participant_count', 'language'})
+
+        second = self.client.get('/api/rooms/?page=2').json()
+        self.assertEqual(len(second['rooms']), 1)
+        self.assertTrue(second['has_previous'])
+        self.assertEqual(self.client.get('/api/rooms/?page=nope').json()['page'], 1)
+
+        response = self.client.get('/?page=2')
+        self.assertContains(response, 'Page 2 of 2')
+        self.assertContains(response, '3 active')
+
+    def test_listing_is_cached_until_invalidated(self):
+        self.client.get('/api/rooms/')
+        CodeSession.objects.filter(session_id='room-2').update(participant_count=7)
+        with self.assertNumQueries(0):
+            self.client.get('/')
+            rooms = self.client.get('/api/rooms/').json()['rooms']
+        self.assertNotIn(7, [room['participant_count'] for room in rooms])
+
+        asyncio.run(invalidate_lobby())
+        rooms = self.client.get('/api/rooms/').json()['rooms']
+        self.assertIn(7, [room['participant_count'] for room in rooms])
+
+
+class ParticipantCountFlushTests(TransactionTestCase):
+    """Pending counts are written once the flush interval passes"""
+
+    async def test_counts_are_flushed_after_the_interval(self):
+        await CodeSession.objects.acreate(session_id='room-1')
+        writer = ParticipantCountWriter(interval=0.01)
+        writer.set('room-1', 4)
+        await asyncio.sleep(0.2)
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertEqual(session.participant_count, 4)
+
+
+class CodePersistenceTests(ConsumerTestCase):
+    """Room code is saved on a debounce timer and when the room empties"""
+
+    async def test_code_is_saved_after_edits_settle(self):
+        alice = await self.connect('alice')
+        await self.receive(alice, 'code_snapshot')
+        for version, digit in enumerate('234'):
+            await alice.send_json_to({'type': 'code_delta', 'version': version, 'op': [4, -1, digit]})
+            await self.receive(alice, 'code_ack')
+
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertEqual(session.code, 'x = 1')
+        await asyncio.sleep(0.2)
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertEqual(session.code, 'x = 4')
+        self.assertEqual(await CodeSnapshot.objects.filter(session=session).acount(), 1)
+
+        # Served from memory before the next save
+        await alice.send_json_to({'type': 'code_delta', 'version': 3, 'op': [5, '0']})
+        await self.receive(alice, 'code_ack')
+        response = await AsyncClient().get('/api/session/room-1/')
+        self.assertEqual(response.json()['code'], 'x = 40')
+
+        await alice.disconnect()
+        session = await CodeSession.objects.aget(session_id='room-1')
+        self.assertEqual(session.code, 'x = 40')
+        snapshots = [s async for s in CodeSnapshot.objects.filter(session=session).values_list('code', flat=True)]
+        self.assertEqual(snapshots, ['x = 40', 'x = 4'])
+        self.assertIsNone(await self.store.snapshot('room-1'))
+
+    async def test_reconnect_during_final_save_gets_latest_code(self):
+        alice = await self.connect('alice')
+        await self.receive(alice, 'code_snapshot')
+        await alice.send_json_to({'type': 'code_delta', 'version': 0, 'op': [4, -1, '2']})
+        await self.receive(alice, 'code_ack')
+
+        saving, release = asyncio.Event(), asyncio.Event()
+        save_final = self.persister.save_final
+
+        async def slow_save_final(session_id, snapshot):
+            saving.set()
+            await release.wait()
+            await save_final(session_id, snapshot)
+
+        with mock.patch.object(self.persister, 'save_final', slow_save_final):
+            leaving = asyncio.ensure_future(alice.disconnect())
+            await saving.wait()
+            bob = await self.connect('bob')
+            self.assertEqual((await self.receive(bob, 'code_snapshot'))['code'], 'x = 2')
+            release.set()
+            await leaving
+        await bob.disconnect()
+
+    def test_pending_saves_are_flushed_at_exit(self):
+        store = MemoryRoomStore()
+        persister = CodePersister(delay=60, max_delay=60, snapshot_interval=60, history=5)
+
+        async def edit():
+            await store.open_document('room-1', 'x = 1')
+            await store.replace_text('room-1', 'x = 2')
+            persister.schedule('room-1', store)
+
+        asyncio.run(edit())
+        persister.flush_now()
+        self.assertEqual(CodeSession.objects.get(session_id='room-1').code, 'x = 2')
+        with self.assertNumQueries(0):
+            persister.flush_now()
+
+    async def test_snapshot_history_is_bounded(self):
+        for version in range(5):
+            await write_code('room-1', f'x = {version}', version, True, history=3)
+        versions = [v async for v in CodeSnapshot.objects.values_list('version', flat=True)]
+        self.assertEqual(versions, [4, 3, 2])
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    """The benchmark reports latency figures and cleans up its rooms"""
+
+    def test_benchmark_writes_results(self):
+        output = os.path.join(tempfile.mkdtemp(), 'results.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        call_command(
+            'benchmark_classroom', rooms=2, clients=3, edits=2, runs=4, concurrency=2,
+            output=output, stdout=io.StringIO(),
+        )
+
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(results['execution']['completed'], 4)
+        self.assertEqual(results['execution']['latency_ms']['count'], 4)
+        self.assertEqual(results['websocket']['edits'], 12)
+        self.assertEqual(results['websocket']['fanout_latency_ms']['count'], 12)
+        self.assertGreater(results['websocket']['messages_per_second'], 0)
+        self.assertFalse(CodeSession.objects.exists())
+
+
+class ReapRoomsCommandTests(TestCase):
+    """Idle rooms are deleted in batches and old output is cleared"""
+
+    def make_room(self, session_id, idle, **fields):
+        CodeSession.objects.create(session_id=session_id, **fields)
+        CodeSession.objects.filter(session_id=session_id).update(updated_at=timezone.now() - idle)
+
+    def setUp(self):
+        self.make_room('abandoned', timedelta(days=31), code='x = 1', output='1')
+        self.make_room('empty', timedelta(hours=3))
+        self.make_room('empty-occupied', timedelta(hours=3), participant_count=2)
+        self.make_room('idle', timedelta(days=2), code='x = 1', output='1')
+        self.make_room('active', timedelta(minutes=5), code='x = 1', output='1')
+        CodeSnapshot.objects.create(session=CodeSession.objects.get(session_id='abandoned'), code='x = 1')
+
+    def test_dry_run_changes_nothing(self):
+        stdout = io.StringIO()
+        call_command('reap_rooms', dry_run=True, stdout=stdout)
+        self.assertIn('Would delete 2 stale rooms and clear the output of 2 idle rooms', stdout.getvalue())
+        self.assertEqual(CodeSession.objects.count(), 5)
+
+    def test_reaps_stale_rooms_and_compacts_output(self):
+        idle_updated_at = CodeSession.objects.get(session_id='idle').updated_at
+        call_command('reap_rooms', batch_size=1, stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(CodeSession.objects.values_list('session_id', flat=True)), ['active', 'empty-occupied', 'idle']
+        )
+        self.assertFalse(CodeSnapshot.objects.exists())
+        idle = CodeSession.objects.get(session_id='idle')
+        self.assertEqual((idle.code, idle.output), ('x = 1', ''))
+        self.assertEqual(idle.updated_at, idle_updated_at)
+        self.assertEqual(CodeSession.objects.get(session_id='active').output, '1')
@@ -7,6 +7,9 @@ urlpatterns = [
     path('join-room/<str:session_id>/', views.join_room, name='join_room'),
     path('classroom/<str:session_id>/', views.classroom, name='classroom'),
     path('api/execute/', views.execute_code, name='execute_code'),
+    path('api/run-tests/', views.run_tests, name='run_tests'),
     path('api/save/', views.save_code, name='save_code'),
     path('api/session/<str:session_id>/', views.get_session_data, name='get_session_data'),
+    path('api/rooms/', views.lobby_rooms, name='lobby_rooms'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
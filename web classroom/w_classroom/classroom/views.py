@@ -1,9 +1,15 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from asgiref.sync import sync_to_async
 from .models import CodeSession
-from .executor import CodeExecutor
+from .jobs import ExecutionRejected, get_dispatcher
+from .lobby import get_lobby_page
+from .metrics import render as render_metrics
+from .room_store import get_room_store
+import hmac
 import json
 import uuid
 import logging
@@ -11,22 +17,25 @@ import logging
 # Get logger
 logger = logging.getLogger('classroom')
 
+# Rooms a browser session is remembered to have created, the oldest are forgotten first
+MAX_CREATED_ROOMS = 50
+
 
 def index(request):
     """Lobby page with list of rooms"""
-    # Get active sessions (updated in last 2 hours)
-    from django.utils import timezone
-    from datetime import timedelta
-    cutoff_time = timezone.now() - timedelta(hours=2)
-    
-    sessions = CodeSession.objects.filter(updated_at__gte=cutoff_time)
-    logger.info(f"Lobby accessed - Active rooms: {sessions.count()}")
+    page = get_lobby_page(request.GET.get('page'))
+    logger.info(f"Lobby accessed - Active rooms: {page['count']}")
     
     return render(request, 'classroom/lobby.html', {
-        'sessions': sessions
+        'page': page
     })
 
 
+def lobby_rooms(request):
+    """Active rooms of one lobby page as JSON, polled by the lobby"""
+    return JsonResponse(get_lobby_page(request.GET.get('page')))
+
+
 def create_room(request):
     """Create a new room"""
     if request.method == 'POST':
@@ -47,6 +56,8 @@ def create_room(request):
             participant_count=1
         )
         
+        remember_created_room(request, session_id)
+        
         logger.info(f"Room created - Name: '{room_name}', Creator: {username}, Session: {session_id}")
         return redirect('classroom', session_id=session_id)
     
@@ -75,6 +86,7 @@ def classroom(request, session_id):
     )
     
     if created:
+        remember_created_room(request, session_id)
         logger.info(f"New session auto-created: {session_id} by {username}")
     else:
         logger.info(f"User {username} accessed existing session {session_id}")
@@ -88,35 +100,58 @@ def classroom(request, session_id):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def execute_code(request):
-    """Execute code and return output"""
+async def execute_code(request):
+    """Queue code for execution, the result is pushed over the room WebSocket"""
+    session_id = None
     try:
         data = json.loads(request.body)
         session_id = data.get('session_id')
         code = data.get('code', '')
         language = data.get('language', 'python')
+        stdin = data.get('stdin', '')
         
         logger.info(f"Code execution requested - Session: {session_id}, Language: {language}, Code length: {len(code)}")
         
-        # Update session
-        session = get_object_or_404(CodeSession, session_id=session_id)
-        session.code = code
-        session.language = language
+        if not await CodeSession.objects.filter(session_id=session_id).aexists():
+            raise Http404("No CodeSession matches the given query.")
         
-        # Execute code
-        executor = CodeExecutor()
-        output = executor.execute(code, language)
+        error = check_stdin(stdin)
+        if error:
+            return JsonResponse({'success': False, 'output': f'Error: {error}'}, status=400)
         
-        # Save output
-        session.output = output
-        session.save()
+        username = await sync_to_async(request.session.get)('username', 'Anonymous')
+        # Outputs of programs marked deterministic are cached per room, the
+        # creator's are also served to everyone in the room running the same
+        # code. Usernames are self-chosen, so the creator is recognised by the
+        # browser session that created the room.
+        deterministic = bool(data.get('deterministic'))
+        example = deterministic and session_id in await sync_to_async(request.session.get)('created_rooms', [])
+        try:
+            job = get_dispatcher().submit(session_id, code, language, username, deterministic, example, stdin)
+        except ExecutionRejected as e:
+            return JsonResponse({
+                'success': False,
+                'output': f'Error: {str(e)}'
+            }, status=429)
         
-        logger.info(f"Code execution completed - Session: {session_id}")
+        # API clients without a WebSocket can ask to wait for the result
+        if data.get('wait'):
+            await job.done.wait()
+            logger.info(f"Code execution completed - Session: {session_id}")
+            return JsonResponse({
+                'success': True,
+                'job_id': job.job_id,
+                'output': job.output,
+                'limit': job.limit_hit
+            })
         
         return JsonResponse({
             'success': True,
-            'output': output
-        })
+            'queued': True,
+            'job_id': job.job_id
+        }, status=202)
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Code execution failed - Session: {session_id}, Error: {e}", exc_info=True)
         return JsonResponse({
@@ -125,6 +160,80 @@ def execute_code(request):
         })
 
 
+def remember_created_room(request, session_id):
+    """Record in the browser session that it created the room"""
+    rooms = [room for room in request.session.get('created_rooms', []) if room != session_id]
+    request.session['created_rooms'] = (rooms + [session_id])[-MAX_CREATED_ROOMS:]
+
+
+def check_stdin(stdin):
+    """Return why stdin cannot be used as program input, or None"""
+    if not isinstance(stdin, str):
+        return "stdin must be a string."
+    limit = getattr(settings, 'CLASSROOM_MAX_STDIN_BYTES', 64 * 1024)
+    if len(stdin.encode('utf-8')) > limit:
+        return f"stdin is limited to {limit} bytes."
+    return None
+
+
+def check_cases(cases):
+    """Return why a list of test cases cannot be run, or None"""
+    max_cases = getattr(settings, 'CLASSROOM_BATCH_MAX_CASES', 50)
+    if not isinstance(cases, list) or not cases:
+        return "cases must be a non-empty list."
+    if len(cases) > max_cases:
+        return f"At most {max_cases} test cases can be run at once."
+    for number, case in enumerate(cases, 1):
+        if not isinstance(case, dict):
+            return f"Test case {number} must be an object."
+        error = check_stdin(case.get('stdin', ''))
+        if error:
+            return f"Test case {number}: {error}"
+        if not isinstance(case.get('expected', ''), (str, type(None))):
+            return f"Test case {number}: expected must be a string."
+    return None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def run_tests(request):
+    """Build code once and run it against many stdin test cases, for grading"""
+    session_id = None
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id')
+        code = data.get('code', '')
+        language = data.get('language', 'python')
+        cases = data.get('cases')
+        timeout = data.get('timeout')
+        
+        if not await CodeSession.objects.filter(session_id=session_id).aexists():
+            raise Http404("No CodeSession matches the given query.")
+        
+        error = check_cases(cases)
+        if error is None and timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            error = "timeout must be a positive number of seconds."
+        if error:
+            return JsonResponse({'success': False, 'error': error}, status=400)
+        
+        cases = [{'stdin': case.get('stdin', ''), 'expected': case.get('expected')} for case in cases]
+        logger.info(f"Test run requested - Session: {session_id}, Language: {language}, Cases: {len(cases)}")
+        try:
+            result = await get_dispatcher().run_tests(session_id, code, language, cases, timeout)
+        except ExecutionRejected as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=429)
+        
+        return JsonResponse({'success': True, **result})
+    except Http404:
+        raise
+    except Exception as e:
+        logger.error(f"Test run failed - Session: {session_id}, Error: {e}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def save_code(request):
@@ -148,13 +257,18 @@ def save_code(request):
         })
 
 
-def get_session_data(request, session_id):
-    """Get current session data"""
+async def get_session_data(request, session_id):
+    """Get current session data, the code of an open room comes from memory"""
     try:
-        session = get_object_or_404(CodeSession, session_id=session_id)
+        try:
+            session = await CodeSession.objects.only('code', 'output', 'language').aget(session_id=session_id)
+        except CodeSession.DoesNotExist:
+            raise Http404("No CodeSession matches the given query.")
+        
+        snapshot = await get_room_store().snapshot(session_id)
         return JsonResponse({
             'success': True,
-            'code': session.code,
+            'code': snapshot['code'] if snapshot is not None else session.code,
             'output': session.output,
             'language': session.language
         })
@@ -163,3 +277,19 @@ def get_session_data(request, session_id):
             'success': False,
             'error': str(e)
         })
+
+
+def metrics(request):
+    """Metrics of this process in the Prometheus text format, for staff or CLASSROOM_METRICS_TOKEN"""
+    if not can_read_metrics(request):
+        logger.warning(f"Metrics refused to {request.META.get('REMOTE_ADDR')}")
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def can_read_metrics(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, 'CLASSROOM_METRICS_TOKEN', None)
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
@@ -0,0 +1,381 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from .sandbox import SandboxProfile
+
+# Get logger
+logger = logging.getLogger('classroom.execution')
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python_worker.py')
+NODE_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'node_worker.js')
+# Run with the single-file source launcher, so no separate build step is needed
+JAVA_WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'JavaWorker.java')
+
+
+class WorkerError(Exception):
+    """Raised when a pooled worker dies or stops answering
+
+    `stdout` and `stderr` hold the output the job produced before that.
+    """
+
+    stdout = ''
+    stderr = ''
+
+
+class WorkerTimeout(WorkerError):
+    """Raised when a worker does not finish a job within its deadline"""
+
+
+class WorkerExited(WorkerError):
+    """Raised when a worker process exits while running a job"""
+
+
+class WorkerUnavailable(WorkerError):
+    """Raised when no worker becomes idle in time, e.g. because respawns keep failing"""
+
+
+class WorkerRejected(WorkerError):
+    """Raised when a worker does not accept a job, the program never started"""
+
+
+class RuntimeWorker:
+    """A pre-started runtime process that runs jobs sent over a pipe
+
+    Jobs are written as one JSON line on stdin. The worker answers with one
+    JSON line per chunk of program output, followed by a line with `done`
+    set and the exit status. A `restart` flag in that line asks the pool to
+    replace the worker, e.g. because threads of the program are still running.
+    """
+
+    name = None
+    # Extra time the worker gets to report back after the job timeout
+    GRACE_PERIOD = 5  # seconds
+    # Whether the process exiting during a job is how the program ended (System.exit)
+    EXIT_ENDS_RUN = False
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            self.launch_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+            **self.popen_options()
+        )
+        self.runs = 0
+        self._buffer = bytearray()
+        logger.debug(f"Started {self.name} worker (pid: {self.process.pid})")
+
+    def command(self):
+        raise NotImplementedError
+
+    def launch_command(self):
+        return self.command()
+
+    def popen_options(self):
+        return {}
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def run(self, code, timeout, max_output, on_output=None, **job):
+        """Send a job to the worker and collect its streamed output"""
+        payload = json.dumps({
+            'code': code,
+            'timeout': timeout,
+            'max_output': max_output,
+            **job,
+        }) + '\n'
+        try:
+            self.process.stdin.write(payload.encode('utf-8'))
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerRejected(f"worker {self.pid} is not accepting jobs: {e}")
+
+        deadline = time.monotonic() + timeout + self.GRACE_PERIOD
+        output = {'stdout': [], 'stderr': []}
+        while True:
+            try:
+                message = json.loads(self._read_line(deadline))
+            except WorkerError as e:
+                if not (self.EXIT_ENDS_RUN and isinstance(e, WorkerExited)):
+                    e.stdout = ''.join(output['stdout'])
+                    e.stderr = ''.join(output['stderr'])
+                    raise
+                message = {
+                    'done': True,
+                    'returncode': self.process.wait(),
+                    'timed_out': False,
+                    'truncated': False,
+                    'restart': True,
+                }
+            if message.get('done'):
+                break
+            output[message['stream']].append(message['data'])
+            if on_output is not None:
+                on_output(message['stream'], message['data'])
+
+        self.runs += 1
+        message['stdout'] = ''.join(output['stdout'])
+        message['stderr'] = ''.join(output['stderr'])
+        return message
+
+    def _read_line(self, deadline):
+        fd = self.process.stdout.fileno()
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise WorkerTimeout(f"worker {self.pid} did not answer in time")
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise WorkerExited(f"worker {self.pid} exited unexpectedly")
+            self._buffer.extend(chunk)
+
+        line, _, rest = self._buffer.partition(b'\n')
+        self._buffer = bytearray(rest)
+        return line
+
+    def stop(self):
+        """Terminate the worker process"""
+        if self.is_alive():
+            self.process.kill()
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            pass
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+class PythonWorker(RuntimeWorker):
+    """A pre-started Python interpreter, every job runs in a forked child"""
+
+    name = 'Python'
+
+    def command(self):
+        return [sys.executable, '-I', WORKER_SCRIPT]
+
+
+class HostWorker(RuntimeWorker):
+    """A runtime host that runs every job inside its own process
+
+    The host runs in a private temporary directory under the sandbox limits
+    of SandboxProfile.for_runtime_host(), its heap is capped with runtime
+    flags. Programs and anything they start are killed with the host.
+    """
+
+    def __init__(self):
+        self.sandbox = SandboxProfile.from_settings().for_runtime_host()
+        self.workdir = tempfile.mkdtemp(prefix=f'{self.name.lower()}-worker-')
+        super().__init__()
+
+    def launch_command(self):
+        return self.sandbox.wrap(self.command())
+
+    def popen_options(self):
+        return {
+            'cwd': self.workdir,
+            'env': self.sandbox.environment(self.workdir),
+            'start_new_session': True,
+        }
+
+    def stop(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        super().stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class NodeWorker(HostWorker):
+    """A Node.js process that runs every job in a fresh vm context"""
+
+    name = 'Node.js'
+
+    def command(self):
+        command = ['node']
+        memory_mb = SandboxProfile.from_settings().memory_mb
+        if memory_mb:
+            command.append(f'--max-old-space-size={memory_mb}')
+        return command + [NODE_WORKER_SCRIPT]
+
+
+class JavaWorker(HostWorker):
+    """A JVM that compiles every job in-process and loads it in a fresh class loader"""
+
+    name = 'Java'
+    # Compilation happens inside the job, on a cold JVM it takes a while
+    GRACE_PERIOD = 15  # seconds
+    EXIT_ENDS_RUN = True
+
+    def command(self):
+        command = ['java', '-XX:+UseSerialGC']
+        memory_mb = SandboxProfile.from_settings().memory_mb
+        if memory_mb:
+            command.append(f'-Xmx{memory_mb}m')
+        return command + [JAVA_WORKER_SOURCE]
+
+
+class WorkerPool:
+    """Fixed-size pool of warm workers, recycled after N runs or a crash"""
+
+    RESPAWN_ATTEMPTS = 3
+    ACQUIRE_TIMEOUT = 10  # seconds a run waits for an idle worker before giving up
+
+    def __init__(self, size, max_runs, worker_class):
+        self.size = size
+        self.max_runs = max_runs
+        self.worker_class = worker_class
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        # Slots whose worker could not be restarted, refilled by later runs
+        self._missing = 0
+
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+        logger.info(f"{worker_class.name} worker pool started with {size} workers (max runs per worker: {max_runs})")
+
+    def _spawn(self):
+        worker = self.worker_class()
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _replace(self, attempts):
+        """Start a worker for a free slot, or remember the slot when that fails"""
+        for attempt in range(1, attempts + 1):
+            try:
+                self._idle.put(self._spawn())
+                return
+            except Exception as e:
+                logger.warning(f"Could not start a {self.worker_class.name} worker (attempt {attempt}/{attempts}): {e}")
+        with self._lock:
+            self._missing += 1
+
+    def _refill(self):
+        """Try once more to start workers for slots lost to failed respawns"""
+        with self._lock:
+            missing, self._missing = self._missing, 0
+        for _ in range(missing):
+            self._replace(1)
+
+    def _retire(self, worker, reason):
+        logger.debug(f"Recycling {worker.name} worker {worker.pid}: {reason}")
+        worker.stop()
+        with self._lock:
+            self._workers.discard(worker)
+        if not self._closed:
+            self._replace(self.RESPAWN_ATTEMPTS)
+
+    def _acquire(self):
+        if self._missing:
+            self._refill()
+        try:
+            return self._idle.get(timeout=self.ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise WorkerUnavailable(
+                f"no {self.worker_class.name} worker became idle within {self.ACQUIRE_TIMEOUT}s"
+            ) from None
+
+    def run(self, code, timeout, max_output=256 * 1024, on_output=None, **job):
+        """Run code on an idle worker, raises WorkerUnavailable when none frees up in time"""
+        worker = self._acquire()
+        if not worker.is_alive():
+            self._retire(worker, 'found dead while idle')
+            worker = self._acquire()
+
+        try:
+            result = worker.run(code, timeout, max_output, on_output, **job)
+        except Exception:
+            # The worker may be mid-job, never hand it out again
+            self._retire(worker, 'crashed or hung')
+            raise
+
+        if result.get('restart'):
+            self._retire(worker, 'asked to be restarted')
+        elif worker.runs >= self.max_runs:
+            self._retire(worker, f'reached {worker.runs} runs')
+        else:
+            self._idle.put(worker)
+        return result
+
+    def close(self):
+        """Stop every worker owned by the pool"""
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+class PythonWorkerPool(WorkerPool):
+    """Pool of warm Python workers"""
+
+    def __init__(self, size, max_runs):
+        super().__init__(size, max_runs, PythonWorker)
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool(key, worker_class, size, max_runs):
+    if key not in _pools:
+        with _pool_lock:
+            if key not in _pools:
+                pool = WorkerPool(size, max_runs, worker_class)
+                atexit.register(pool.close)
+                _pools[key] = pool
+    return _pools[key]
+
+
+def get_python_pool():
+    """Return the shared worker pool, or None when pooling is unavailable"""
+    size = getattr(settings, 'CLASSROOM_PYTHON_WORKERS', 4)
+    if size <= 0 or not hasattr(os, 'fork'):
+        return None
+    return _get_pool('python', PythonWorker, size, getattr(settings, 'CLASSROOM_PYTHON_WORKER_MAX_RUNS', 50))
+
+
+def get_node_pool():
+    """Return the shared Node.js host pool, or None when it is disabled or unavailable"""
+    size = getattr(settings, 'CLASSROOM_NODE_WORKERS', 0)
+    if size <= 0 or os.name != 'posix' or shutil.which('node') is None:
+        return None
+    return _get_pool('node', NodeWorker, size, getattr(settings, 'CLASSROOM_NODE_WORKER_MAX_RUNS', 200))
+
+
+def get_java_pool():
+    """Return the shared JVM host pool, or None when it is disabled or unavailable"""
+    size = getattr(settings, 'CLASSROOM_JAVA_WORKERS', 0)
+    # javac is only installed with a JDK, which the in-process compiler needs
+    if size <= 0 or os.name != 'posix' or shutil.which('java') is None or shutil.which('javac') is None:
+        return None
+    return _get_pool('java', JavaWorker, size, getattr(settings, 'CLASSROOM_JAVA_WORKER_MAX_RUNS', 200))
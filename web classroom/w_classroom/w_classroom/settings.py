@@ -3,6 +3,8 @@ Django settings for web_classroom project.
 """
 
 from pathlib import Path
+import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -66,11 +68,127 @@ WSGI_APPLICATION = 'w_classroom.wsgi.application'
 ASGI_APPLICATION = 'w_classroom.asgi.application'
 
 # Channels
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Set CLASSROOM_REDIS_URL (e.g. redis://localhost:6379/0) to run several ASGI
+# workers: the channel layer and the room registry are then shared through Redis
+CLASSROOM_REDIS_URL = os.environ.get('CLASSROOM_REDIS_URL')
+
+if CLASSROOM_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CLASSROOM_REDIS_URL],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
+    }
+
+# Cache, shared by all workers when Redis is configured so lobby
+# invalidations reach every process. Results of deterministic runs are kept
+# in a separate, size-bounded cache
+if CLASSROOM_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CLASSROOM_REDIS_URL,
+        },
+        'results': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CLASSROOM_REDIS_URL,
+            'KEY_PREFIX': 'results',
+        },
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'results': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'results',
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        },
+    }
+
+# Seconds participant count changes are collected before one batched database write
+CLASSROOM_PARTICIPANT_COUNT_FLUSH_INTERVAL = 0.25
+
+# Room code is saved this many seconds after the last edit, at most this long after the first
+CLASSROOM_CODE_SAVE_DELAY = 2
+CLASSROOM_CODE_SAVE_MAX_DELAY = 10
+# Seconds between saved snapshots of a room's code, and how many are kept per room
+CLASSROOM_SNAPSHOT_INTERVAL = 60
+CLASSROOM_SNAPSHOT_HISTORY = 20
+# Seconds a lobby page is cached, joins, leaves and closed rooms invalidate it earlier
+CLASSROOM_LOBBY_CACHE_TTL = 5
+# Rooms per lobby page
+CLASSROOM_LOBBY_PAGE_SIZE = 20
+# The reap_rooms command deletes rooms idle for this many days, empty rooms
+# nobody is in after this many hours, and clears the run output of rooms
+# idle for this many hours
+CLASSROOM_ROOM_IDLE_DAYS = 30
+CLASSROOM_EMPTY_ROOM_IDLE_HOURS = 2
+CLASSROOM_OUTPUT_RETENTION_HOURS = 24
+# Room messages per second a single connection may send, and its burst allowance.
+# Messages over the limit are held back, only the latest of each type is kept
+CLASSROOM_CONNECTION_MESSAGE_RATE = 20
+CLASSROOM_CONNECTION_MESSAGE_BURST = 40
+# Same limit for all connections of a room together
+CLASSROOM_ROOM_MESSAGE_RATE = 100
+CLASSROOM_ROOM_MESSAGE_BURST = 200
+
+# Code execution
+# Number of warm Python worker processes (0 disables the pool)
+CLASSROOM_PYTHON_WORKERS = 4
+# Runs a worker serves before it is replaced by a fresh one
+CLASSROOM_PYTHON_WORKER_MAX_RUNS = 50
+# Warm Node.js and JVM hosts (0 disables them). A host runs many programs in
+# one process, isolated only by vm contexts and class loaders
+CLASSROOM_NODE_WORKERS = 0
+CLASSROOM_NODE_WORKER_MAX_RUNS = 200
+CLASSROOM_JAVA_WORKERS = 0
+CLASSROOM_JAVA_WORKER_MAX_RUNS = 200
+# Runs executing at the same time across all rooms
+CLASSROOM_EXECUTION_WORKERS = 8
+# Runs queued or executing across all rooms before new ones are rejected
+CLASSROOM_EXECUTION_QUEUE_LIMIT = 100
+# Runs executing at the same time in a single room
+CLASSROOM_ROOM_CONCURRENT_RUNS = 1
+# Runs queued or executing in a single room before new ones are rejected
+CLASSROOM_ROOM_QUEUE_LIMIT = 5
+# Largest program input accepted by the execution API, and the most test
+# cases a single api/run-tests/ request may run
+CLASSROOM_MAX_STDIN_BYTES = 64 * 1024
+CLASSROOM_BATCH_MAX_CASES = 50
+# Seconds the output of a run marked deterministic is reused for identical
+# code (0 disables the result cache), and the largest output that is cached
+CLASSROOM_RESULT_CACHE_TTL = 600
+CLASSROOM_RESULT_CACHE_MAX_BYTES = 64 * 1024
+# Bearer token Prometheus sends to scrape /metrics/ (Authorization: Bearer <token>).
+# Without it only logged-in staff users can read the metrics.
+CLASSROOM_METRICS_TOKEN = os.environ.get('CLASSROOM_METRICS_TOKEN')
+# Resource limits applied to every executed program (Linux/macOS only).
+# 'processes' (RLIMIT_NPROC) counts every process and thread of the user
+# running the server, so it is off by default; only set it when the server
+# runs under a dedicated user.
+CLASSROOM_SANDBOX = {
+    'cpu_seconds': 10,
+    'memory_mb': 512,
+    'processes': None,
+    'open_files': 64,
+    'file_size_mb': 16,
 }
+# Compiled C, C++ and Java programs are reused while their source is unchanged.
+# The directory is created with mode 0700; caching is disabled if it already
+# exists and belongs to another user or is open to others.
+CLASSROOM_COMPILE_CACHE_DIR = Path(tempfile.gettempdir()) / 'w_classroom_compile_cache'
+# Size limit of the compile cache, least recently used builds are evicted first (0 disables)
+CLASSROOM_COMPILE_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
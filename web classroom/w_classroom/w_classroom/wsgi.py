@@ -1,11 +1,15 @@
 """
 WSGI config for web_classroom project.
-"""
-
-import os
 
-from django.core.wsgi import get_wsgi_application
+The classroom cannot run under WSGI: runs are queued on the event loop of
+the server and their results pushed over WebSockets, both of which need an
+ASGI server. Loading this module, as WSGI servers and Django's own
+runserver do, fails with an explanation instead.
+"""
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'w_classroom.settings')
+from django.core.exceptions import ImproperlyConfigured
 
-application = get_wsgi_application()
+raise ImproperlyConfigured(
+    "The classroom must be served by an ASGI server, e.g. "
+    "`daphne w_classroom.asgi:application`, or by `manage.py runserver` with 'daphne' in INSTALLED_APPS."
+)